@@ -15,8 +15,8 @@ This code contains 4 sections
         The Code cleans the data with the Quality Control and uniformize data like the timestamps to
         easily plot comparison graphs between the lidar and the met mast data.
         
-        The code saves all dataFrame in a pickle file that can be extracted easily from python in order
-        to plot graphs.
+        The code saves all cleaned dataFrame in a cache (Parquet files in savedFiles/cache/) that is
+        read directly at the next runs, as long as the files and the Quality Control codes do not change.
         
     2. The second section is a function to plot different data from the lidar in comparison with 
         the double anemometry that was performed with the Quality Control (the name of the result
@@ -26,11 +26,18 @@ This code contains 4 sections
     3. The third section presents how we got the temperature, pressure and humidity data
         since we had problems on our hand with some data from the lidar (Windcube V2) 
         
-        It also presents an easy correlation comparison
+        It also presents an easy correlation comparison: rules of icing conditions (see ICING_RULES in task32.icing)
+        are tested on the met mast data and scored against the ice detected by the double anemometry
         
-    4. The fourth section use the 3 previous sections to demonstrate how to use these functions
+    4. The fourth section compares the lidar wind speed with the wind speed of the cup anemometers of the met mast:
+        regression and errors of the lidar, for all the data, by icing state and by bin of temperature and humidity
+        
+    5. The fifth section use the previous sections to demonstrate how to use these functions
         You can manually change the informations to test other combinations
     
+The data are only loaded and the demonstration only runs when the script is run (not when it is imported).
+The correlation and the comparison can also be run from the command line: python -m task32 correlation --help
+
 Example to run the code : 
     on spyder or other related IDEs -> Run the script
     on anaconda or other related prompts -> Make sure the file is in the right directory and run this command : python ScriptTask32_CorrelationLidarMetMast_Nergica.py
@@ -50,12 +57,22 @@ There is an entry of each captor on the met mast that we want
 """
 
 #Importation of python libraries used in this script
-import datetime
 import glob
-import pandas as pd
+import re
 import matplotlib.pyplot as plt
 import numpy as np
-import pickle
+
+from task32.comparison import comparison_statistics, wind_speed_pairs
+from task32.derived import add_derived_channels
+from task32.icing import (ICE_COLUMN, ICING_RULES, captor_conditions, condition_timestamps, ice_steps,
+                          measurement_heights, rule_mask, score_rules)
+from task32.ingest import load_cleaned_cq
+from task32.instrument import count_rows, new_report, print_report, stage, start_profile, stop_profile, write_report
+from task32.lidar import lidar_file_path, load_cleaned_lidar_files
+from task32.plotting import (ICE_LIDAR_VARIABLES, draw_ice_lidar, ice_dates_by_month, monthly_series,
+                             render_ice_lidar_figures, variable_column)
+from task32.qc import QC_CODES
+from task32.sweep import SWEEP_GRID, rule_grid, sweep_icing_rules
 
 ###################################################
 ###### PARAMETERS TO CHANGE MANUALLY - Lidar ######
@@ -72,121 +89,91 @@ str_pathDirectory_lidar = "./lidarData/"
 ###################################################
 # Data that we want to discard after the Quality Control
 # Each code refers to a specific condition (ex.:R101 -> No Data, R104 -> instruments under maintenance)
-list_dropColumn_CQ = ["R101","R103","R104","R105","R201","R202","R203","R204","R205","R206"]#,"R301","R303","R401","R403"]
+list_dropColumn_CQ = QC_CODES
 #Path Directory where CQ files are saved
 str_pathDirectory_CQ = "./metMastData/"
 # Height Filter in the CQ file name / In that case, height of 80m is chosen
 str_filesFilter="*mmv1*Ht80m*"
 
 ###################################################
-########### INITIALIzATION of VARIABLES ###########
+###### PARAMETERS TO CHANGE MANUALLY - Report #####
 ###################################################
-# Dictionary initialisation for raw CQ data and cleaned CQ data
-dict_data_CQ={}
-dict_data_CQ_cleaned={}
-# Dictionary initialisation for raw lidar data and cleaned lidar data
-dict_data_lidar={}
-dict_data_lidar_cleaned={}
-
-
-####################################################
-########### Importation of lidar data ##############
-####################################################
-# Loop importing Lidar data for desired heights
-# Save data in dict_data_lidar
-# Name each dataFrame inside a dict : data_[annee]_[hauteur]m
-for iter_height in list_heights:
-    with open(str_pathDirectory_lidar+iter_height+"m_"+str_year+"_dataWindCube.pkl", 'rb') as file:
-        vars()["df_"+str_year+"_"+iter_height+"m"]=pickle.load(file)
-    dict_data_lidar["df_"+str_year+"_"+iter_height+"m"]=(vars()["df_"+str_year+"_"+iter_height+"m"])
+# Report of the run (wall time, rows and peak memory of each stage), None to not save it
+str_run_report_path = "./savedFiles/run_report_correlation.json"
+# Profile of the run ("cprofile" or "pyinstrument") saved in str_profile_path, None to not profile
+str_profiler = "cprofile"
+str_profile_path = None
 
-####################################################
-########## Cleaning of Control lidar data ##########
-####################################################
+###################################################
+#### PARAMETERS TO CHANGE MANUALLY - Figures ######
+###################################################
+# Directory where the figures of all the variables of ICE_LIDAR_VARIABLES (see task32.plotting) and months are saved
+# without display (one figure per height, png and pdf), with a manifest of the files saved
+# (ex.: "./savedFiles/iceLidar/"), None to not save them
+str_ice_lidar_directory = None
 
-# Add column for months in lidar dataframe : dict_data_lidar_cleaned    
-for height_lidar in dict_data_lidar:
-    df_lidar = dict_data_lidar[height_lidar]
-    list_column_month_lidar = df_lidar["TimeObjectData"].astype(str).str[5:7]
-    df_column_month=pd.DataFrame({"Month":list_column_month_lidar})
-    df_lidar = df_lidar.join(df_column_month)
-    dict_data_lidar_cleaned[height_lidar]=df_lidar
-        
-####################################################
-####### Importation of Control Quality data ########
-####################################################
-# loop importing CQ data for chosen filter height
-# Save data inside a dictionary : 
-for str_file_n in glob.glob(str_pathDirectory_CQ + str_filesFilter):
-    with open(str_file_n,mode='r') as file:
-        int_posi_name = str(file).find("mmv1")
-        str_name_key = str(file)[int_posi_name+5:int_posi_name+19]
-        dict_data_CQ[str_name_key]= pd.read_csv(file, delimiter=';')
-
-
-# Since there is no barometer at 80m, we add this entry to compare
-# pressure on site with the lidar        
-for str_file_m in glob.glob(str_pathDirectory_CQ+"*mmv1*Baroh*"):
-    with open(str_file_m,mode='r') as file:
-        int_posi_name = str(file).find("mmv1")
-        str_name_key = str(file)[int_posi_name+5:int_posi_name+19]
-        dict_data_CQ[str_name_key]= pd.read_csv(file, delimiter=';')
+###################################################
+### PARAMETERS TO CHANGE MANUALLY - Icing rules ###
+###################################################
+# Persistences (10-minute steps) of the sweep of the thresholds of the icing rule (see SWEEP_GRID in task32.sweep),
+# ex.: [1, 3], an empty list to not sweep
+list_sweep_persistence = []
 
-        
+###################################################
+########### INITIALIzATION of VARIABLES ###########
+###################################################
+# The data are only loaded when the script is run, not when it is imported
+if __name__ == "__main__":
+    # Dictionary initialisation for cleaned CQ data
+    dict_data_CQ_cleaned={}
+    # Dictionary initialisation for the number of rows flagged by each CQ code
+    dict_data_CQ_rejected={}
+    # Dictionary initialisation for cleaned lidar data
+    dict_data_lidar_cleaned={}
+    # Time, rows and memory of each stage of the run
+    dict_run_report = new_report("Correlation lidar met mast", {"year": str_year, "heights": list_heights,
+                                                                "filter": str_filesFilter})
+    tuple_run_profile = None if str_profile_path is None else start_profile(str_profiler)
+
+
+    ####################################################
+    ########### Importation of lidar data ##############
+    ####################################################
+    # Import cleaned lidar data for desired heights, all files read concurrently (from the cache when possible)
+    # Save data in dict_data_lidar_cleaned
+    # Name each dataFrame inside a dict : df_[annee]_[hauteur]m
+    with stage(dict_run_report, "lidar load") as dict_stage:
+        list_data_lidar = load_cleaned_lidar_files([lidar_file_path(str_pathDirectory_lidar, iter_height, str_year)
+                                                    for iter_height in list_heights])
+        for iter_height, df_lidar in zip(list_heights, list_data_lidar):
+            # Timestamps are UTC, kept naive since matplotlib plots naive dates much faster
+            df_lidar["TimeObjectData"] = df_lidar["TimeObjectData"].dt.tz_localize(None)
+            # Add column for months in lidar dataframe
+            df_lidar["Month"] = df_lidar["TimeObjectData"].dt.strftime("%m")
+            dict_data_lidar_cleaned["df_"+str_year+"_"+iter_height+"m"] = df_lidar
+            count_rows(dict_stage, rows_out=len(df_lidar))
+
+    ####################################################
+    ## Importation of cleaned Control Quality data #####
+    ####################################################
+    # Since there is no barometer at 80m, we add the barometer entry to compare
+    # pressure on site with the lidar
+    list_files_CQ = glob.glob(str_pathDirectory_CQ + str_filesFilter) + glob.glob(str_pathDirectory_CQ+"*mmv1*Baroh*")
+
+    # loop importing CQ data cleaned with the Quality Control (read from the cache when possible)
+    # Save data inside a dictionary : dict_data_CQ_cleaned
+    with stage(dict_run_report, "CQ read and QC") as dict_stage:
+        for str_file_n in list_files_CQ:
+            int_posi_name = str_file_n.find("mmv1")
+            str_name_key = str_file_n[int_posi_name+5:int_posi_name+19]
+            df_captor_CQ_cleaned, dict_data_CQ_rejected[str_name_key] = load_cleaned_cq(str_file_n, list_dropColumn_CQ)
+            # Timestamps are UTC, kept naive like the lidar timestamps
+            df_captor_CQ_cleaned["TimeObjectData"] = df_captor_CQ_cleaned["Timestamp"].dt.tz_localize(None)
+            # Add a column Month in dataframe from timestamp object
+            df_captor_CQ_cleaned["Month"] = df_captor_CQ_cleaned["TimeObjectData"].dt.strftime("%m")
+            dict_data_CQ_cleaned[str_name_key] = df_captor_CQ_cleaned
+            count_rows(dict_stage, rows_out=len(df_captor_CQ_cleaned), rejected=dict_data_CQ_rejected[str_name_key])
 
-####################################################
-######### Cleaning of Control Quality data #########
-####################################################
-# Loop to clean data from the CQ 
-# Iteration over all captors in dict_data_CQ
-for captor in dict_data_CQ:
-    # Assign data from captor in a dataframe
-    df_captor_CQ = dict_data_CQ[captor]
-    # Initialisation of variables needed to clean dataframe
-    array_columnTotalValue = np.zeros(len(df_captor_CQ))
-    array_columnIndexValue=np.arange(0,len(df_captor_CQ))
-    list_DateTime=[]
-    
-    # Inside loop to determine which row delete from CQ according to RXXX codes
-    for column in list_dropColumn_CQ:
-        # Add 1 in the row where RXXX is true 
-        array_columnTotalValue += df_captor_CQ[column].to_numpy()
-        
-    # Loop over all timestamp to uniform Cq timestamps with lidar timestamps   
-    for iter_timestamp in df_captor_CQ["Timestamp"]:
-        # Correct the timestamp in a new list : list_DateTime
-        list_DateTime.append(datetime.datetime.strptime(iter_timestamp[0:17].replace("-"," "),'%d %b %Y %H:%M'))  
-    
-    # Convert list_DateTime to a dataframe : df_timeObject     
-    df_timeObject = pd.DataFrame(list_DateTime,columns=["TimeObjectData"])
-    # Add a new column in df_captor_CQ with the new timestamps
-    df_captor_CQ=df_captor_CQ.join(df_timeObject) 
-    # Find index where a selected RXXX code is true
-    array_columnIndex = (array_columnTotalValue > np.zeros(len(df_captor_CQ)))*array_columnIndexValue
-    # Remove all rows where value is 0 to only keep none zero numbers
-    array_columnIndex = array_columnIndex[array_columnIndex != 0]
-    # Remove all rows of df_captor_CQ where a RXXX code is true and save new dataframe
-    df_captor_CQ_cleaned = df_captor_CQ.drop(array_columnIndex)
-    # Add a column Month in dataframe from timestamp object
-    list_column_month = df_captor_CQ_cleaned["TimeObjectData"].astype(str).str[5:7]
-    df_column_month=pd.DataFrame({"Month":list_column_month})
-    df_captor_CQ_cleaned = df_captor_CQ_cleaned.join(df_column_month)
-    # Assign cleaned dataframe in the dictionary : dict_data_CQ_cleaned
-    dict_data_CQ_cleaned[captor] = df_captor_CQ_cleaned
-    
-    
-####################################################
-############ save data in pickle file ##############
-####################################################
-# Save lidar entry in pickle file for each height
-for lidar_entry in dict_data_lidar_cleaned:
-    df_save_output = dict_data_lidar_cleaned[lidar_entry]
-    df_save_output.to_pickle("savedFiles/"+lidar_entry+".pkl")
-
-# Save CQ entry in pickle file for each captor
-for captor_entry in dict_data_CQ_cleaned:
-    df_save_output = dict_data_CQ_cleaned[captor_entry]
-    df_save_output.to_pickle("savedFiles/"+captor_entry+".pkl")
 #%%
 """
 
@@ -208,188 +195,30 @@ You can directly go to the next section to use it
 # - with ice detection from double anemometry (use INFO01)
 def FunctionPlotGraphsIceLidar(Variable, Months, dictionary_CQ, dictionary_lidar, list_height_lidar, INFO="INFO01"):
 
+    # Column, label, limits and scale of the ice markers of each variable are in ICE_LIDAR_VARIABLES
+    # Each lidar dataframe is split by month once, for all the months
+    list_monthly = []
+    for iter_heights, df_lidar in zip(list_height_lidar, dictionary_lidar.values()):
+        str_column = variable_column(Variable, iter_heights)
+        # Don't take into account empty dataframes
+        if df_lidar.size > 1:
+            list_monthly.append((str_column, monthly_series(df_lidar, [str_column])))
+        else:
+            print("Empty dataframe")
+    # Ice detected by any captor, drawn once per figure
+    dict_ice = ice_dates_by_month(dictionary_CQ, INFO)
+
     # loop over all months to create a graph for each month
     for iter_months in Months:
         plt.figure(num=int(iter_months))
-        
-        # loop over captors in dictionary of CQ Data
-        for captor in dictionary_CQ:
-            # Assign captor to a dataframe and only keep specified months
-            df_captor_inter = dictionary_CQ[captor]
-            df_captor = df_captor_inter[df_captor_inter["Month"] == iter_months]  
-            int_iteration = 0
-            
-            # loop over heigts in dictionary of lidar Data
-            for iter_heights in dictionary_lidar:
-                df_lidar = dictionary_lidar[iter_heights] 
-                                         
-                # Don't take into account empty dataframes        
-                if df_lidar.size > 1:
-                    df_lidar_month=df_lidar[df_lidar["Month"] == iter_months]
-                else:
-                    print("Empty dataframe")
-                    break
-                    
-                if Variable == "Temp_int":
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month["Int Temp (°C)"].astype("float"),'.k',markersize=1, label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*10, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Internal temperature (°C) ", fontsize=13)
-                    plt.yticks(np.arange(-5,30,5))
-                    plt.ylim(-5,30)
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    # plt.show()
-                elif Variable == "Temp_ext":
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month["Ext Temp (°C)"].astype("float"),'.k',markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("External temperature (°C)", fontsize=13)
-                    plt.yticks(np.arange(-20,20,5))
-                    plt.ylim(-20,20)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()              
-                elif Variable == "Pressure":
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month["Pressure (hPa)"].astype("float"),".k",markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Pressure (hPa)", fontsize=13)
-                    plt.yticks(np.arange(900,1010,10))
-                    plt.ylim(900,1010)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()                
-                elif Variable == "Rel_hum":                
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month["Rel Humidity (%)"].astype("float"),".k", markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Relative humidity (%)", fontsize=13)
-                    plt.yticks(np.arange(0,100,5))
-                    plt.ylim(0,100)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show() 
-                elif Variable == "WiperCounts":                
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month["Wiper count"].astype("float"),".k",markersize=1,label="_nolegend_")
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*25, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Wiper counts", fontsize=13)
-                    plt.yticks(np.arange(0,50,5))
-                    plt.ylim(0,50)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()
-                elif Variable == "Vbatt": 
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month["Vbatt (V)"].astype("float"),".k",markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Voltage batterie (V)", fontsize=13)
-                    plt.yticks(np.arange(0,30,5))
-                    plt.ylim(0,30)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()                               
-                elif Variable == "Wdspd":                 
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month[list_height_lidar[int_iteration]+"m Wind Speed (m/s)"].astype("float"),".k",markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Windspeed (m/s)", fontsize=13)
-                    plt.yticks(np.arange(0,30,5))
-                    plt.ylim(0,30)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()                
-                elif Variable == "Data_availability":                 
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month[list_height_lidar[int_iteration]+"m Data Availability (%)"].astype("float"),".k",markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*70, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Data availability (%)", fontsize=13)
-                    plt.yticks(np.arange(0,125,5))
-                    plt.ylim(0,125)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()                            
-                elif Variable == "Data_availability_2":                 
-                    vector_availability = (df_lidar_month[list_height_lidar[int_iteration]+"m Data Availability (%)"].astype("float") < 20)*1
-                    plt.plot(df_lidar_month['TimeObjectData'], vector_availability.replace({0:np.nan}),".k",markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Data availability below 20%", fontsize=13)
-                    plt.yticks(np.arange(-45,20,5))
-                    plt.ylim(-45,20)
-                    plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()                
-                elif Variable == "wdspd_dis":                 
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month[list_height_lidar[int_iteration]+"m Wind Speed Dispersion (m/s)"].astype("float"),".k",markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Windspeed dispersion (m/s)", fontsize=13)
-                    plt.yticks(np.arange(0,15,5))
-                    plt.ylim(0,15)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()
-                elif Variable == "CNR": 
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month[list_height_lidar[int_iteration]+"m CNR (dB)"].astype("float"),'.k',markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("CNR (dB)", fontsize=13)
-                    plt.yticks(np.arange(-45,25,5))
-                    plt.ylim(-45,25)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()
-                elif Variable == "Z-wind": 
-                    plt.plot(df_lidar_month['TimeObjectData'], df_lidar_month[list_height_lidar[int_iteration]+"m Z-wind (m/s)"].astype("float"),'.k',markersize=1,label='_nolegend_')
-                    plt.plot(df_captor["TimeObjectData"], df_captor[INFO].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-                    plt.xlabel("Time", fontsize=13)
-                    plt.ylabel("Vertical wind (m/s)", fontsize=13)
-                    plt.yticks(np.arange(-8,16,2))
-                    plt.ylim(-8,16)
-                    # plt.yticks([])
-                    plt.xticks(rotation=45)
-                    plt.legend(["ice detected"])
-                    plt.tight_layout()
-                    plt.grid(True)
-                    plt.show()
-                else:
-                    print("Variable must be a string in: Temp_int, Temp_ext, Pressure, Rel_hum, WiperCounts, Vbatt, Wdspd, Data_availability, Data_availability_2, wdspd_dis, CNR and Z-wind")
-                    break
-    return df_lidar_month
+        list_series = []
+        for str_column, dict_monthly in list_monthly:
+            if iter_months in dict_monthly:
+                array_dates, dict_values = dict_monthly[iter_months]
+                list_series.append((array_dates, dict_values[str_column]))
+        draw_ice_lidar(plt.gca(), Variable, list_series, dict_ice.get(iter_months, np.array([])))
+        plt.tight_layout()
+    plt.show()
 
 
 #%%
@@ -408,117 +237,137 @@ as determined by the double anemometry
 ########################################################
 ########## Test for correlation with CQ Data ###########
 ######################################################## 
-def FunctionPlotCorrelationCQandIceDetection(list_Months):
-
-    # Initialisation of dataframe with the right timestamps
-    df_test_correlation = df_timeObject
-    # Initialization of the column names
-    str_name=""
-    int_interation = 2
-    
-    # loop over captors in dictionary of CQ to 
-    for captor in dict_data_CQ_cleaned:
-        # if captor is a pressure captor
-        if captor.find("Baroh") >= 0:
-            str_name = "Pressure"
-            # Save information in dataframe : df_captor_CQ
-            df_captor_CQ = dict_data_CQ_cleaned[captor]
-            # Add column with df_captor_CQ in df_test_correlation
-            df_test_correlation = df_test_correlation.join(df_captor_CQ["Moyenne"],lsuffix=1)
-            
-        # if captor is a temperature captor
-        elif captor.find("Temp") >= 0:
-            str_name="Temperature"
-            # Save information in dataframe : df_captor_CQ
-            df_captor_CQ=dict_data_CQ_cleaned[captor]
-            # Add column with df_captor_CQ in df_test_correlation
-            df_test_correlation=df_test_correlation.join(df_captor_CQ["Moyenne"],lsuffix=1)
-            
-        # if captor is a humidity captor
-        elif captor.find("RHH") >= 0:
-            str_name="Humidity"
-            # Save information in dataframe : df_captor_CQ
-            df_captor_CQ=dict_data_CQ_cleaned[captor]
-            # Add column with df_captor_CQ in df_test_correlation
-            df_test_correlation=df_test_correlation.join(df_captor_CQ["Moyenne"],lsuffix=1)        
-        df_test_correlation.rename(columns = {"Moyenne":str_name},inplace=True)
-        int_interation += 1
-     
-    # drop empty columns    
-    df_test_correlation = df_test_correlation.dropna(axis=1, how='all')
-    # Add a column month to de dataFrame df_test_correlation
-    list_column_month = df_test_correlation["TimeObjectData"].astype(str).str[5:7]
-    df_column_month=pd.DataFrame({"Month":list_column_month})
-    df_test_correlation=df_test_correlation.join(df_column_month)
-    
-    # Test when humidity is over 90%
-    list_bool_Test_Humidity = df_test_correlation["Humidity"] > 90
-    # Test when temperature is over -5°C
-    list_bool_Test_Temperature_1 = df_test_correlation["Temperature"].astype("float") > -5.0
-    # # Test when temperature is under 5°C
-    list_bool_Test_Temperature_2 = df_test_correlation["Temperature"].astype("float") < 5.0
-    # # Test when pressure is under 970 hpa
-    list_bool_Test_Pressure = df_test_correlation["Pressure"].astype("float") < 980
-    # When all conditions are true
-    list_bool_Test_all = list_bool_Test_Humidity & list_bool_Test_Temperature_1 & list_bool_Test_Temperature_2 & list_bool_Test_Pressure
-    # # Add a column for when all conditions are respected
-    df_test_correlation=df_test_correlation.join(pd.DataFrame(list_bool_Test_all,columns=["Test_all"]))
+def FunctionPlotCorrelationCQandIceDetection(list_Months, dictionary_CQ, list_rules=ICING_RULES):
+
+    # Measurements of the pressure, temperature and humidity captors (found from their names) aligned on
+    # their timestamps, with the ice detected by the double anemometry (INFO01) on any captor (the anemometers)
+    df_test_correlation = captor_conditions(dictionary_CQ, info="INFO01")
+    # Every timestamp flagged on a captor must be in the ice column
+    int_ice_steps = int(df_test_correlation[ICE_COLUMN].sum())
+    if int_ice_steps != ice_steps(dictionary_CQ, "INFO01"):
+        raise ValueError("%d steps of ice aligned, %d flagged by the captors" % (int_ice_steps, ice_steps(dictionary_CQ, "INFO01")))
+    print("Ice steps: %d of %d" % (int_ice_steps, len(df_test_correlation)))
+    # Pressure brought to the height of the temperature captor, dew point, frost point, wet bulb, ice bulb
+    # and air density: the rules can use them like the measurements (ex.: ("Ice bulb", "<", 0.0))
+    df_test_correlation = add_derived_channels(df_test_correlation, measurement_heights(dictionary_CQ))
+    # Timestamps are UTC, kept naive like the other plotted timestamps
+    df_test_correlation["TimeObjectData"] = condition_timestamps(df_test_correlation).tz_localize(None)
+    df_test_correlation["Month"] = df_test_correlation["TimeObjectData"].dt.strftime("%m")
     
+    # Test of each rule (ex.: humidity over 90%, temperature between -5°C and 5°C, pressure under 980 hPa)
+    # and score of the rules against the ice detected
+    print(score_rules(df_test_correlation, list_rules).to_string())
+    # When all conditions of the first rule are true
+    df_test_correlation["Test_all"] = rule_mask(df_test_correlation, list_rules[0])
     
     # loop over specified months
     for iter_months in list_Months:
         plt.figure(num=int(iter_months)+100)
-        # Loop over all captors
-        for captor in dict_data_CQ_cleaned:
-            # Assign captor to a dataframe and only keep specified months
-            df_captor_inter = dict_data_CQ_cleaned[captor]
-            df_captor = df_captor_inter[df_captor_inter["Month"] == iter_months]  
-            # Extract the month of the iteration from the correlation dataframe : df_test_correlation 
-            df_test_correlation_month = df_test_correlation[df_test_correlation["Month"] ==iter_months]
-            # plot for each month in comparison to double anemometry
-            plt.plot(df_test_correlation_month['TimeObjectData'], df_test_correlation_month["Test_all"].replace({0:np.nan}).astype("float"),'.k',markersize=1,label='_nolegend_')
-            plt.plot(df_captor["TimeObjectData"], df_captor["INFO01"].replace({0:np.nan}).astype("float")*5, 'sb', label='ice detected')
-            plt.xlabel("Time", fontsize=13)
-            plt.ylabel("Correlation Test", fontsize=13)
-            plt.yticks(np.arange(-45,25,5))
-            plt.ylim(-45,25)
-            plt.yticks([])
-            plt.xticks(rotation=45)
-            plt.legend(["ice detected"])
-            plt.tight_layout()
-            plt.grid(True)
+        # Extract the month of the iteration from the correlation dataframe : df_test_correlation 
+        df_test_correlation_month = df_test_correlation[df_test_correlation["Month"] == iter_months]
+        # plot for each month in comparison to double anemometry
+        plt.plot(df_test_correlation_month['TimeObjectData'], df_test_correlation_month["Test_all"].replace({False:np.nan}).astype("float"),'.k',markersize=1,label='_nolegend_')
+        plt.plot(df_test_correlation_month["TimeObjectData"], df_test_correlation_month[ICE_COLUMN].replace({0:np.nan})*5, 'sb', label='ice detected')
+        plt.xlabel("Time", fontsize=13)
+        plt.ylabel("Correlation Test", fontsize=13)
+        plt.yticks(np.arange(-45,25,5))
+        plt.ylim(-45,25)
+        plt.yticks([])
+        plt.xticks(rotation=45)
+        plt.legend()
+        plt.tight_layout()
+        plt.grid(True)
     plt.show()
 #%%
 """
+This section compares the lidar wind speed with the wind speed of the cup anemometers of the met mast
+at the same height: regression of the lidar on the mast (slope, offset, R2) and errors of the lidar
+(bias, RMSE, MAE), for all the data, by icing state (INFO01) and by bin of temperature and relative humidity
+
+"""
+####################################################
+####### Function to compare the wind speeds ########
+####################################################
+# Function that prints the comparison table of the lidar and the met mast wind speeds for
+# - dictionary of captors from CQ (the anemometers are the captors "WdSpd...", their height is read in their name)
+# - dictionary of lidar dataframe
+# - list of heights of lidar in lidar dictionary (ex.: ["80","40"])
+def FunctionCompareWindSpeedLidarMetMast(dictionary_CQ, dictionary_lidar, list_height_lidar):
+
+    # Anemometers of the mast with their height (ex.: "WdSpdHt80m225d" -> "80")
+    dict_anemometers = {}
+    for captor in dictionary_CQ:
+        match_height = re.search(r"Ht(\d+)m", captor)
+        if captor.find("WdSpd") >= 0 and match_height is not None:
+            dict_anemometers[captor] = (match_height.group(1), dictionary_CQ[captor])
+    # Pairs of wind speeds with the icing state of each anemometer (its INFO01 flag)
+    df_pairs = wind_speed_pairs(dict(zip(list_height_lidar, dictionary_lidar.values())), dict_anemometers, info="INFO01")
+    # Temperature and humidity aligned on the time keys, for the bins of the comparison
+    df_conditions = captor_conditions(dictionary_CQ, info="INFO01")
+    df_comparison = comparison_statistics(df_pairs, df_conditions)
+    print(df_comparison.to_string(float_format="%.3f"))
+    return df_comparison
+
+
+#%%
+"""
 
 This section shows a demonstration of how to use the previous sections
 
 """
-##########################################################
-########## Use of FunctionPlotGraphsIceLidar #############
-##########################################################
-
-Variable = "Temp_int"
-#######################
-# Choices of variable #
-#######################
-# Internal Temperature ("Temp_int")
-# Outside Temperature ("Temp_ext")
-# Pressure ("Pressure")
-# Relative Humidity ("Rel_hum")
-# Wiper counts ("WiperCounts")
-# Volt battery ("Vbatt")
-# WindSpeed ("Wdspd")
-# Data availability ("Data_availability")
-# Data availability under 20 % ("Data_availability_2")
-# WindSpeed dispersion ("wdspd_dis")
-# CNR ("CNR")
-# vertical wind ("Z-wind")
-
-list_Months= ["10", "11", "12"]
-dictionary_CQ = dict_data_CQ_cleaned
-dictionary_lidar = dict_data_lidar_cleaned
-list_height_lidar = list_heights 
-
-FunctionPlotGraphsIceLidar(Variable, list_Months, dictionary_CQ, dictionary_lidar, list_height_lidar, INFO="INFO01")
-FunctionPlotCorrelationCQandIceDetection(list_Months)
\ No newline at end of file
+if __name__ == "__main__":
+    ##########################################################
+    ########## Use of FunctionPlotGraphsIceLidar #############
+    ##########################################################
+
+    Variable = "Temp_int"
+    #######################
+    # Choices of variable #
+    #######################
+    # Internal Temperature ("Temp_int")
+    # Outside Temperature ("Temp_ext")
+    # Pressure ("Pressure")
+    # Relative Humidity ("Rel_hum")
+    # Wiper counts ("WiperCounts")
+    # Volt battery ("Vbatt")
+    # WindSpeed ("Wdspd")
+    # Data availability ("Data_availability")
+    # Data availability under 20 % ("Data_availability_2")
+    # WindSpeed dispersion ("wdspd_dis")
+    # CNR ("CNR")
+    # vertical wind ("Z-wind")
+
+    list_Months= ["10", "11", "12"]
+    dictionary_CQ = dict_data_CQ_cleaned
+    dictionary_lidar = dict_data_lidar_cleaned
+    list_height_lidar = list_heights 
+
+    with stage(dict_run_report, "plot"):
+        FunctionPlotGraphsIceLidar(Variable, list_Months, dictionary_CQ, dictionary_lidar, list_height_lidar, INFO="INFO01")
+    # All the variables and months saved as files at once, without display (one figure per height),
+    # rendered by a pool of processes, with a manifest of the files saved
+    if str_ice_lidar_directory is not None:
+        with stage(dict_run_report, "plot all") as dict_stage:
+            list_saved = render_ice_lidar_figures(list(ICE_LIDAR_VARIABLES), list_Months, dictionary_CQ,
+                                                  dict(zip(list_height_lidar, dictionary_lidar.values())),
+                                                  str_ice_lidar_directory, list_formats=["png", "pdf"], int_jobs=None,
+                                                  str_manifest="manifest.json")
+            count_rows(dict_stage, rows_out=len(list_saved))
+    with stage(dict_run_report, "correlation"):
+        FunctionPlotCorrelationCQandIceDetection(list_Months, dictionary_CQ)
+    # Sweep of the thresholds of the icing rule, the measurements and the ice of all the captors being aligned once
+    # and shared by a pool of processes, the rules ranked by critical success index
+    if list_sweep_persistence:
+        with stage(dict_run_report, "sweep") as dict_stage:
+            df_sweep = sweep_icing_rules(captor_conditions(dictionary_CQ), rule_grid(SWEEP_GRID, list_sweep_persistence))
+            count_rows(dict_stage, rows_out=len(df_sweep))
+        print(df_sweep.head(20).to_string())
+    with stage(dict_run_report, "comparison") as dict_stage:
+        df_comparison = FunctionCompareWindSpeedLidarMetMast(dictionary_CQ, dictionary_lidar, list_height_lidar)
+        count_rows(dict_stage, rows_out=len(df_comparison))
+
+    if tuple_run_profile is not None:
+        stop_profile(tuple_run_profile, str_profile_path, dict_run_report)
+    if str_run_report_path is not None:
+        write_report(dict_run_report, str_run_report_path)
+    print_report(dict_run_report)
\ No newline at end of file
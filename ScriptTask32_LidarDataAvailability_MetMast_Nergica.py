@@ -16,23 +16,25 @@ This code contains 4 sections
     2. Lidar data to be analysed is saved as a dataframe and the format of dates is adjusted to be in
     concordance with dates on the met mast data
         
-    3. The lidar data availability is computed monthly 
+    3. The lidar data availability is computed for each month of the data, by year (in incremental mode, see availability_state_path, only the
+    records that arrived since the previous run are merged into the statistics saved by that run)
         
-    4. MMV1 data are saved as a dataframe, and the quality control is performed. Then, a column is added to 
-    store the windspeed corresponding to each timestamp from the lidar. This allow to identify columns containing
-    data on both: Lidar and MMV1
+    4. MMV1 and MMV2 data are saved as dataframes, and the quality control is performed (files are read in parallel,
+    or the records are read from the store of store_path, see task32.store).
+    Then, a column is added to store the windspeed corresponding to each timestamp from the lidar. This allow to
+    identify columns containing data on both: Lidar and each mast
         
-    5. The Lidar data availability is computed analyzed, first using MMV1 temperature, second using MMV1 relative
-    humudity
+    5. The Lidar data availability is computed analyzed for each mast, first using the mast temperature, second using
+    the mast relative humudity
     
-    6. Here, step 4. is repeated for MMV2
-    
-    7. Here, step 5 is repeated for MMV2
-    
-    8. Figures are plotted for analysis: lidar data availability by months, lidar data availability by temperature 
+    6. Figures are plotted for analysis: lidar data availability by months, lidar data availability by temperature 
     comparing MMV1 and MMV2, lidar data availability by relative humidity comparing MMV1 and MMV2, number of points
     in each bin of temprature and relative humidity
     
+The sections 2 to 6 only run when the script is run (not when it is imported), so that the met mast files are read
+and the figures are rendered by pools of processes. The same analysis can be run from the command line, for any
+years, heights, masts and Quality Control codes: python -m task32 availability --help
+
 Example to run the code : 
     on spyder or other related IDEs -> Run the script
     on anaconda or other related prompts -> Make sure the file is in the right directory and run this command : python ScriptTask32_LidarDataAvailability_MetMast_Nergica.py
@@ -43,301 +45,141 @@ Example to run the code :
 ########## 1. Importation of python libraries #####################
 ###################################################################
 
-import glob
-import pandas as pd
-import numpy as np
-import matplotlib.patches as mpatches
-import matplotlib.pyplot as plt
-import time
-
-start_time = time.time()
+from task32.analysis import (availability_by_mast, availability_figures, join_lidar, load_lidar_years, load_masts,
+                             monthly_availability)
+from task32.availability import bin_edges
+from task32.incremental import last_key, load_state, save_state, update_start
+from task32.instrument import count_rows, new_report, print_report, stage, start_profile, stop_profile, write_report
+from task32.plotting import export_figures
+from task32.qc import QC_CODES
+from task32.store import open_store
 
 # Bins to group temperature or relative humiduty data for analysis, int>0
 temp_bin = 1 # temprature bin
 RHH_bin = 1 # Relative humidity bin
-# data paths
-lidar_data_path = "./lidarData/80m_2015_dataWindCube.pkl"
+# data paths: lidar files "[height]m_[year]_dataWindCube.pkl" of lidar_years in lidar_directory
+lidar_directory = "./lidarData/"
+lidar_height = 80
+lidar_years = [2015]
 mmv1_data_path = "./metMastData/*80m*.csv"
 mmv2_data_path = "./metMastData/*78m*.csv"
+# Temperature and relative humidity sensors of each mast used to analyze the lidar data availability
+# (name of the CQ files without the mast and the dates, the files of all the years of a sensor are used)
+mast_sensors = {"MMV1": {"temp": "TempUnHt80m0d", "RH": "RHHt80m0d"},
+                "MMV2": {"temp": "TempUnHt78m174d", "RH": "RHUnHt78m174d"}}
+# Months with less records are not shown in the monthly availability (144 records: one day)
+min_records_month = 144
+# Number of processes reading the met mast files and rendering the figures (None: one per core)
+int_jobs = None
 # Quality control codes
-Droped = ["R101","R103","R104","R105","R201","R202","R203","R204","R205","R206"]
-
-###################################################################
-########## 2. Extraction of LIDAR data ############################
-###################################################################
-
-dataframe_output_2015 = pd.read_pickle(lidar_data_path)
-print("--- Lidar data extracted ---")
-
-# Date format adjustments 
-dataframe_output_2015['TimeStamp'] = pd.to_datetime(dataframe_output_2015.TimeStamp)
-dataframe_output_2015['Timestamp1'] = dataframe_output_2015['TimeStamp'].dt.strftime('%m/%d/%Y %H:%M')
-dataframe_output_2015['Month'] = dataframe_output_2015["Timestamp1"].str[:2]
-
-###################################################################
-########## 3. Lidar data availability by month ####################
-###################################################################
-
-column_names = ["2015"]
-Lidar_avail = pd.DataFrame(columns = column_names)
-List_months=["09", "10", "11" ,"12"] #["01", "02", "03", "04", "05", "06", "07", "08", "09", "10", "11" ,"12"]
-heights=["80"] 
-k=0
-for l in List_months:
-    if '80m Wind Speed (m/s)' in dataframe_output_2015.columns:
-        temp2 = dataframe_output_2015.loc[dataframe_output_2015["Month"] == l]
-        temp = temp2.loc[temp2["80m Wind Speed (m/s)"] != 'NaN' ]
-        if len(temp2) > 0:
-            Lidar_avail.loc[k,"2015"] = 100*len(temp)/len(temp2)
-    k=k+1
-print("--- Lidar availability by date computed ---")
-
-###################################################################
-########## 4. MMV1 data ###########################################
-###################################################################
-
-# Dictionnary for MMV1 data
-data_CQ2015={} # MMV1 data as extracted
-data_CQ2015_cleaned={} # MMV1 data after quality control
-data_CQ2015_cleaned_Lidar={} # MMV1 data after quality control for timestamps with lidar data
-
-# MMV1 data at 80m 
-#for name in glob.glob("./DataCQ_2015_MMV1_empty/*80m*.csv" ): # Test if files are empty
-for name in glob.glob(mmv1_data_path ):
-    tp0=name.find('mmv1_')
-    tp1=name.find('.csv')
-    data_CQ2015[name[tp0:tp1]]= pd.read_csv(name, delimiter=';')
-print("--- MMV1 data extracted ---")
-
-# Perform quality control
-for capteur in data_CQ2015:
-    df=data_CQ2015[capteur]
-    for drp in Droped:    
-        df[drp].to_numpy()
-        df = df.drop(df[df[drp] == 1].index)   
-    data_CQ2015_cleaned[capteur] = df
-print("--- MMV1 quality control done ---")
-
-# Add empty column to store Lidar speed
-column_names = ["Timestamp1"]
-dataframe_output_2015_Time = pd.DataFrame(columns = column_names)
-dataframe_output_2015_Time["Timestamp1"] = dataframe_output_2015["Timestamp1"]
-for key, df in data_CQ2015_cleaned.items():
-    df['Timestamp'] = pd.to_datetime(df.Timestamp)
-    df['Timestamp1'] = df['Timestamp'].dt.strftime('%m/%d/%Y %H:%M')
-    df['Month'] = df['Timestamp'].dt.strftime('%m')
-    common = df.merge(dataframe_output_2015_Time,on=['Timestamp1'])
-    df_Time = df["Timestamp1"]
-    common2 = dataframe_output_2015.merge(df_Time,on=['Timestamp1'])
-    common = common.sort_values(by=['Timestamp1'])
-    common2 = common2.sort_values(by=['Timestamp1'])
-    common["Lidar 80m Wind Speed (m/s)"] = common2["80m Wind Speed (m/s)"]
-    data_CQ2015_cleaned_Lidar[key] = common
-    
-###################################################################
-########## 5. Lidar vs MMV1 data analysis #########################
-###################################################################
-
-# Lidar availability by temperature 
-column_names = ["temp", "Dispo 2015", "Vitesse Moyemme"]
-Avail_Lidar_temp = pd.DataFrame(columns = column_names)
-
-k=0
-df = data_CQ2015_cleaned_Lidar["mmv1_TempUnHt80m0d_20150901_20151231"]
-for l in range(-25,35,temp_bin):
-    temp2 = df.loc[df["Moyenne"] <= l+temp_bin]
-    temp2 = temp2.loc[temp2["Moyenne"] > l]
-    temp = temp2.loc[temp2["Lidar 80m Wind Speed (m/s)"] != 'NaN' ] 
-    temp3 = temp2["Lidar 80m Wind Speed (m/s)"].astype(float)
-    if len(temp2) > 0:
-        Avail_Lidar_temp.loc[k,"temp"] = l #str(l) #+ " to " + str(l+1)
-        Avail_Lidar_temp.loc[k,"Dispo 2015"] = 100*len(temp)/len(temp2)
-        Avail_Lidar_temp.loc[k,"Number"] = temp2["Moyenne"].count()
-        Avail_Lidar_temp.loc[k,"temp mean"] = temp2["Moyenne"].mean()
-        Avail_Lidar_temp.loc[k,"temp stdev"] = temp2["Moyenne"].std()
-        Avail_Lidar_temp.loc[k,"Vitesse Moyemme"] = temp3.mean()
-    k=k+1
-
-# Lidar availability by relative humidity 
-column_names = ["RH", "Dispo 2015", "Vitesse Moyemme"]
-Avail_Lidar_RH = pd.DataFrame(columns = column_names)
-
-k=0
-df = data_CQ2015_cleaned_Lidar["mmv1_RHHt80m0d_20150901_20151231"]
-for l in range(5,100,RHH_bin):
-    temp2 = df.loc[df["Moyenne"] <= l+RHH_bin]
-    temp2 = temp2.loc[temp2["Moyenne"] > l]
-    temp = temp2.loc[temp2["Lidar 80m Wind Speed (m/s)"] != 'NaN' ]
-    temp3 = temp2["Lidar 80m Wind Speed (m/s)"].astype(float)
-    if len(temp2) > 0:
-        Avail_Lidar_RH.loc[k,"RH"] = l #str(l) #+ " to " + str(l+1)
-        Avail_Lidar_RH.loc[k,"Dispo 2015"] = 100*len(temp)/len(temp2)
-        Avail_Lidar_RH.loc[k,"Number"] = temp2["Moyenne"].count()
-        Avail_Lidar_RH.loc[k,"RH mean"] = temp2["Moyenne"].mean()
-        Avail_Lidar_RH.loc[k,"RH stdev"] = temp2["Moyenne"].std()        
-        Avail_Lidar_RH.loc[k,"Vitesse Moyemme"] = temp3.mean()
-    k=k+1
-
-print("--- MMV1 done ---")
-print("--- %s seconds ---" % (time.time() - start_time))    
-
-###################################################################
-######################## 6. MMV2 data #############################
-###################################################################
-
-# Dictionnary for MMV2 data
-data_CQ2015={} # MMV2 data as extracted
-data_CQ2015_cleaned={} # MMV2 data after quality control
-data_CQ2015_cleaned_Lidar={} # MMV2 data after quality control for timestamps with lidar data
-
-# MMV2 data at 78m
-for name in glob.glob(mmv2_data_path):
-    tp0=name.find('mmv2_')
-    tp1=name.find('.csv')
-    data_CQ2015[name[tp0:tp1]]= pd.read_csv(name, delimiter=';')
-print("--- MMV2 data extracted ---")
-
-# Perform quality control
-for capteur in data_CQ2015:
-    df=data_CQ2015[capteur]
-    for drp in Droped:    
-        df[drp].to_numpy()
-        df = df.drop(df[df[drp] == 1].index)   
-    data_CQ2015_cleaned[capteur] = df
-print("--- MMV2 quality control done ---")
-
-# Add empty column to store Lidar speed
-column_names = ["Timestamp1"]
-dataframe_output_2015_Time = pd.DataFrame(columns = column_names)
-dataframe_output_2015_Time["Timestamp1"] = dataframe_output_2015["Timestamp1"]
-for key, df in data_CQ2015_cleaned.items():
-    df['Timestamp'] = pd.to_datetime(df.Timestamp)
-    df['Timestamp1'] = df['Timestamp'].dt.strftime('%m/%d/%Y %H:%M')
-    df['Month'] = df['Timestamp'].dt.strftime('%m')
-    common = df.merge(dataframe_output_2015_Time,on=['Timestamp1'])
-    df_Time = df["Timestamp1"]
-    common2 = dataframe_output_2015.merge(df_Time,on=['Timestamp1'])
-    common = common.sort_values(by=['Timestamp1'])
-    common2 = common2.sort_values(by=['Timestamp1'])
-    common["Lidar 80m Wind Speed (m/s)"] = common2["80m Wind Speed (m/s)"]
-    data_CQ2015_cleaned_Lidar[key] = common
-    
-###################################################################
-########## 7. Lidar vs MMV2 data analysis #########################
-###################################################################
-
-# Lidar availability by temperature 
-column_names = ["temp", "Dispo 2015", "Vitesse Moyemme"]
-Avail_Lidar_temp2 = pd.DataFrame(columns = column_names)
-k=0
-df = data_CQ2015_cleaned_Lidar["mmv2_TempUnHt78m174d_20150901_20151231"]
-for l in range(-25,35,temp_bin):
-    temp2 = df.loc[df["Moyenne"] <= l+temp_bin]
-    temp2 = temp2.loc[temp2["Moyenne"] > l]
-    temp = temp2.loc[temp2["Lidar 80m Wind Speed (m/s)"] != 'NaN' ] 
-    temp3 = temp2["Lidar 80m Wind Speed (m/s)"].astype(float)
-    if len(temp2) > 0:
-        Avail_Lidar_temp2.loc[k,"temp"] = l #str(l) #+ " to " + str(l+1)
-        Avail_Lidar_temp2.loc[k,"Dispo 2015"] = 100*len(temp)/len(temp2)
-        Avail_Lidar_temp2.loc[k,"Number"] = temp2["Moyenne"].count()
-        Avail_Lidar_temp2.loc[k,"temp mean"] = temp2["Moyenne"].mean()
-        Avail_Lidar_temp2.loc[k,"temp stdev"] = temp2["Moyenne"].std()
-        Avail_Lidar_temp2.loc[k,"Vitesse Moyemme"] = temp3.mean()
-    k=k+1
-
-# Lidar availability by relative humidity 
-column_names = ["RH", "Dispo 2015", "Vitesse Moyemme"]
-Avail_Lidar_RH2 = pd.DataFrame(columns = column_names)
-k=0
-df = data_CQ2015_cleaned_Lidar["mmv2_RHUnHt78m174d_20150901_20151231"]
-for l in range(5,100,RHH_bin):
-    temp2 = df.loc[df["Moyenne"] <= l+RHH_bin]
-    temp2 = temp2.loc[temp2["Moyenne"] > l]
-    temp = temp2.loc[temp2["Lidar 80m Wind Speed (m/s)"] != 'NaN' ]
-    temp3 = temp2["Lidar 80m Wind Speed (m/s)"].astype(float)
-    if len(temp2) > 0:
-        Avail_Lidar_RH2.loc[k,"RH"] = l #str(l) #+ " to " + str(l+1)
-        Avail_Lidar_RH2.loc[k,"Dispo 2015"] = 100*len(temp)/len(temp2)
-        Avail_Lidar_RH2.loc[k,"Number"] = temp2["Moyenne"].count()
-        Avail_Lidar_RH2.loc[k,"RH mean"] = temp2["Moyenne"].mean()
-        Avail_Lidar_RH2.loc[k,"RH stdev"] = temp2["Moyenne"].std()        
-        Avail_Lidar_RH2.loc[k,"Vitesse Moyemme"] = temp3.mean()
-    k=k+1
-
-print("--- MMV2 done ---")
-print("--- %s seconds ---" % (time.time() - start_time))  
-
-###################################################################
-########## 8. Plot figures ########################################
-###################################################################
-
-print("--- Plotting... ---" ) 
-
-# Plot monthly Lidar data availability  
-Lidar_avail.index += 9 
-ax = Lidar_avail.plot.bar(rot=0)
-ax.set_xlabel('Months', fontsize=16)
-ax.set_ylabel('Availability (%)', fontsize=16)
-ax.set_title('Lidar data availability by month')
-plt.savefig('./savedFiles/Monthly Lidar availability')
-
-# Plot lidar data availability by temperature (MMV1 & MMV2) 
-fig = plt.figure()
-if 'temp mean' in Avail_Lidar_temp.columns:
-    plt.scatter(Avail_Lidar_temp["temp mean"], Avail_Lidar_temp["Dispo 2015"], label="2015, MMV1, 80m")
-if 'temp mean' in Avail_Lidar_temp2.columns:
-    plt.scatter(Avail_Lidar_temp2["temp mean"], Avail_Lidar_temp2["Dispo 2015"], s=5, label="2015, MMV2, 78m")
-fig.suptitle('Lidar data availability by temperature', fontsize=18)
-plt.xlabel('Temperature (°C)', fontsize=16)
-plt.ylabel('Availability (%)', fontsize=16)
-plt.legend(loc='lower right')#, bbox_to_anchor=(0.005, -0.05))
-plt.savefig('./savedFiles/Lidar availability by temperature (MMV1 & MMV2)')
-
-# Plot lidar data availability by humidity (MMV1 & MMV2)
-fig = plt.figure()
-if 'RH mean' in Avail_Lidar_RH.columns:
-    plt.scatter(Avail_Lidar_RH["RH mean"], Avail_Lidar_RH["Dispo 2015"], label="2015, MMV1, 80m")
-if 'RH mean' in Avail_Lidar_RH2.columns:
-    plt.scatter(Avail_Lidar_RH2["RH mean"], Avail_Lidar_RH2["Dispo 2015"], s=5, label="2015, MMV2, 78m")
-fig.suptitle('Lidar data availability by relative humidity', fontsize=18)
-plt.xlabel('Relative Humidity (%)', fontsize=16)
-plt.ylabel('Availability (%)', fontsize=16)
-plt.legend(loc='lower right')#, bbox_to_anchor=(0.005, -0.05))
-plt.savefig('./savedFiles/Lidar availability by humidity (MMV1 & MMV2)')
-
-# Plot number of points in each bin for relative humidity
-fig = plt.figure()
-cmap = plt.get_cmap("tab10")
-X  = np.arange(len(Avail_Lidar_RH["RH"])) 
-X2  = np.arange(len(Avail_Lidar_RH2["RH"])) 
-if 'Number' in Avail_Lidar_RH.columns:
-    plt.bar(Avail_Lidar_RH["RH"],Avail_Lidar_RH["Number"],  width = 0.6,label="2015, MMV1, 80m")
-if 'Number' in Avail_Lidar_RH2.columns:
-    plt.bar(Avail_Lidar_RH2["RH"],Avail_Lidar_RH2["Number"], width = 0.4,label="2015, MMV2, 78m")
-MMV1 = mpatches.Patch(color = cmap(0), label='2015, MMV1, 80m')
-MMV2 = mpatches.Patch(color = cmap(1), label='2015, MMV2, 78m')
-plt.legend(handles=[MMV1, MMV2])
-fig.suptitle('Number of data points in each relative humidity bin', fontsize=18)
-plt.xlabel('Relative Humidity (%)', fontsize=16)
-plt.ylabel('Number of data points', fontsize=16)
-plt.savefig('./savedFiles/Number of points humidity')
-
-# Plot number of points in each bin for temperature
-fig = plt.figure()
-cmap = plt.get_cmap("tab10")
-X  = np.arange(len(Avail_Lidar_temp["temp"])) 
-X2  = np.arange(len(Avail_Lidar_temp2["temp"])) 
-if 'Number' in Avail_Lidar_temp.columns:
-    plt.bar(Avail_Lidar_temp["temp"],Avail_Lidar_temp["Number"], width = 0.6,label="2015, MMV1, 80m")
-if 'Number' in Avail_Lidar_temp2.columns:
-    plt.bar(Avail_Lidar_temp2["temp"],Avail_Lidar_temp2["Number"], width = 0.4,label="2015, MMV2, 78m")
-MMV1 = mpatches.Patch(color = cmap(0), label='2015, MMV1, 80m')
-MMV2 = mpatches.Patch(color = cmap(1), label='2015, MMV2, 78m')
-plt.legend(handles=[MMV1, MMV2])
-fig.suptitle('Number of data points in each temperature bin', fontsize=18)
-plt.xlabel('Temperature (°C)', fontsize=16)
-plt.ylabel('Number of data points', fontsize=16)
-plt.savefig('./savedFiles/Number of points temperature')
-
-print("--- %s seconds ---" % (time.time() - start_time))  
-print("--- FIN ---" ) 
+Droped = QC_CODES
+# Store of the mast and lidar data (see task32.store.build_store) read instead of the CQ and lidar files
+# (ex.: "./savedFiles/store/"), built with the codes Droped. None reads the files
+store_path = None
+# Incremental mode: file keeping the statistics of the previous runs, so that only the new records are merged
+# into the tables (ex.: "./savedFiles/availability_state.json"). None computes the tables from all the records
+availability_state_path = None
+# Formats of the figures saved in ./savedFiles/ ("png", "svg" and/or "pdf")
+figure_formats = ["png"]
+# Replicates of the bootstrap of the days giving the 95% confidence interval of the availability of each bin
+# ("Availability low (%)", "Availability high (%)", NaN for a bin of less than 2 days, see "Blocks"), 0 for no interval
+# (always 0 in incremental mode)
+bootstrap_replicates = 1000
+# Names of the columns of the tables of lidar availability by bin
+availability_names = {"Availability (%)": "Dispo 2015", "Lidar mean": "Vitesse Moyemme"}
+# Report of the run (wall time, rows and peak memory of each stage), None to not save it
+run_report_path = "./savedFiles/run_report_availability.json"
+# Profile of the run ("cprofile" or "pyinstrument") saved in profile_path, None to not profile
+profiler = "cprofile"
+profile_path = None
+
+if __name__ == "__main__":
+
+    # Time, rows and memory of each stage of the run
+    run_report = new_report("Lidar data availability", {"lidar": lidar_directory, "years": lidar_years,
+                                                         "mmv1": mmv1_data_path, "mmv2": mmv2_data_path,
+                                                         "incremental": availability_state_path is not None})
+    run_profile = None if profile_path is None else start_profile(profiler)
+
+    # Statistics of the previous runs in incremental mode, and the time key after which the records are read
+    # (None: all the records)
+    availability_state = None if availability_state_path is None else load_state(availability_state_path)
+    availability_after = None if availability_state is None else update_start(availability_state)
+    # Store read instead of the files
+    dict_store = None if store_path is None else open_store(store_path)
+
+    ###################################################################
+    ########## 2. Extraction of LIDAR data ############################
+    ###################################################################
+
+    # Lidar data with timestamps parsed in the "TimeObjectData" column (read from the cache when possible),
+    # and the same data indexed by 10-minute time keys, computed once and joined with every mast sensor
+    dataframe_output_2015, dataframe_output_2015_keyed = load_lidar_years(lidar_directory, lidar_height, lidar_years,
+                                                                         dict_report=run_report,
+                                                                         int_after=availability_after,
+                                                                         dict_store=dict_store)
+
+    ###################################################################
+    ########## 3. Lidar data availability by month ####################
+    ###################################################################
+
+    # Availability by month (rows: month, 1 to 12) and year (columns), computed for every month of the data in one pass
+    # In incremental mode, only the lidar records after the last update are merged in the monthly statistics
+    Lidar_avail = monthly_availability(dataframe_output_2015, dataframe_output_2015_keyed, lidar_height,
+                                       min_records_month, availability_state, run_report)
+
+    ###################################################################
+    ########## 4. MMV1 and MMV2 data ##################################
+    ###################################################################
+
+    # Data of both masts after quality control, keyed by (mast, sensor), files read by a pool of processes
+    # (from the cache when possible)
+    data_CQ2015_cleaned, data_CQ2015_rejected = load_masts({"MMV1": mmv1_data_path, "MMV2": mmv2_data_path}, Droped,
+                                                           int_jobs=int_jobs, dict_report=run_report,
+                                                           int_after=availability_after, dict_store=dict_store)
+
+    # Add column to store Lidar speed, for timestamps present in both sources
+    # data_CQ2015_cleaned_Lidar: mast data after quality control for timestamps with lidar data
+    # data_CQ2015_unmatched: number of timestamps only in mast data or only in lidar data
+    # data_CQ2015_last_key: time key of the last record of each mast sensor
+    data_CQ2015_cleaned_Lidar, data_CQ2015_unmatched, data_CQ2015_last_key = join_lidar(
+        data_CQ2015_cleaned, dataframe_output_2015_keyed,
+        {"%dm Wind Speed (m/s)" % lidar_height: "Lidar %dm Wind Speed (m/s)" % lidar_height}, run_report)
+
+    ###################################################################
+    ########## 5. Lidar vs MMV1 and MMV2 data analysis ################
+    ###################################################################
+
+    # Lidar availability by temperature, then by relative humidity, for each mast
+    # In incremental mode, only the records after the last update, present in both the mast and the lidar data, are merged
+    Avail_Lidar_mast = availability_by_mast(
+        data_CQ2015_cleaned_Lidar, mast_sensors, "Lidar %dm Wind Speed (m/s)" % lidar_height,
+        {"temp": bin_edges(-25, 35, temp_bin), "RH": bin_edges(5, 100, RHH_bin)}, availability_names,
+        availability_state, data_CQ2015_last_key, last_key(dataframe_output_2015_keyed), run_report,
+        bootstrap_replicates if availability_state is None else 0, int_jobs)
+    if availability_state is not None:
+        save_state(availability_state, availability_state_path)
+
+    Avail_Lidar_temp, Avail_Lidar_RH = Avail_Lidar_mast["temp"]["MMV1"], Avail_Lidar_mast["RH"]["MMV1"]
+    Avail_Lidar_temp2, Avail_Lidar_RH2 = Avail_Lidar_mast["temp"]["MMV2"], Avail_Lidar_mast["RH"]["MMV2"]
+
+    ###################################################################
+    ########## 6. Plot figures ########################################
+    ###################################################################
+
+    # Monthly Lidar data availability, lidar data availability by temperature and by humidity (MMV1 & MMV2),
+    # number of points in each bin of relative humidity and of temperature
+    list_figures = availability_figures(Lidar_avail, Avail_Lidar_mast, {"MMV1": "2015, MMV1, 80m", "MMV2": "2015, MMV2, 78m"},
+                                        "Dispo 2015")
+    # Each figure is drawn on its own figure object and saved in ./savedFiles/ by a pool of processes
+    # (see task32.plotting.export_figures), with a manifest of the files saved (savedFiles/manifest.json)
+    with stage(run_report, "plot") as run_stage:
+        list_saved = export_figures(list_figures, "./savedFiles/", figure_formats, int_jobs=int_jobs)
+        count_rows(run_stage, len(list_figures), len(list_saved))
+
+    if run_profile is not None:
+        stop_profile(run_profile, profile_path, run_report)
+    if run_report_path is not None:
+        write_report(run_report, run_report_path)
+    print_report(run_report)
+    print("--- FIN ---" )
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the stages of the scripts on synthetic data (see synthetic.py).
+
+The analysis of the availability script (see task32.analysis) is run on all the files of the dataset,
+each stage being reported with its wall time and the peak resident memory (RSS) of the process during
+the stage (see task32.instrument.stage):
+    lidar load             reading and typing of the lidar files of each height (pickle)
+    lidar timestamps       parsing of the lidar timestamps and 10-minute time keys
+    availability by month  lidar availability by month of the first height
+    CQ read and QC         reading (read_csv), timestamp parsing and Quality Control of the CQ files
+    join                   alignment of each CQ sensor with the lidar on the 10-minute time keys
+    binning                lidar availability by bin of temperature and relative humidity
+    plot                   figures of the availability script (Agg backend, saved as png)
+
+Example, from the root of the repository:
+    python -m benchmarks.run_benchmarks --years 2015 2016 --heights 80 120 --masts 2 --json bench.json
+The synthetic files are kept in --directory and reused by the next runs with the same parameters.
+The cleaned frames are not cached, unless --cache gives the directory of the cache (see task32.cache).
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+
+from benchmarks.synthetic import CQ_SENSORS, write_dataset
+from task32.analysis import (availability_by_mast, availability_figures, join_lidar, load_lidar_years, load_masts,
+                             monthly_availability)
+from task32.instrument import count_rows, new_report, stage
+from task32.plotting import export_figures
+from task32.qc import QC_CODES
+
+
+def run_benchmark(str_dataset, list_years, list_heights, int_masts, str_figures_directory, int_jobs=1,
+                  cache_directory=None):
+    """
+    Run the analysis of the availability script on the synthetic files of str_dataset (see synthetic.write_dataset),
+    with int_jobs workers and the cache of cache_directory (None: no cache), and return the records of its stages.
+    The mast sensors are joined with the lidar wind speed of the first height of list_heights.
+    """
+    dict_report = new_report("benchmark")
+    int_height = list_heights[0]
+    str_lidar_directory = os.path.join(str_dataset, "lidarData")
+    dict_lidar = {height: load_lidar_years(str_lidar_directory, height, list_years, int_jobs, dict_report=dict_report,
+                                           cache_directory=cache_directory)
+                  for height in list_heights}
+    df_lidar, df_lidar_keyed = dict_lidar[int_height]
+    df_by_month = monthly_availability(df_lidar, df_lidar_keyed, int_height, dict_report=dict_report)
+
+    dict_masts = {"mmv%d" % int_mast: os.path.join(str_dataset, "metMastData", "mmv%d_*.csv" % int_mast)
+                  for int_mast in range(1, int_masts + 1)}
+    dict_cleaned, _ = load_masts(dict_masts, QC_CODES, int_jobs, dict_report=dict_report,
+                                 cache_directory=cache_directory)
+    str_lidar_column = "Lidar %dm Wind Speed (m/s)" % int_height
+    dict_joined, _, _ = join_lidar(dict_cleaned, df_lidar_keyed, {"%dm Wind Speed (m/s)" % int_height: str_lidar_column},
+                                   dict_report)
+    # Synthetic sensors of each variable of task32.analysis.AVAILABILITY_BINS
+    str_temp, str_rh = ["%sHt%dm0d" % (str_sensor, int_height) for str_sensor in CQ_SENSORS]
+    dict_tables = availability_by_mast(dict_joined, {str_mast: {"temp": str_temp, "RH": str_rh} for str_mast in dict_masts},
+                                       str_lidar_column, dict_report=dict_report)
+
+    with stage(dict_report, "plot") as dict_stage:
+        str_years = "-".join(sorted({str(list_years[0]), str(list_years[-1])}))
+        dict_legends = {str_mast: "%s, %s, %dm" % (str_years, str_mast, int_height) for str_mast in dict_masts}
+        list_figures = availability_figures(df_by_month, dict_tables, dict_legends)
+        list_records = export_figures(list_figures, str_figures_directory, int_jobs=int_jobs, str_manifest=None)
+        count_rows(dict_stage, len(list_figures), len(list_records))
+    return dict_report["stages"]
+
+
+def main(list_arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[2015], help="years of synthetic data")
+    parser.add_argument("--heights", type=int, nargs="+", default=[80], help="lidar heights (m)")
+    parser.add_argument("--masts", type=int, default=2, help="number of met masts")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes reading the files and rendering the "
+                        "figures (default: 1, the peak RSS of the workers is not measured)")
+    parser.add_argument("--cache", default=None, metavar="DIRECTORY", help="cache of the cleaned frames "
+                        "(default: no cache)")
+    parser.add_argument("--directory", default=os.path.join(tempfile.gettempdir(), "task32_benchmark"),
+                        help="directory of the synthetic files")
+    parser.add_argument("--json", help="file where the results are saved (JSON)")
+    args = parser.parse_args(list_arguments)
+
+    str_dataset = os.path.join(args.directory, "y%s_h%s_m%d_s%d" % ("-".join(map(str, args.years)),
+                                                                   "-".join(map(str, args.heights)), args.masts, args.seed))
+    float_start = time.perf_counter()
+    dict_files = write_dataset(str_dataset, args.years, args.heights, args.masts, args.seed)
+    print("--- Synthetic data ready in %s (%.1f s) ---" % (str_dataset, time.perf_counter() - float_start))
+
+    str_figures = os.path.join(str_dataset, "figures")
+    list_results = run_benchmark(str_dataset, args.years, args.heights, args.masts, str_figures, args.jobs, args.cache)
+
+    print("%-22s %10s %14s" % ("stage", "wall (s)", "peak RSS (MB)"))
+    for dict_result in list_results:
+        print("%-22s %10.3f %14s" % (dict_result["stage"], dict_result["wall_s"], dict_result["peak_rss_mb"]))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"years": args.years, "heights": args.heights, "masts": args.masts, "seed": args.seed,
+                       "jobs": args.jobs, "cache": args.cache is not None,
+                       "cq_files": len(dict_files["cq"]), "lidar_files": len(dict_files["lidar"]),
+                       "stages": list_results}, file, indent=1)
+    return list_results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic met mast (CQ) and lidar (WindCube) files, in the layout of the files of Nergica's site,
+to benchmark the scripts on any number of years, heights and masts.
+
+CQ files: one ";" separated file per mast, sensor and year, named like the real ones
+(ex.: "mmv1_TempUnHt80m0d_20150101_20151231.csv"), with the 38 columns
+    Timestamp;Max;Min;StDev;Moyenne;NbDonnees;Tous;R101;...;INFO01;...;R701
+Lidar files: one pickled dataframe per height and year ("80m_2015_dataWindCube.pkl"),
+measurements saved as strings ("NaN" when missing) and "TimeStamp" in both formats of the WindCube.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# Columns of the CQ files, in the order of the real files
+CQ_COLUMNS = (["Timestamp", "Max", "Min", "StDev", "Moyenne", "NbDonnees", "Tous"]
+              + ["R101", "R103", "R104", "R105", "R201", "R202", "R203", "R204", "R205", "R206",
+                 "R301", "R303", "R304", "R401", "R403"]
+              + ["INFO%02d" % i for i in (1, 2, 3, 4, 5, 6, 7, 8, 9, 20, 21, 22, 23, 25, 26)]
+              + ["R701"])
+# Sensors written for each mast: name (without mast prefix and height) and (mean, amplitude) of the values
+CQ_SENSORS = {"TempUn": (5.0, 15.0), "RH": (70.0, 20.0)}
+# Measurements of the lidar that do not depend on the height
+LIDAR_GENERAL_COLUMNS = ["Int Temp (°C)", "Ext Temp (°C)", "Pressure (hPa)", "Rel Humidity (%)", "Wiper count", "Vbatt (V)"]
+# Measurements of the lidar at each height
+LIDAR_HEIGHT_COLUMNS = ["Wind Speed (m/s)", "Wind Speed Dispersion (m/s)", "Wind Speed min (m/s)", "Wind Speed max (m/s)",
+                        "Wind Direction (°)", "Z-wind (m/s)", "Z-wind Dispersion (m/s)", "CNR (dB)", "CNR min (dB)",
+                        "Dopp Spect Broad (m/s)", "Data Availability (%)"]
+
+
+def year_timestamps(int_year):
+    """Return the 10-minute timestamps (naive, UTC) of a year."""
+    return pd.date_range("%d-01-01 00:10" % int_year, "%d-01-01 00:00" % (int_year + 1), freq="10min")
+
+
+def synthetic_cq(int_year, float_mean, float_amplitude, random_generator):
+    """
+    Return a synthetic CQ frame for a year: a seasonal and daily cycle with noise, about 5 %
+    of the rows flagged by a Quality Control code and INFO01 set on about 3 % of the rows.
+    """
+    index_time = year_timestamps(int_year)
+    int_rows = len(index_time)
+    array_day = (index_time.dayofyear.to_numpy() + index_time.hour.to_numpy() / 24.0) / 365.25
+    array_mean = (float_mean - float_amplitude * np.cos(2 * np.pi * array_day)
+                  + 0.2 * float_amplitude * np.sin(2 * np.pi * 365.25 * array_day)
+                  + random_generator.normal(0, 0.1 * float_amplitude, int_rows))
+    array_stdev = np.abs(random_generator.normal(0.3, 0.1, int_rows))
+
+    df_cq = pd.DataFrame(0, index=np.arange(int_rows), columns=CQ_COLUMNS)
+    df_cq["Timestamp"] = index_time.strftime("%d-%b-%Y %H:%M:%S+00:00")
+    df_cq["Max"] = np.round(array_mean + 2 * array_stdev, 7)
+    df_cq["Min"] = np.round(array_mean - 2 * array_stdev, 7)
+    df_cq["StDev"] = np.round(array_stdev, 7)
+    df_cq["Moyenne"] = np.round(array_mean, 7)
+    df_cq["NbDonnees"] = 119
+    array_flagged = random_generator.random(int_rows) < 0.05
+    array_codes = random_generator.choice(["R101", "R104", "R201", "R205"], int_rows)
+    for str_code in np.unique(array_codes):
+        df_cq.loc[array_flagged & (array_codes == str_code), str_code] = 1
+    df_cq["Tous"] = array_flagged.astype(int)
+    df_cq["INFO01"] = (random_generator.random(int_rows) < 0.03).astype(int)
+    return df_cq
+
+
+def synthetic_lidar(int_year, int_height, random_generator):
+    """
+    Return a synthetic WindCube frame for a year and a height: measurements as strings,
+    "NaN" for about 10 % of the rows at the height and for the sensors that were not working,
+    and "TimeStamp" written "2015/09/01 00:10" with some rows written "2015-09-01 00:10".
+    """
+    index_time = year_timestamps(int_year)
+    int_rows = len(index_time)
+    array_missing = random_generator.random(int_rows) < 0.1
+    array_speed = np.abs(random_generator.weibull(2.0, int_rows) * 8.0)
+
+    dict_columns = {"Int Temp (°C)": random_generator.normal(22, 1, int_rows),
+                    "Wiper count": np.zeros(int_rows)}
+    for str_measurement in LIDAR_HEIGHT_COLUMNS:
+        array_values = array_speed + random_generator.normal(0, 0.5, int_rows)
+        dict_columns["%dm %s" % (int_height, str_measurement)] = np.where(array_missing, np.nan, array_values)
+
+    df_lidar = pd.DataFrame(index=np.arange(int_rows))
+    for str_column in LIDAR_GENERAL_COLUMNS + ["%dm %s" % (int_height, m) for m in LIDAR_HEIGHT_COLUMNS]:
+        array_values = dict_columns.get(str_column, np.full(int_rows, np.nan))
+        df_lidar[str_column] = pd.Series(np.round(array_values, 2)).map("{:.2f}".format).replace("nan", "NaN").to_numpy(dtype=object)
+    array_timestamps = index_time.strftime("%Y/%m/%d %H:%M").to_numpy(dtype=object)
+    array_dashes = random_generator.random(int_rows) < 0.005
+    array_timestamps[array_dashes] = index_time[array_dashes].strftime("%Y-%m-%d %H:%M")
+    df_lidar["TimeStamp"] = array_timestamps
+    df_lidar["TimeObjectData"] = index_time
+    return df_lidar
+
+
+def write_dataset(str_directory, list_years, list_heights, int_masts, int_seed=0):
+    """
+    Write the synthetic CQ and lidar files of list_years, list_heights (m) and int_masts masts
+    ("mmv1", "mmv2", ...) in str_directory/metMastData and str_directory/lidarData.
+
+    Returns a dictionary with the list of "cq" files as (mast, sensor, path) and the list of
+    "lidar" files as (height, year, path). Files that already exist are not written again.
+    """
+    random_generator = np.random.default_rng(int_seed)
+    str_cq_directory = os.path.join(str_directory, "metMastData")
+    str_lidar_directory = os.path.join(str_directory, "lidarData")
+    os.makedirs(str_cq_directory, exist_ok=True)
+    os.makedirs(str_lidar_directory, exist_ok=True)
+
+    list_cq = []
+    for int_mast in range(1, int_masts + 1):
+        for str_sensor, (float_mean, float_amplitude) in CQ_SENSORS.items():
+            for int_year in list_years:
+                str_sensor_name = "mmv%d_%sHt%dm0d_%d0101_%d1231" % (int_mast, str_sensor, list_heights[0], int_year, int_year)
+                str_path = os.path.join(str_cq_directory, str_sensor_name + ".csv")
+                if not os.path.exists(str_path):
+                    synthetic_cq(int_year, float_mean, float_amplitude, random_generator).to_csv(str_path, sep=";", index=False)
+                list_cq.append(("mmv%d" % int_mast, str_sensor, str_path))
+
+    list_lidar = []
+    for int_year in list_years:
+        for int_height in list_heights:
+            str_path = os.path.join(str_lidar_directory, "%dm_%d_dataWindCube.pkl" % (int_height, int_year))
+            if not os.path.exists(str_path):
+                synthetic_lidar(int_year, int_height, random_generator).to_pickle(str_path)
+            list_lidar.append((int_height, int_year, str_path))
+    return {"cq": list_cq, "lidar": list_lidar}
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Shared functions used by the IEA Wind Task 32 scripts of Nergica to compare
+lidar data with met mast data in cold climates.
+
+Importing task32 has no side effect and imports none of its modules: each name below is imported
+from its module when it is first used (ex.: task32.binned_availability), so that the command line
+(python -m task32, see task32.cli) starts fast and matplotlib is only imported to draw figures.
+"""
+
+import importlib
+
+# Names of each module of the package available from task32
+_EXPORTS = {
+    "task32.align": ("TIME_KEY", "TIME_STEP", "join_on_time_key", "key_by_time", "key_timestamps", "time_keys"),
+    "task32.analysis": ("AVAILABILITY_BINS", "AVAILABILITY_FIGURES", "availability_by_mast", "availability_figures",
+                        "join_lidar", "load_lidar_years", "load_masts", "monthly_availability"),
+    "task32.availability": ("AVAILABILITY_WINDOWS", "BOOTSTRAP_BATCH", "BOOTSTRAP_BLOCKS", "BOOTSTRAP_CONFIDENCE",
+                            "BOOTSTRAP_MIN_BLOCKS", "ICING_SEASON_MONTHS", "availability_by_window",
+                            "availability_from_statistics", "bin_edges", "binned_availability",
+                            "binned_availability_chunks", "binned_statistics", "block_counts", "bootstrap_availability",
+                            "window_labels"),
+    "task32.cache": ("CACHE_DIRECTORY", "CACHE_VERSION", "cache_key", "cached_frame", "file_hash"),
+    "task32.comparison": ("COMPARISON_BINS", "COMPARISON_COLUMNS", "ICING_GROUPS", "comparison_statistics",
+                          "wind_speed_pairs"),
+    "task32.derived": ("DERIVED_CHANNELS", "MAGNUS_COEFFICIENTS", "PSYCHROMETER_COEFFICIENTS", "add_derived_channels",
+                       "air_density", "derived_channels", "dew_point", "frost_point", "load_conditions",
+                       "pressure_at_height", "psychrometric_temperature", "saturation_temperature",
+                       "saturation_vapour_pressure", "vapour_pressure"),
+    "task32.events": ("EVENT_STATISTICS", "covered_steps", "event_conditions", "flag_events", "icing_events",
+                      "interval_index", "outage_events", "overlap_statistics", "overlap_steps", "run_lengths"),
+    "task32.flags": ("FLAG_BITS", "FLAG_CODES", "FLAG_COLUMN", "FLAG_DTYPE", "flag_mask", "flag_values", "pack_flags",
+                     "pack_frame", "parse_flag_query", "query_flags", "unpack_flags"),
+    "task32.icing": ("ICE_COLUMN", "ICING_RULES", "MEASUREMENT_PATTERNS", "align_conditions", "captor_conditions",
+                     "condition_timestamps", "ice_steps", "measurement_captors", "measurement_frames",
+                     "measurement_heights", "persistent", "rule_mask", "score_mask", "score_rules"),
+    "task32.incremental": ("READ_AFTER_KEY", "STATE_VERSION", "availability_by_month", "empty_state", "last_key",
+                           "load_state", "monthly_statistics", "save_state", "update_binned_availability",
+                           "update_monthly_availability", "update_start", "update_statistics", "watermark_timestamp"),
+    "task32.ingest": ("clean_cq", "cq_dtypes", "cq_file_end", "cq_sensor_name", "find_mast_files", "ingest_masts",
+                      "iter_cleaned_cq", "load_cleaned_cq", "read_cq"),
+    "task32.instrument": ("PROFILERS", "REPORT_VERSION", "count_rows", "finish_report", "new_report", "peak_rss_bytes",
+                          "print_report", "rss_bytes", "stage", "start_profile", "stop_profile", "write_report"),
+    "task32.lidar": ("LIDAR_DTYPE", "clean_lidar", "general_columns", "lidar_file_path", "lidar_height_frame",
+                     "lidar_schema", "load_cleaned_lidar", "load_cleaned_lidar_files", "load_lidar", "read_lidar",
+                     "split_height_column", "type_lidar"),
+    "task32.parallel": ("map_parallel",),
+    "task32.plotting": ("FIGURE_FORMATS", "ICE_LIDAR_VARIABLES", "draw_availability_by_bin", "draw_bin_counts",
+                        "draw_ice_lidar", "draw_monthly_availability", "export_figures", "figure_file_name",
+                        "ice_dates_by_month", "month_positions", "monthly_series", "render_ice_lidar_figures",
+                        "save_figure", "variable_column", "write_manifest"),
+    "task32.qc": ("QC_CODES", "apply_quality_control", "quality_control_mask"),
+    "task32.store": ("STORE_BITMAPS", "STORE_FILE", "STORE_MAST_CHANNELS", "STORE_VERSION", "build_store", "open_store",
+                     "store_channel", "store_frame", "store_keys", "store_lidar_frame", "store_mast_frame",
+                     "store_positions", "store_sensor_name", "store_sensors"),
+    "task32.sweep": ("CHUNKS_PER_WORKER", "SWEEP_GRID", "rule_grid", "sweep_icing_rules"),
+    "task32.timestamps": ("CQ_TIMESTAMP_FORMATS", "LIDAR_TIMESTAMP_FORMATS", "parse_cq_timestamps",
+                          "parse_lidar_timestamps", "parse_timestamps"),
+    "task32.windcube": ("STA_CHUNKSIZE", "STA_DELIMITER", "STA_ENCODINGS", "STA_EXTENSION", "find_sta_files", "iter_sta",
+                        "load_cleaned_sta", "load_sta", "read_sta", "read_sta_header", "sta_columns", "sta_height_frame",
+                        "sta_timezone"),
+}
+# Module of each name
+_MODULES = {str_name: str_module for str_module, tuple_names in _EXPORTS.items() for str_name in tuple_names}
+__all__ = sorted(_MODULES)
+
+
+def __getattr__(str_name):
+    if str_name not in _MODULES:
+        raise AttributeError("module %r has no attribute %r" % (__name__, str_name))
+    value = getattr(importlib.import_module(_MODULES[str_name]), str_name)
+    # Kept in the package, __getattr__ is not called again for this name
+    globals()[str_name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES))
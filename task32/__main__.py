@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""Command line of the analyses: python -m task32 --help (see task32.cli)."""
+
+import sys
+
+from task32.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Alignment of the met mast (CQ) and lidar data on a shared 10-minute time grid.
+
+Each timestamp is converted to an int64 key: the number of 10-minute steps since
+1970-01-01 00:00 UTC. Frames indexed by this key are sorted chronologically and
+can be joined with a single indexed lookup, whatever the number of years covered.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Time step shared by the met mast and the lidar data
+TIME_STEP = pd.Timedelta("10min")
+# Name of the index holding the time keys
+TIME_KEY = "TimeKey"
+
+
+def time_keys(timestamps, step=TIME_STEP):
+    """
+    Return the int64 time key of each timestamp: number of steps since the epoch (UTC).
+    Timestamps inside a step are binned on the start of the step.
+    """
+    index_time = pd.DatetimeIndex(timestamps)
+    # .values gives UTC datetime64 for tz-aware indexes
+    array_ns = index_time.values.astype("datetime64[ns]").astype(np.int64)
+    return np.floor_divide(array_ns, pd.Timedelta(step).value)
+
+
+def key_timestamps(array_keys, step=TIME_STEP):
+    """Return the tz-aware (UTC) DatetimeIndex of the start of each time key."""
+    array_ns = np.asarray(array_keys, dtype=np.int64) * pd.Timedelta(step).value
+    return pd.DatetimeIndex(array_ns.astype("datetime64[ns]")).tz_localize("UTC")
+
+
+def key_by_time(df, timestamps, step=TIME_STEP):
+    """
+    Return df indexed by the time keys of timestamps (one per row), sorted chronologically.
+    """
+    df_keyed = df.set_axis(pd.Index(time_keys(timestamps, step), name=TIME_KEY), axis=0)
+    if not df_keyed.index.is_monotonic_increasing:
+        df_keyed = df_keyed.sort_index(kind="stable")
+    return df_keyed
+
+
+def join_on_time_key(df_left, df_right, columns=None):
+    """
+    Add to df_left the columns of df_right for the time keys present in both frames.
+    Both frames must be indexed by time keys (see key_by_time).
+
+    columns is a list of df_right columns, or a dictionary {df_right column: new name}.
+    By default all the columns of df_right are added.
+    When df_right has several rows for a time key, the first one is used.
+
+    Returns the joined dataframe (rows of df_left with a match, chronological order)
+    and a dictionary with the number of keys "matched", "left_only" and "right_only".
+    """
+    if columns is None:
+        columns = list(df_right.columns)
+    dict_columns = dict(columns) if isinstance(columns, dict) else {c: c for c in columns}
+
+    index_right = df_right.index
+    if not index_right.is_unique:
+        df_right = df_right[~index_right.duplicated(keep="first")]
+        index_right = df_right.index
+    array_position = index_right.get_indexer(df_left.index)
+    array_matched = array_position >= 0
+
+    df_joined = df_left[array_matched].copy()
+    array_position = array_position[array_matched]
+    for str_column, str_name in dict_columns.items():
+        df_joined[str_name] = df_right[str_column].to_numpy()[array_position]
+
+    int_right_matched = len(np.unique(array_position))
+    dict_report = {"matched": int(array_matched.sum()),
+                   "left_only": int((~array_matched).sum()),
+                   "right_only": int(len(index_right) - int_right_matched)}
+    return df_joined, dict_report
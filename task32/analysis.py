@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+The analyses of the scripts as functions without side effects on import, shared by the scripts
+and the command line (see task32.cli): loading of the mast and lidar data of any number of years,
+alignment of the mast sensors with the lidar, lidar availability by month and by bin of the mast
+temperature and relative humidity, and the list of their figures.
+
+Every function takes an optional run report (see task32.instrument.new_report) where it records its stage.
+matplotlib is only imported by the functions drawing figures (see task32.plotting).
+"""
+
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+from task32.align import join_on_time_key, key_by_time, key_timestamps, time_keys
+from task32.availability import availability_by_window, bin_edges, binned_availability
+from task32.cache import CACHE_DIRECTORY
+from task32.incremental import last_key, update_binned_availability, update_monthly_availability
+from task32.ingest import ingest_masts
+from task32.instrument import count_rows, stage
+from task32.lidar import lidar_file_path, load_cleaned_lidar_files
+from task32.qc import QC_CODES
+from task32.store import store_lidar_frame, store_mast_frame, store_sensor_name, store_sensors
+from task32.windcube import load_sta, sta_height_frame
+
+# Bins of the lidar availability by temperature ("temp") and by relative humidity ("RH") of the masts
+AVAILABILITY_BINS = {"temp": bin_edges(-25, 35, 1), "RH": bin_edges(5, 100, 1)}
+# Title and label of the x axis of the figures of each variable of AVAILABILITY_BINS
+AVAILABILITY_FIGURES = {"temp": ("temperature", "Temperature (°C)"), "RH": ("relative humidity", "Relative Humidity (%)")}
+
+
+def load_masts(dict_patterns, list_codes=QC_CODES, int_jobs=None, bool_processes=True, dict_report=None,
+               bool_pack_flags=False, int_after=None, dict_store=None, cache_directory=CACHE_DIRECTORY):
+    """
+    Read and clean the CQ files of the masts of dict_patterns (see task32.ingest.ingest_masts), the files of
+    several years of a sensor being concatenated in chronological order.
+
+    Returns two dictionaries keyed by (mast, sensor), the sensor being named without the mast and the dates
+    (ex.: ("MMV1", "TempUnHt80m0d"), see task32.store.store_sensor_name): the cleaned frames and the number
+    of rows flagged by each Quality Control code. With bool_pack_flags, the flags of the frames are packed
+    in a single column (see task32.flags). With int_after (a time key, see task32.incremental.update_start),
+    only the records after it are read.
+    With dict_store (see task32.store.open_store), the records of all the sensors of the masts of dict_patterns
+    (its keys, the masts of the store) are read from the store, with the columns "Moyenne" and "INFO01":
+    list_codes must be the codes of the store, and the numbers of rows flagged are not known (empty).
+    The cleaned frames are cached in cache_directory (None: no cache, see task32.cache).
+    """
+    if dict_store is not None:
+        return _load_store_masts(dict_store, list(dict_patterns), list_codes, int_after, dict_report)
+    with _stage(dict_report, "CQ read and QC") as dict_stage:
+        dict_files, dict_rejected_files = ingest_masts(dict_patterns, list_codes, int_jobs, bool_processes,
+                                                       cache_directory=cache_directory, bool_pack_flags=bool_pack_flags,
+                                                       int_after=int_after)
+        dict_frames, dict_rejected = {}, {}
+        for (str_mast, str_file), df_cleaned in dict_files.items():
+            key = (str_mast, store_sensor_name(str_file))
+            dict_frames.setdefault(key, []).append(df_cleaned)
+            series_rejected = dict_rejected_files[(str_mast, str_file)]
+            dict_rejected[key] = series_rejected if key not in dict_rejected else dict_rejected[key].add(series_rejected, fill_value=0)
+            _count(dict_stage, rows_out=len(df_cleaned), rejected=series_rejected)
+        dict_cleaned = {key: list_frames[0] if len(list_frames) == 1 else
+                        pd.concat(list_frames, ignore_index=True).sort_values("Timestamp", kind="stable", ignore_index=True)
+                        for key, list_frames in dict_frames.items()}
+    return dict_cleaned, {key: series.astype(np.int64) for key, series in dict_rejected.items()}
+
+
+def load_lidar_years(str_directory, height, list_years, int_jobs=None, bool_processes=False, dict_report=None,
+                     list_sta=None, int_after=None, dict_store=None, cache_directory=CACHE_DIRECTORY):
+    """
+    Return the cleaned lidar frame of a height for all list_years (see task32.lidar.load_cleaned_lidar_files),
+    in chronological order, and the same frame indexed by time keys (see task32.align.key_by_time).
+    With list_sta (files or directories), the records of list_years are read from the raw WindCube
+    exports (see task32.windcube.load_sta) instead of the files of str_directory.
+    With dict_store (see task32.store.open_store), they are read from the store (see task32.store.store_lidar_frame).
+    With int_after (a time key, see task32.incremental.update_start), only the records after it are kept
+    and the years before it are not read. The cleaned frames are cached in cache_directory (None: no cache).
+    """
+    if int_after is not None:
+        int_first_year = key_timestamps([int_after])[0].year
+        list_years = [year for year in list_years if int(year) >= int_first_year]
+    with _stage(dict_report, "lidar load") as dict_stage:
+        if dict_store is not None:
+            list_frames = [store_lidar_frame(dict_store, height, pd.Timestamp("%s-01-01" % year, tz="UTC"),
+                                             pd.Timestamp("%s-12-31 23:59" % year, tz="UTC")) for year in list_years]
+            df_lidar = list_frames[0] if len(list_frames) == 1 else pd.concat(list_frames, ignore_index=True)
+        elif list_sta is None:
+            list_frames = load_cleaned_lidar_files([lidar_file_path(str_directory, str(height), str(year))
+                                                    for year in list_years], int_jobs, bool_processes, cache_directory)
+            df_lidar = list_frames[0] if len(list_frames) == 1 else pd.concat(list_frames, ignore_index=True)
+        else:
+            df_lidar = sta_height_frame(load_sta(list_sta, [height], int_jobs=int_jobs, bool_processes=bool_processes,
+                                                 cache_directory=cache_directory), height)
+            array_years = np.isin(df_lidar["TimeObjectData"].dt.year.to_numpy(), [int(year) for year in list_years])
+            df_lidar = df_lidar[array_years].reset_index(drop=True)
+        _count(dict_stage, rows_out=len(df_lidar))
+    with _stage(dict_report, "lidar timestamps") as dict_stage:
+        df_lidar_keyed = key_by_time(df_lidar, df_lidar["TimeObjectData"])
+        if int_after is not None:
+            array_new = df_lidar_keyed.index.to_numpy() > int_after
+            df_lidar = df_lidar[time_keys(df_lidar["TimeObjectData"]) > int_after].reset_index(drop=True)
+            df_lidar_keyed = df_lidar_keyed[array_new]
+        _count(dict_stage, len(df_lidar), len(df_lidar_keyed))
+    return df_lidar, df_lidar_keyed
+
+
+def monthly_availability(df_lidar, df_lidar_keyed, height, int_min_records=1, dict_state=None, dict_report=None):
+    """
+    Return the lidar availability (%) of the wind speed at a height by month (rows, 1 to 12) and year (columns),
+    for the months with at least int_min_records records. With dict_state (see task32.incremental), only the
+    records after the last update are merged in the monthly statistics of the state.
+    """
+    with _stage(dict_report, "availability by month"):
+        if dict_state is None:
+            df_by_month = availability_by_window(df_lidar, "month", int_min_records=int_min_records)
+            df_by_month = df_by_month[df_by_month["Height"] == int(height)]
+            return df_by_month.assign(Month=df_by_month["Window"].dt.month, Year=df_by_month["Window"].dt.year.astype(str)
+                                      ).pivot(index="Month", columns="Year", values="Availability (%)")
+        return update_monthly_availability(dict_state, "Lidar by month", df_lidar_keyed, "%sm Wind Speed (m/s)" % height,
+                                           last_key(df_lidar_keyed), int_min_records=int_min_records)
+
+
+def join_lidar(dict_cleaned, df_lidar_keyed, dict_columns, dict_report=None):
+    """
+    Add the lidar columns dict_columns ({lidar column: new name}) to the cleaned mast frames of dict_cleaned,
+    for the timestamps present in both sources (see task32.align.join_on_time_key).
+
+    Returns three dictionaries with the keys of dict_cleaned: the joined frames (indexed by time keys),
+    the number of timestamps matched or in one source only, and the time key of the last mast record
+    (None for a frame without record).
+    """
+    dict_joined, dict_unmatched, dict_last_key = {}, {}, {}
+    with _stage(dict_report, "join") as dict_stage:
+        for key, df in dict_cleaned.items():
+            df_keyed = key_by_time(df, df["Timestamp"])
+            dict_last_key[key] = last_key(df_keyed)
+            dict_joined[key], dict_unmatched[key] = join_on_time_key(df_keyed, df_lidar_keyed, dict_columns)
+            _count(dict_stage, len(df), len(dict_joined[key]))
+    return dict_joined, dict_unmatched, dict_last_key
+
+
+def availability_by_mast(dict_joined, dict_mast_sensors, str_lidar_column, dict_bins=AVAILABILITY_BINS, dict_names=None,
+                         dict_state=None, dict_last_key=None, int_lidar_last_key=None, dict_report=None,
+                         int_replicates=0, int_jobs=1):
+    """
+    Lidar availability by bin of each variable of dict_bins (ex.: "temp", "RH") for each mast.
+
+    dict_mast_sensors maps each mast to its sensor of each variable (ex.: {"MMV1": {"temp": "TempUnHt80m0d",
+    "RH": "RHHt80m0d"}}), the frames of dict_joined (see join_lidar) being keyed by (mast, sensor).
+    The columns of the tables of binned_availability are renamed with dict_names.
+    With dict_state (see task32.incremental), only the records up to the last record present in both the mast
+    (dict_last_key, see join_lidar) and the lidar (int_lidar_last_key, see task32.incremental.last_key) data are
+    merged in the state, nothing when one of them has no record.
+    With int_replicates > 0, the tables have the confidence interval of the availability of each bin from
+    a bootstrap of the days (see task32.availability.bootstrap_availability), computed by int_jobs processes.
+
+    Returns {variable: {mast: table}}.
+    """
+    if int_replicates > 0 and dict_state is not None:
+        raise ValueError("The bootstrap needs all the records, it is not available in incremental mode")
+    dict_tables = {str_label: {} for str_label in dict_bins}
+    with _stage(dict_report, "binning") as dict_stage:
+        for str_mast, dict_sensors in dict_mast_sensors.items():
+            for str_label, edges in dict_bins.items():
+                str_sensor = dict_sensors[str_label]
+                df = dict_joined[(str_mast, str_sensor)]
+                if dict_state is None:
+                    df_table = binned_availability(df, "Moyenne", edges, str_lidar_column, labels=str_label,
+                                                   int_replicates=int_replicates, int_jobs=int_jobs)
+                else:
+                    list_last = [dict_last_key[(str_mast, str_sensor)], int_lidar_last_key]
+                    int_until = None if None in list_last else min(list_last)
+                    df_table = update_binned_availability(dict_state, "%s %s" % (str_mast, str_sensor), df, "Moyenne",
+                                                          edges, str_lidar_column, str_label, int_until)
+                dict_tables[str_label][str_mast] = df_table.rename(columns=dict_names or {})
+                _count(dict_stage, len(df), len(df_table))
+    return dict_tables
+
+
+def availability_figures(df_by_month, dict_tables, dict_legends, str_availability="Availability (%)"):
+    """
+    Return the figures of the lidar availability, as the list_figures of task32.plotting.export_figures:
+    by month, by bin of each variable of dict_tables (see availability_by_mast) and the number of records
+    in each bin. dict_legends gives the legend of each mast (ex.: {"MMV1": "2015, MMV1, 80m"}).
+    """
+    from task32.plotting import draw_availability_by_bin, draw_bin_counts, draw_monthly_availability
+
+    list_masts = list(dict_legends)
+    list_sizes = [None] + [5] * (len(list_masts) - 1)
+    list_widths = np.linspace(0.6, 0.4, len(list_masts)) if len(list_masts) > 1 else [0.6]
+    str_masts = " & ".join(list_masts)
+    list_figures = [("Monthly Lidar availability", draw_monthly_availability, (df_by_month,))]
+    for str_label, dict_masts in dict_tables.items():
+        str_title, str_xlabel = AVAILABILITY_FIGURES.get(str_label, (str_label, str_label))
+        list_figures.append(("Lidar availability by %s (%s)" % (str_title.split()[-1], str_masts), draw_availability_by_bin,
+                             ([(dict_masts[m], dict_legends[m], s) for m, s in zip(list_masts, list_sizes)], str_label,
+                              "Lidar data availability by %s" % str_title, str_xlabel, str_availability)))
+    for str_label, dict_masts in reversed(list(dict_tables.items())):
+        str_title, str_xlabel = AVAILABILITY_FIGURES.get(str_label, (str_label, str_label))
+        list_figures.append(("Number of points %s" % str_title.split()[-1], draw_bin_counts,
+                             ([(dict_masts[m], dict_legends[m], float(w)) for m, w in zip(list_masts, list_widths)],
+                              str_label, "Number of data points in each %s bin" % str_title, str_xlabel)))
+    return list_figures
+
+
+def _load_store_masts(dict_store, list_masts, list_codes, int_after, dict_report):
+    # Frames of load_masts read from the store
+    if sorted(list_codes) != sorted(dict_store["codes"]):
+        raise ValueError("The store %s was built with the codes %s, not %s"
+                         % (dict_store["directory"], ", ".join(dict_store["codes"]), ", ".join(list_codes)))
+    start = None if int_after is None else key_timestamps([int_after + 1])[0]
+    dict_cleaned = {}
+    with _stage(dict_report, "store read") as dict_stage:
+        for str_source in store_sensors(dict_store):
+            str_mast, _, str_sensor = str_source.partition("/")
+            if str_mast in list_masts:
+                dict_cleaned[(str_mast, str_sensor)] = store_mast_frame(dict_store, str_source, start=start)
+                _count(dict_stage, rows_out=len(dict_cleaned[(str_mast, str_sensor)]))
+    return dict_cleaned, {key: pd.Series(dtype=np.int64) for key in dict_cleaned}
+
+
+def _stage(dict_report, str_name):
+    # Stage of the run report, or nothing without a report
+    return contextlib.nullcontext({}) if dict_report is None else stage(dict_report, str_name)
+
+
+def _count(dict_stage, rows_in=None, rows_out=None, rejected=None):
+    if dict_stage:
+        count_rows(dict_stage, rows_in, rows_out, rejected)
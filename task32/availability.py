@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Lidar data availability as a function of environmental parameters measured on the met mast.
+
+The rows of a frame holding a mast variable (ex.: temperature "Moyenne") and the
+lidar wind speed at the same timestamps are grouped in bins of the mast variable.
+A row is available when the lidar wind speed is not NaN.
+
+The availability of a bin can be given with a confidence interval from a block bootstrap
+(see bootstrap_availability): whole days are resampled, so that the autocorrelation of the
+10-minute records within a day is kept in each replicate.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from task32.align import TIME_STEP
+from task32.parallel import map_parallel
+
+# Blocks resampled by the bootstrap, and their length
+BOOTSTRAP_BLOCKS = {"day": pd.Timedelta("1D"), "week": pd.Timedelta("7D")}
+# Confidence level of the intervals of the bootstrap
+BOOTSTRAP_CONFIDENCE = 0.95
+# Number of replicates computed at once (one matrix product each)
+BOOTSTRAP_BATCH = 250
+# Minimum number of blocks with rows in a bin for its interval: with one block, every replicate is the same
+BOOTSTRAP_MIN_BLOCKS = 2
+
+
+def bin_edges(start, stop, step):
+    """
+    Return the edges of the bins (l, l+step] for l in range(start, stop, step).
+    Float steps are allowed (ex.: 0.5 degree bins).
+    """
+    array_left = np.arange(start, stop, step)
+    return np.append(array_left, array_left[-1] + step)
+
+
+def binned_statistics(df, columns, edges, lidar_column, labels=None):
+    """
+    Sufficient statistics of the lidar availability by bin of one or several mast variables.
+
+    columns is a column of df (ex.: "Moyenne") or a list of columns for 2-D (or more) grids,
+    edges the bin edges of the column (or a list with the edges of each column).
+    Bins are closed on the right: (edges[i], edges[i+1]].
+    labels are the names given to the columns in the result (columns by default).
+
+    Returns one row per non-empty bin, indexed by the flat position of the bin in the grid ("Bin"), with
+    "Number", "Available" (rows with lidar data), "[label] sum", "[label] sum2" (sum of squares)
+    and "Lidar sum". Statistics of several chunks of data add up: df_a.add(df_b, fill_value=0).
+    """
+    list_columns, list_edges, list_labels = _as_lists(columns, edges, labels)
+    array_flat, list_shape, array_valid = _bin_positions(df, list_columns, list_edges)
+    int_bins = int(np.prod(list_shape))
+    array_lidar = pd.to_numeric(df[lidar_column], errors="coerce").to_numpy(dtype=np.float64)[array_valid]
+
+    array_number = np.bincount(array_flat, minlength=int_bins)
+    array_used = np.flatnonzero(array_number)
+    dict_statistics = {"Number": array_number[array_used],
+                       "Available": np.bincount(array_flat, weights=~np.isnan(array_lidar), minlength=int_bins)[array_used]}
+    for str_column, str_label in zip(list_columns, list_labels):
+        array_values = df[str_column].to_numpy(dtype=np.float64)[array_valid]
+        dict_statistics[str_label + " sum"] = np.bincount(array_flat, weights=array_values, minlength=int_bins)[array_used]
+        dict_statistics[str_label + " sum2"] = np.bincount(array_flat, weights=array_values ** 2, minlength=int_bins)[array_used]
+    dict_statistics["Lidar sum"] = np.bincount(array_flat, weights=np.nan_to_num(array_lidar), minlength=int_bins)[array_used]
+    return pd.DataFrame(dict_statistics, index=pd.Index(array_used, name="Bin"))
+
+
+def availability_from_statistics(df_statistics, edges, labels):
+    """
+    Return the table of binned_availability from the sufficient statistics of binned_statistics
+    (edges and labels as given to binned_statistics, labels being required here).
+    """
+    list_labels, list_edges = ([labels], [edges]) if isinstance(labels, str) else (list(labels), list(edges))
+    df_statistics = df_statistics[df_statistics["Number"] > 0].sort_index()
+    array_used = df_statistics.index.to_numpy()
+    array_n = df_statistics["Number"].to_numpy(dtype=np.float64)
+    array_available = df_statistics["Available"].to_numpy(dtype=np.float64)
+
+    dict_result = {}
+    array_unravel = np.unravel_index(array_used, [len(array_edges) - 1 for array_edges in list_edges])
+    for str_label, array_edges, array_position in zip(list_labels, list_edges, array_unravel):
+        dict_result[str_label] = np.asarray(array_edges, dtype=np.float64)[array_position]
+    dict_result["Number"] = array_n.astype(np.int64)
+    dict_result["Available"] = array_available.astype(np.int64)
+    dict_result["Availability (%)"] = 100 * array_available / array_n
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for str_label in list_labels:
+            array_sum = df_statistics[str_label + " sum"].to_numpy()
+            array_variance = (df_statistics[str_label + " sum2"].to_numpy() - array_sum ** 2 / array_n) / (array_n - 1)
+            dict_result[str_label + " mean"] = array_sum / array_n
+            dict_result[str_label + " stdev"] = np.where(array_n > 1, np.maximum(array_variance, 0), np.nan) ** 0.5
+        dict_result["Lidar mean"] = np.where(array_available > 0, df_statistics["Lidar sum"].to_numpy() / array_available, np.nan)
+    return pd.DataFrame(dict_result, index=array_used)
+
+
+def binned_availability(df, columns, edges, lidar_column, labels=None, int_replicates=0,
+                        float_confidence=BOOTSTRAP_CONFIDENCE, str_block="day", int_seed=0, int_jobs=1):
+    """
+    Lidar availability by bin of one or several mast variables, in one vectorized pass
+    (columns, edges and labels as in binned_statistics).
+
+    Returns one row per non-empty bin, indexed by the position of the bin, with:
+        [label]           left edge of the bin of each column
+        "Number"          number of rows in the bin
+        "Available"       number of rows with lidar data
+        "Availability (%)"
+        "[label] mean", "[label] stdev" of each column in the bin
+        "Lidar mean"      mean of the lidar column in the bin
+    With int_replicates > 0, df being indexed by time keys (see task32.align.key_by_time), the table also has
+    the confidence interval of the availability, "Availability low (%)" and "Availability high (%)", and the
+    number of blocks of the bin, "Blocks" (see bootstrap_availability, with the other arguments).
+    """
+    list_columns, list_edges, list_labels = _as_lists(columns, edges, labels)
+    df_statistics = binned_statistics(df, list_columns, list_edges, lidar_column, list_labels)
+    df_table = availability_from_statistics(df_statistics, list_edges, list_labels)
+    if int_replicates > 0:
+        df_interval = bootstrap_availability(df, list_columns, list_edges, lidar_column, int_replicates,
+                                             float_confidence, str_block, int_seed, int_jobs)
+        df_table = df_table.join(df_interval)
+    return df_table
+
+
+def binned_availability_chunks(iter_frames, columns, edges, lidar_column, labels=None):
+    """
+    Same table as binned_availability, computed from an iterable of frames (ex.: cleaned chunks of
+    a CQ archive joined with the lidar data), so that only one chunk is in memory at a time.
+    """
+    list_columns, list_edges, list_labels = _as_lists(columns, edges, labels)
+    df_statistics = None
+    for df in iter_frames:
+        df_chunk = binned_statistics(df, list_columns, list_edges, lidar_column, list_labels)
+        df_statistics = df_chunk if df_statistics is None else df_statistics.add(df_chunk, fill_value=0)
+    if df_statistics is None:
+        raise ValueError("No data in iter_frames")
+    return availability_from_statistics(df_statistics, list_edges, list_labels)
+
+
+def block_counts(df, columns, edges, lidar_column, str_block="day"):
+    """
+    Return the number of rows and of rows with lidar data of each block of time (see BOOTSTRAP_BLOCKS)
+    in each bin of df, indexed by time keys: the flat positions of the non-empty bins (as in binned_statistics)
+    and two (blocks x bins) int64 matrices, the blocks without any row in the bins being left out.
+    """
+    list_columns, list_edges, _ = _as_lists(columns, edges, None)
+    array_flat, _, array_valid = _bin_positions(df, list_columns, list_edges)
+    int_steps = int(BOOTSTRAP_BLOCKS[str_block] // TIME_STEP)
+    array_blocks = np.floor_divide(df.index.to_numpy(dtype=np.int64)[array_valid], int_steps)
+    array_available = pd.to_numeric(df[lidar_column], errors="coerce").notna().to_numpy()[array_valid]
+    array_used, array_bin = np.unique(array_flat, return_inverse=True)
+    _, array_block = np.unique(array_blocks, return_inverse=True)
+    int_cells = (array_block.max() + 1 if len(array_block) else 0) * len(array_used)
+    array_cell = array_block * len(array_used) + array_bin
+    array_number = np.bincount(array_cell, minlength=int_cells).reshape(-1, len(array_used))
+    array_hits = np.bincount(array_cell[array_available], minlength=int_cells).reshape(-1, len(array_used))
+    return array_used, array_number, array_hits
+
+
+def bootstrap_availability(df, columns, edges, lidar_column, int_replicates=1000, float_confidence=BOOTSTRAP_CONFIDENCE,
+                           str_block="day", int_seed=0, int_jobs=1):
+    """
+    Confidence interval of the lidar availability of each bin of binned_availability, by a block bootstrap:
+    each replicate draws, with replacement, as many blocks of time (days by default) as df has, so the rows
+    of a block are always drawn together. df must be indexed by time keys (see task32.align.key_by_time).
+
+    A replicate is the product of the number of draws of each block with the (blocks x bins) counts of
+    block_counts: the replicates are computed by batches of BOOTSTRAP_BATCH as matrix products, the batches
+    being shared by int_jobs processes (int_jobs=1: in this process, see task32.parallel.map_parallel).
+    The result only depends on int_seed, not on int_jobs.
+
+    Returns a frame indexed by the position of the bins (as binned_availability) with "Availability low (%)"
+    and "Availability high (%)", the percentiles of the replicates at (1 - float_confidence) / 2 and
+    (1 + float_confidence) / 2, replicates where a bin has no row being ignored, and "Blocks", the number
+    of blocks with rows in the bin. The interval of a bin with less than BOOTSTRAP_MIN_BLOCKS blocks is NaN:
+    its rows are always drawn together, so the replicates cannot measure its variability.
+    """
+    array_used, array_number, array_hits = block_counts(df, columns, edges, lidar_column, str_block)
+    if len(array_used) == 0:
+        return pd.DataFrame({"Availability low (%)": [], "Availability high (%)": [],
+                             "Blocks": np.empty(0, dtype=np.int64)}, index=array_used)
+    list_sizes = [BOOTSTRAP_BATCH] * (int_replicates // BOOTSTRAP_BATCH)
+    if int_replicates % BOOTSTRAP_BATCH:
+        list_sizes.append(int_replicates % BOOTSTRAP_BATCH)
+    list_seeds = np.random.SeedSequence(int_seed).spawn(len(list_sizes))
+    list_batches = map_parallel(_bootstrap_batch, [(array_number, array_hits, int_size, seed)
+                                                   for int_size, seed in zip(list_sizes, list_seeds)], int_jobs)
+    array_replicates = np.concatenate(list_batches) if list_batches else np.empty((0, len(array_used)))
+    float_tail = 100 * (1 - float_confidence) / 2
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        # Bins without any row in all the replicates
+        warnings.simplefilter("ignore", RuntimeWarning)
+        array_low, array_high = np.nanpercentile(array_replicates, [float_tail, 100 - float_tail], axis=0)
+    array_blocks = (array_number > 0).sum(axis=0)
+    array_few = array_blocks < BOOTSTRAP_MIN_BLOCKS
+    array_low[array_few] = np.nan
+    array_high[array_few] = np.nan
+    return pd.DataFrame({"Availability low (%)": array_low, "Availability high (%)": array_high,
+                         "Blocks": array_blocks.astype(np.int64)}, index=array_used)
+
+
+def _bootstrap_batch(array_number, array_hits, int_size, seed):
+    # Availability (%) of each bin in int_size replicates: (replicates x blocks) draws @ (blocks x bins) counts
+    int_blocks = len(array_number)
+    random_generator = np.random.default_rng(seed)
+    array_draws = random_generator.multinomial(int_blocks, np.full(int_blocks, 1 / int_blocks), size=int_size)
+    array_replicate_number = array_draws @ array_number
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100 * (array_draws @ array_hits) / np.where(array_replicate_number > 0, array_replicate_number, np.nan)
+
+
+# Windows of availability_by_window
+AVAILABILITY_WINDOWS = ("hour_of_day", "day", "week", "month", "month_of_year", "year", "icing_season")
+# Months of the icing season (November to April), the season being named after its years (ex.: "2015-2016")
+ICING_SEASON_MONTHS = (11, 12, 1, 2, 3, 4)
+
+
+def window_labels(timestamps, str_window, tz=None, season_months=ICING_SEASON_MONTHS):
+    """
+    Return the window of each timestamp (tz-aware, or naive UTC), in local time of tz (UTC by default):
+        "hour_of_day"    hour (0 to 23)
+        "day", "week", "month", "year"
+                         pd.Period of the day, week (Monday to Sunday), month or year
+        "month_of_year"  month (1 to 12), all years together
+        "icing_season"   "[first year]-[second year]" of the season of season_months, None outside the season
+    """
+    index_time = pd.DatetimeIndex(timestamps)
+    if index_time.tz is None:
+        index_time = index_time.tz_localize("UTC")
+    index_local = index_time.tz_convert(tz or "UTC").tz_localize(None)
+    dict_periods = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+    if str_window in dict_periods:
+        return pd.Index(index_local.to_period(dict_periods[str_window]))
+    if str_window == "hour_of_day":
+        return pd.Index(index_local.hour)
+    if str_window == "month_of_year":
+        return pd.Index(index_local.month)
+    if str_window == "icing_season":
+        list_months = list(season_months)
+        array_month = index_local.month.to_numpy()
+        array_first_year = index_local.year.to_numpy() - (array_month < list_months[0])
+        array_labels = np.char.add(np.char.add(array_first_year.astype(str), "-"), (array_first_year + 1).astype(str))
+        return pd.Index(np.where(np.isin(array_month, list_months), array_labels.astype(object), None))
+    raise ValueError("str_window must be one of %s" % ", ".join(AVAILABILITY_WINDOWS))
+
+
+def availability_by_window(df_lidar, str_window, measurement="Wind Speed (m/s)", time_column="TimeObjectData",
+                           tz=None, season_months=ICING_SEASON_MONTHS, int_min_records=1):
+    """
+    Lidar data availability of measurement for every height and window (see window_labels), in one groupby pass.
+
+    df_lidar is either a tidy lidar frame indexed by ("Time", "Height") (see task32.lidar.load_lidar), or a lidar
+    frame as read from a file, with its timestamps in time_column and the measurement of each height in the
+    columns "[height]m [measurement]".
+    A record is available when the measurement is not NaN. Windows with less than int_min_records records
+    are dropped.
+
+    Returns a tidy dataframe with one row per height and window, sorted:
+        "Height" (int, m), "Window", "Number" (records), "Available" (records with data), "Availability (%)"
+    """
+    if isinstance(df_lidar.index, pd.MultiIndex) and "Height" in df_lidar.index.names:
+        index_time = df_lidar.index.get_level_values("Time")
+        array_heights = df_lidar.index.get_level_values("Height").to_numpy()
+        array_available = df_lidar[measurement].notna().to_numpy()
+    else:
+        str_suffix = "m " + measurement
+        list_columns = [c for c in df_lidar.columns if str(c).endswith(str_suffix) and str(c)[:-len(str_suffix)].isdigit()]
+        if not list_columns:
+            raise ValueError("No column '[height]m %s' in df_lidar" % measurement)
+        array_times = np.tile(pd.DatetimeIndex(df_lidar[time_column]).to_numpy(), len(list_columns))
+        index_time = pd.DatetimeIndex(array_times, tz=pd.DatetimeIndex(df_lidar[time_column]).tz)
+        array_heights = np.repeat([int(str(c)[:-len(str_suffix)]) for c in list_columns], len(df_lidar))
+        array_available = np.concatenate([df_lidar[c].notna().to_numpy() for c in list_columns])
+
+    index_window = window_labels(index_time, str_window, tz, season_months)
+    array_kept = pd.notna(index_window)
+    df_records = pd.DataFrame({"Height": array_heights[array_kept], "Window": index_window[array_kept],
+                               "Available": array_available[array_kept]})
+    df_table = df_records.groupby(["Height", "Window"], sort=True)["Available"].agg(["size", "sum"])
+    df_table = df_table.rename(columns={"size": "Number", "sum": "Available"}).astype(np.int64).reset_index()
+    df_table = df_table[df_table["Number"] >= int_min_records].reset_index(drop=True)
+    df_table["Availability (%)"] = 100 * df_table["Available"] / df_table["Number"]
+    return df_table
+
+
+def _as_lists(columns, edges, labels):
+    # Columns, edges and labels as lists, for one or several mast variables
+    list_columns = [columns] if isinstance(columns, str) else list(columns)
+    list_edges = [edges] if isinstance(columns, str) else list(edges)
+    list_labels = list_columns if labels is None else ([labels] if isinstance(labels, str) else list(labels))
+    return list_columns, list_edges, list_labels
+
+
+def _bin_positions(df, list_columns, list_edges):
+    # Flat position of the rows of df in the grid of bins, for the rows inside the grid,
+    # with the shape of the grid and the boolean array of the rows inside the grid
+    list_shape = []
+    list_bins = []
+    array_valid = np.ones(len(df), dtype=bool)
+    for str_column, array_edges in zip(list_columns, list_edges):
+        array_values = df[str_column].to_numpy(dtype=np.float64)
+        array_edges = np.asarray(array_edges, dtype=np.float64)
+        array_bin = np.searchsorted(array_edges, array_values, side="left") - 1
+        array_valid &= (array_bin >= 0) & (array_bin < len(array_edges) - 1) & ~np.isnan(array_values)
+        list_shape.append(len(array_edges) - 1)
+        list_bins.append(array_bin)
+    array_flat = np.ravel_multi_index([array_bin[array_valid] for array_bin in list_bins], list_shape)
+    return array_flat, list_shape, array_valid
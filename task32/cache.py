@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of the cleaned met mast (CQ) and lidar dataframes.
+
+A cleaned frame is saved in a Parquet file named after a key computed from:
+    - the content (sha256) of the source files
+    - the parameters of the cleaning (ex.: list of Quality Control codes)
+    - CACHE_VERSION, to increase each time the parsing or the cleaning changes
+A warm run only reads the Parquet file, and only the columns that are needed.
+
+Parquet needs the optional dependency pyarrow (or fastparquet). Without it,
+frames are rebuilt from the source files at each run.
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import warnings
+
+import pandas as pd
+
+# Directory where cached frames are saved
+CACHE_DIRECTORY = "./savedFiles/cache/"
+# Version of the parsing and cleaning code, part of every cache key. The code itself is not hashed:
+# increase it each time a change of the code changes the frames, else the stale frames are still read
+CACHE_VERSION = "3"
+
+
+def file_hash(str_path, int_block_size=1 << 20):
+    """Return the sha256 (hex) of the content of a file."""
+    hash_file = hashlib.sha256()
+    with open(str_path, "rb") as file:
+        for bytes_block in iter(lambda: file.read(int_block_size), b""):
+            hash_file.update(bytes_block)
+    return hash_file.hexdigest()
+
+
+def cache_key(list_paths, dict_params=None):
+    """
+    Return the cache key of the frame built from list_paths with the parameters dict_params.
+    The key depends on the content of the files, dict_params and CACHE_VERSION, not on the code building the frame.
+    """
+    dict_key = {"version": CACHE_VERSION,
+                "files": [file_hash(str_path) for str_path in list_paths],
+                "params": dict_params or {}}
+    return hashlib.sha256(json.dumps(dict_key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def parquet_available():
+    """Return True if pandas can read and write Parquet files."""
+    return any(importlib.util.find_spec(str_engine) is not None for str_engine in ("pyarrow", "fastparquet"))
+
+
+def cached_frame(list_paths, dict_params, function_build, columns=None, cache_directory=CACHE_DIRECTORY):
+    """
+    Return the frame built by function_build() from the files list_paths, and its information.
+
+    function_build() must return a dataframe and a dictionary of information
+    (JSON serializable, ex.: number of rows rejected by the Quality Control).
+    The result is read from cache_directory when a frame with the same key exists,
+    else it is built and saved. Only the columns in columns are returned (all by default).
+    Set cache_directory to None to disable the cache.
+    """
+    if cache_directory is None or not parquet_available():
+        if cache_directory is not None:
+            warnings.warn("pyarrow or fastparquet is needed for the cache, frames are rebuilt at each run")
+        df_built, dict_info = function_build()
+        return (df_built if columns is None else df_built[list(columns)]), dict_info
+
+    str_key = cache_key(list_paths, dict_params)
+    str_frame_path = os.path.join(cache_directory, str_key + ".parquet")
+    str_info_path = os.path.join(cache_directory, str_key + ".json")
+    if os.path.exists(str_frame_path) and os.path.exists(str_info_path):
+        with open(str_info_path) as file:
+            dict_info = json.load(file)["info"]
+        return pd.read_parquet(str_frame_path, columns=columns), dict_info
+
+    df_built, dict_info = function_build()
+    os.makedirs(cache_directory, exist_ok=True)
+    # Write to temporary files first, so that parallel runs never read a partial file
+    str_suffix = ".%d.tmp" % os.getpid()
+    df_built.to_parquet(str_frame_path + str_suffix)
+    with open(str_info_path + str_suffix, "w") as file:
+        json.dump({"sources": [os.path.abspath(p) for p in list_paths], "params": dict_params, "info": dict_info},
+                  file, indent=1, default=str)
+    os.replace(str_frame_path + str_suffix, str_frame_path)
+    os.replace(str_info_path + str_suffix, str_info_path)
+    return (df_built if columns is None else df_built[list(columns)]), dict_info
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Command line of the analyses of the scripts, for focused jobs started by a scheduler.
+
+    python -m task32 availability --years 2015-2017 --height 80 --jobs 4
+    python -m task32 correlation --years 2015 --heights 80 --sweep --output ./savedFiles/correlation/
+    python -m task32 store ./savedFiles/store/ --years 2015 --heights 80
+    python -m task32 availability --store ./savedFiles/store/
+
+Each command writes its tables (CSV) and figures in --output, and the report of the run (see
+task32.instrument) in --report. Only argparse is imported to parse the arguments: pandas is imported
+when a command runs, and matplotlib only when figures are requested.
+"""
+
+import argparse
+import os
+
+# Masts of the availability command and their CQ files (glob patterns)
+DEFAULT_AVAILABILITY_MASTS = {"MMV1": ["./metMastData/*80m*.csv"], "MMV2": ["./metMastData/*78m*.csv"]}
+# Temperature and relative humidity sensors of each mast of the availability command
+DEFAULT_AVAILABILITY_SENSORS = {"MMV1": ("TempUnHt80m0d", "RHHt80m0d"), "MMV2": ("TempUnHt78m174d", "RHUnHt78m174d")}
+# Masts of the correlation command: CQ files of the temperature, humidity, pressure and wind speed sensors
+DEFAULT_CORRELATION_MASTS = {"MMV1": ["./metMastData/*mmv1*Ht80m*.csv", "./metMastData/*mmv1*Baroh*.csv"]}
+# Masts of the store command: CQ files of all the sensors
+DEFAULT_STORE_MASTS = {"MMV1": ["./metMastData/mmv1_*.csv"], "MMV2": ["./metMastData/mmv2_*.csv"]}
+
+
+def parse_years(list_values):
+    """Return the years of list_values, each value being a year ("2015") or a range of years ("2015-2017")."""
+    list_years = []
+    for str_value in list_values:
+        str_first, _, str_last = str(str_value).partition("-")
+        list_years += list(range(int(str_first), int(str_last or str_first) + 1))
+    return list_years
+
+
+def parse_assignments(list_values, bool_list=False):
+    """
+    Return {name: value} from "name=value" strings. With bool_list, the values of a name given several times
+    are gathered in a list (ex.: two glob patterns of a mast).
+    """
+    dict_values = {}
+    for str_value in list_values:
+        str_name, str_sep, str_assigned = str_value.partition("=")
+        if not str_sep or not str_name or not str_assigned:
+            raise argparse.ArgumentTypeError("Expected name=value, not %r" % str_value)
+        if bool_list:
+            dict_values.setdefault(str_name, []).append(str_assigned)
+        else:
+            dict_values[str_name] = str_assigned
+    return dict_values
+
+
+def build_parser():
+    """Return the parser of the command line."""
+    parser = argparse.ArgumentParser(prog="python -m task32", description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_common = argparse.ArgumentParser(add_help=False)
+    parser_common.add_argument("--years", nargs="+", default=["2015"], help="years of lidar data, or ranges (2015-2017)")
+    parser_common.add_argument("--lidar-directory", default="./lidarData/", help="directory of the lidar files")
+    parser_common.add_argument("--sta", nargs="+", default=None, metavar="PATH", help="raw WindCube exports (.sta files, "
+                               "directories or glob patterns) read instead of the files of --lidar-directory")
+    parser_common.add_argument("--store", default=None, metavar="DIRECTORY", help="store of the mast and lidar data "
+                               "(see the store command) read instead of the CQ and lidar files, the masts being "
+                               "selected by their names only")
+    parser_common.add_argument("--codes", nargs="+", default=None, help="Quality Control codes rejecting a record "
+                               "(default: task32.qc.QC_CODES)")
+    parser_common.add_argument("--output", default="./savedFiles/", help="directory of the tables and figures")
+    parser_common.add_argument("--formats", nargs="+", default=["png"], choices=["png", "svg", "pdf"], help="formats of the figures")
+    parser_common.add_argument("--jobs", type=int, default=None, help="number of processes (default: one per core)")
+    parser_common.add_argument("--report", default=None, help="JSON report of the run (default: [output]/run_report_[command].json)")
+    parser_common.add_argument("--profile", default=None, help="file of the profile of the run (default: no profile)")
+    parser_common.add_argument("--profiler", default="cprofile", choices=["cprofile", "pyinstrument"])
+
+    parser_availability = subparsers.add_parser("availability", parents=[parser_common],
+                                                help="lidar availability by month and by bin of mast temperature and humidity")
+    parser_availability.add_argument("--height", type=int, default=80, help="lidar height joined with the masts (m)")
+    parser_availability.add_argument("--mast", action="append", default=None, metavar="NAME=PATTERN",
+                                     help="CQ files of a mast, repeat for several masts or patterns")
+    parser_availability.add_argument("--sensors", action="append", default=None, metavar="NAME=TEMP,RH",
+                                     help="temperature and relative humidity sensors of a mast (ex.: MMV1=TempUnHt80m0d,RHHt80m0d)")
+    parser_availability.add_argument("--temp-bin", type=float, default=1, help="width of the temperature bins (°C)")
+    parser_availability.add_argument("--rh-bin", type=float, default=1, help="width of the relative humidity bins (%%)")
+    parser_availability.add_argument("--min-records", type=int, default=144, help="minimum records of a month shown")
+    parser_availability.add_argument("--state", default=None, help="state file of the incremental mode")
+    parser_availability.add_argument("--bootstrap", type=int, default=0, metavar="REPLICATES",
+                                     help="replicates of the bootstrap of the days giving the confidence interval of "
+                                     "the availability of each bin (default: no interval)")
+    parser_availability.add_argument("--no-figures", action="store_true", help="only save the tables")
+
+    parser_correlation = subparsers.add_parser("correlation", parents=[parser_common],
+                                               help="icing rules scored against INFO01 and lidar vs mast wind speed statistics")
+    parser_correlation.add_argument("--heights", nargs="+", default=["80"], help="lidar heights (m)")
+    parser_correlation.add_argument("--mast", action="append", default=None, metavar="NAME=PATTERN",
+                                    help="CQ files of a mast, repeat for several masts or patterns")
+    parser_correlation.add_argument("--sweep", action="store_true", help="sweep the thresholds of the icing rule")
+    parser_correlation.add_argument("--persistence", nargs="+", type=int, default=[1],
+                                    help="persistences (10-minute steps) of the sweep")
+    parser_correlation.add_argument("--event-padding", default="2h",
+                                    help="padding of the icing events when counting the lidar outages overlapping them")
+    parser_correlation.add_argument("--variables", nargs="*", default=[], help="lidar variables plotted with the ice detected "
+                                    "(see task32.plotting.ICE_LIDAR_VARIABLES)")
+
+    parser_store = subparsers.add_parser("store", parents=[parser_common],
+                                         help="memory-mapped store of the mast and lidar data read by --store")
+    parser_store.add_argument("directory", help="directory of the store")
+    parser_store.add_argument("--heights", nargs="+", default=["80"], help="lidar heights (m)")
+    parser_store.add_argument("--mast", action="append", default=None, metavar="NAME=PATTERN",
+                              help="CQ files of a mast, repeat for several masts or patterns")
+    return parser
+
+
+def main(list_arguments=None):
+    """Run the command of list_arguments (sys.argv by default) and return its exit code."""
+    args = build_parser().parse_args(list_arguments)
+    from task32.instrument import new_report, print_report, start_profile, stop_profile, write_report
+
+    dict_report = new_report(args.command, {str_key: value for str_key, value in vars(args).items()})
+    tuple_profile = None if args.profile is None else start_profile(args.profiler)
+    if args.command == "availability":
+        run_availability(args, dict_report)
+    elif args.command == "store":
+        run_store(args, dict_report)
+    else:
+        run_correlation(args, dict_report)
+    if tuple_profile is not None:
+        stop_profile(tuple_profile, args.profile, dict_report)
+    write_report(dict_report, args.report or os.path.join(args.output, "run_report_%s.json" % args.command))
+    print_report(dict_report)
+    return 0
+
+
+def run_availability(args, dict_report):
+    """Run the analysis of ScriptTask32_LidarDataAvailability_MetMast_Nergica.py with the arguments args."""
+    from task32.analysis import (availability_by_mast, availability_figures, join_lidar, load_lidar_years, load_masts,
+                                 monthly_availability)
+    from task32.availability import bin_edges
+    from task32.incremental import last_key, load_state, save_state, update_start
+    from task32.instrument import count_rows, stage
+    from task32.qc import QC_CODES
+    from task32.store import open_store
+
+    list_years = parse_years(args.years)
+    dict_store = None if args.store is None else open_store(args.store)
+    dict_masts = DEFAULT_AVAILABILITY_MASTS if args.mast is None else parse_assignments(args.mast, bool_list=True)
+    dict_sensors = (DEFAULT_AVAILABILITY_SENSORS if args.sensors is None else
+                    {str_mast: tuple(str_sensors.split(",")) for str_mast, str_sensors in parse_assignments(args.sensors).items()})
+    dict_mast_sensors = {str_mast: {"temp": dict_sensors[str_mast][0], "RH": dict_sensors[str_mast][1]} for str_mast in dict_masts}
+    dict_state = None if args.state is None else load_state(args.state)
+    int_after = None if dict_state is None else update_start(dict_state)
+    os.makedirs(args.output, exist_ok=True)
+
+    df_lidar, df_lidar_keyed = load_lidar_years(args.lidar_directory, args.height, list_years, args.jobs,
+                                                dict_report=dict_report, list_sta=args.sta, int_after=int_after,
+                                                dict_store=dict_store)
+    df_by_month = monthly_availability(df_lidar, df_lidar_keyed, args.height, args.min_records, dict_state, dict_report)
+    dict_cleaned, _ = load_masts(dict_masts, QC_CODES if args.codes is None else args.codes, args.jobs,
+                                 dict_report=dict_report, bool_pack_flags=True, int_after=int_after,
+                                 dict_store=dict_store)
+    str_lidar_column = "Lidar %dm Wind Speed (m/s)" % args.height
+    dict_joined, _, dict_last_key = join_lidar(dict_cleaned, df_lidar_keyed,
+                                               {"%dm Wind Speed (m/s)" % args.height: str_lidar_column}, dict_report)
+    dict_tables = availability_by_mast(dict_joined, dict_mast_sensors, str_lidar_column,
+                                       {"temp": bin_edges(-25, 35, args.temp_bin), "RH": bin_edges(5, 100, args.rh_bin)},
+                                       None, dict_state, dict_last_key, last_key(df_lidar_keyed), dict_report,
+                                       args.bootstrap, args.jobs)
+    if dict_state is not None:
+        save_state(dict_state, args.state)
+
+    df_by_month.to_csv(os.path.join(args.output, "Lidar availability by month.csv"))
+    for str_label, dict_tables_masts in dict_tables.items():
+        for str_mast, df_table in dict_tables_masts.items():
+            df_table.to_csv(os.path.join(args.output, "Lidar availability by %s %s.csv" % (str_label, str_mast)), index=False)
+    if not args.no_figures:
+        from task32.plotting import export_figures
+        str_years = "-".join(sorted({str(list_years[0]), str(list_years[-1])}))
+        dict_legends = {str_mast: "%s, %s, %dm" % (str_years, str_mast, args.height) for str_mast in dict_masts}
+        list_figures = availability_figures(df_by_month, dict_tables, dict_legends)
+        with stage(dict_report, "plot") as dict_stage:
+            list_saved = export_figures(list_figures, args.output, args.formats, int_jobs=args.jobs)
+            count_rows(dict_stage, len(list_figures), len(list_saved))
+    return dict_tables
+
+
+def run_correlation(args, dict_report):
+    """
+    Run the analyses of ScriptTask32_CorrelationLidarMetMast_Nergica.py with the arguments args. The icing events
+    and the sweep of a mast without any step of ice detected are not written, with a warning.
+    """
+    import re
+    import warnings
+
+    import pandas as pd
+
+    from task32.analysis import load_lidar_years, load_masts
+    from task32.comparison import comparison_statistics, wind_speed_pairs
+    from task32.derived import add_derived_channels, load_conditions
+    from task32.events import icing_events, outage_events, overlap_statistics
+    from task32.icing import ICE_COLUMN, ICING_RULES, captor_conditions, measurement_heights, score_rules
+    from task32.ingest import find_mast_files
+    from task32.instrument import count_rows, stage
+    from task32.qc import QC_CODES
+    from task32.store import open_store
+    from task32.sweep import SWEEP_GRID, rule_grid, sweep_icing_rules
+
+    list_years = parse_years(args.years)
+    dict_masts = DEFAULT_CORRELATION_MASTS if args.mast is None else parse_assignments(args.mast, bool_list=True)
+    dict_store = None if args.store is None else open_store(args.store)
+    os.makedirs(args.output, exist_ok=True)
+
+    dict_lidar = {str(height): load_lidar_years(args.lidar_directory, height, list_years, args.jobs,
+                                                dict_report=dict_report, list_sta=args.sta, dict_store=dict_store)[0]
+                  for height in args.heights}
+    dict_cleaned, _ = load_masts(dict_masts, QC_CODES if args.codes is None else args.codes, args.jobs,
+                                 dict_report=dict_report, bool_pack_flags=True, dict_store=dict_store)
+    with stage(dict_report, "lidar outages") as dict_stage:
+        df_outages = pd.concat([outage_events(df_lidar) for df_lidar in dict_lidar.values()], ignore_index=True)
+        df_outages.to_csv(os.path.join(args.output, "Lidar outages.csv"), index=False)
+        count_rows(dict_stage, rows_out=len(df_outages))
+
+    list_comparisons = []
+    for str_mast in dict_masts:
+        dict_captors = {str_sensor: df for (str_mast_key, str_sensor), df in dict_cleaned.items() if str_mast_key == str_mast}
+        with stage(dict_report, "correlation %s" % str_mast) as dict_stage:
+            # Conditions with their derived channels (dew point, wet bulb, ...), cached with the cleaned frames
+            # (computed from the frames of the store with --store)
+            if dict_store is None:
+                df_conditions = load_conditions([str_path for _, str_path in find_mast_files({str_mast: dict_masts[str_mast]})],
+                                                QC_CODES if args.codes is None else args.codes)
+            else:
+                df_conditions = add_derived_channels(captor_conditions(dict_captors), measurement_heights(dict_captors))
+            df_scores = score_rules(df_conditions, ICING_RULES)
+            df_scores.to_csv(os.path.join(args.output, "Icing rules %s.csv" % str_mast))
+            count_rows(dict_stage, len(df_conditions), len(df_scores))
+        bool_iced = bool((df_conditions[ICE_COLUMN] == 1).any())
+        if not bool_iced:
+            warnings.warn("No ice detected on the captors of %s: its icing events and sweep are not written" % str_mast)
+        else:
+            with stage(dict_report, "icing events %s" % str_mast) as dict_stage:
+                df_icing = icing_events(df_conditions)
+                df_icing.to_csv(os.path.join(args.output, "Icing events %s.csv" % str_mast), index=False)
+                overlap_statistics(df_outages, df_icing, args.event_padding, by="Height").to_csv(
+                    os.path.join(args.output, "Lidar outages overlapping icing %s.csv" % str_mast))
+                count_rows(dict_stage, len(df_conditions), len(df_icing))
+        if args.sweep and bool_iced:
+            with stage(dict_report, "sweep %s" % str_mast) as dict_stage:
+                list_rules = rule_grid(SWEEP_GRID, args.persistence)
+                df_sweep = sweep_icing_rules(df_conditions, list_rules, args.jobs)
+                df_sweep.to_csv(os.path.join(args.output, "Icing rule sweep %s.csv" % str_mast))
+                count_rows(dict_stage, len(list_rules), len(df_sweep))
+        with stage(dict_report, "comparison %s" % str_mast) as dict_stage:
+            dict_anemometers = {"%s/%s" % (str_mast, str_sensor): (re.search(r"Ht(\d+)m", str_sensor).group(1), df)
+                                for str_sensor, df in dict_captors.items()
+                                if "WdSpd" in str_sensor and re.search(r"Ht(\d+)m", str_sensor)}
+            if any(str_height in dict_lidar for str_height, _ in dict_anemometers.values()):
+                df_pairs = wind_speed_pairs(dict_lidar, dict_anemometers)
+                list_comparisons.append(comparison_statistics(df_pairs, df_conditions))
+                count_rows(dict_stage, len(df_pairs), len(list_comparisons[-1]))
+    if list_comparisons:
+        pd.concat(list_comparisons).to_csv(os.path.join(args.output, "Wind speed comparison.csv"))
+
+    if args.variables:
+        from task32.plotting import render_ice_lidar_figures
+        with stage(dict_report, "plot") as dict_stage:
+            # Plotted dates are naive (UTC)
+            dict_ice_captors = {"%s/%s" % key: df.assign(TimeObjectData=df["Timestamp"].dt.tz_localize(None))
+                                for key, df in dict_cleaned.items()}
+            dict_lidar_naive = {str_height: df.assign(TimeObjectData=df["TimeObjectData"].dt.tz_localize(None))
+                                for str_height, df in dict_lidar.items()}
+            list_months = sorted({"%02d" % int_month for df in dict_lidar_naive.values()
+                                  for int_month in df["TimeObjectData"].dt.month.unique()})
+            list_saved = render_ice_lidar_figures(args.variables, list_months, dict_ice_captors, dict_lidar_naive,
+                                                  os.path.join(args.output, "iceLidar"), list_formats=args.formats,
+                                                  int_jobs=args.jobs, str_manifest="manifest.json")
+            count_rows(dict_stage, rows_out=len(list_saved))
+
+
+def run_store(args, dict_report):
+    """Build the store read by the --store option of the other commands with the arguments args."""
+    from task32.instrument import count_rows, stage
+    from task32.qc import QC_CODES
+    from task32.store import build_store
+
+    dict_masts = DEFAULT_STORE_MASTS if args.mast is None else parse_assignments(args.mast, bool_list=True)
+    with stage(dict_report, "store") as dict_stage:
+        dict_store = build_store(args.directory, dict_masts, args.lidar_directory, [int(h) for h in args.heights],
+                                 parse_years(args.years), QC_CODES if args.codes is None else args.codes)
+        count_rows(dict_stage, rows_out=dict_store["length"])
+    return dict_store
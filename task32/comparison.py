@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Comparison of the lidar wind speed with the wind speed of the cup anemometers of the met mast.
+
+The lidar and mast wind speeds are paired on their time keys for each height and anemometer
+(see wind_speed_pairs). The regression of the lidar on the mast (lidar = slope * mast + offset) and the
+error statistics of the lidar (bias, RMSE, MAE) are computed from sums over groups of pairs:
+all the pairs, by icing state (ice detected by the double anemometry, INFO01 of each anemometer) and by bin
+of temperature and relative humidity. The pairs are repeated once per split, so that the sums of every group of every
+height and anemometer are computed together by one np.bincount per sum.
+"""
+
+import numpy as np
+import pandas as pd
+
+from task32.align import TIME_KEY, key_by_time
+from task32.availability import bin_edges
+from task32.flags import FLAG_COLUMN, flag_values
+from task32.icing import ICE_COLUMN
+
+# Bins of the conditions (see task32.icing.align_conditions) of comparison_statistics: (l, l+step]
+COMPARISON_BINS = {"Temperature": bin_edges(-30, 30, 5), "Humidity": bin_edges(0, 100, 10)}
+# Groups of the icing state
+ICING_GROUPS = ("No ice", "Ice")
+# Columns of the table of comparison_statistics
+COMPARISON_COLUMNS = ["Number", "Slope", "Offset", "R2", "Bias", "RMSE", "MAE", "Lidar mean", "Mast mean"]
+
+
+def wind_speed_pairs(dict_lidar, dict_mast, measurement="Wind Speed (m/s)", column="Moyenne",
+                     time_column="TimeObjectData", info="INFO01"):
+    """
+    Pair the lidar and mast wind speeds on their time keys.
+
+    dict_lidar maps each lidar height (ex.: "80") to a cleaned lidar frame (with "[height]m [measurement]"
+    and the timestamps of time_column), dict_mast maps the name of each anemometer to (height, cleaned
+    CQ frame with a "Timestamp" column). Each anemometer is paired with the lidar at its height.
+    Returns a frame indexed by (TIME_KEY, "Height", "Sensor") with the "Lidar" and "Mast" wind speeds,
+    for the time keys where both are known, and the icing state of the anemometer (ICE_COLUMN, 1.0 when
+    its flag info is set, 0.0 otherwise, NaN for the anemometers whose frame has no such flag).
+    """
+    list_pairs = []
+    for str_sensor, (height, df_mast) in dict_mast.items():
+        str_height = str(height)
+        if str_height not in dict_lidar:
+            continue
+        df_lidar = dict_lidar[str_height]
+        series_lidar = key_by_time(pd.to_numeric(df_lidar["%sm %s" % (str_height, measurement)], errors="coerce"),
+                                   df_lidar[time_column])
+        bool_flagged = info in df_mast.columns or FLAG_COLUMN in df_mast.columns
+        df_keyed = key_by_time(pd.DataFrame(
+            {column: df_mast[column].to_numpy(),
+             ICE_COLUMN: flag_values(df_mast, info).astype(np.float64) if bool_flagged else np.nan},
+            index=df_mast.index), df_mast["Timestamp"])
+        series_lidar = series_lidar[~series_lidar.index.duplicated(keep="first")]
+        df_keyed = df_keyed[~df_keyed.index.duplicated(keep="first")]
+        array_lidar = series_lidar.reindex(df_keyed.index).to_numpy(dtype=np.float64)
+        array_mast = df_keyed[column].to_numpy(dtype=np.float64)
+        array_valid = ~(np.isnan(array_lidar) | np.isnan(array_mast))
+        array_keys = df_keyed.index.to_numpy()[array_valid]
+        list_pairs.append(pd.DataFrame(
+            {"Lidar": array_lidar[array_valid], "Mast": array_mast[array_valid],
+             ICE_COLUMN: df_keyed[ICE_COLUMN].to_numpy(dtype=np.float64)[array_valid]},
+            index=pd.MultiIndex.from_arrays([array_keys, np.full(len(array_keys), str_height, dtype=object),
+                                             np.full(len(array_keys), str_sensor, dtype=object)],
+                                            names=[TIME_KEY, "Height", "Sensor"])))
+    if not list_pairs:
+        raise ValueError("No anemometer of dict_mast has a lidar height in dict_lidar")
+    return pd.concat(list_pairs)
+
+
+def comparison_statistics(df_pairs, df_conditions=None, dict_bins=COMPARISON_BINS, ice_column=ICE_COLUMN):
+    """
+    Regression and error statistics of the lidar wind speed against the mast wind speed of df_pairs
+    (see wind_speed_pairs), for each height and anemometer.
+
+    The pairs are split by icing state ("Icing": "No ice", "Ice") with the ice_column of df_pairs, the icing
+    state of each anemometer, or else with the ice_column of df_conditions. With a frame of
+    task32.icing.align_conditions (indexed by time keys), the pairs are also split by bin (l, l+step] of each
+    measurement of dict_bins found in df_conditions ("(-5, 0]", ...). Without ice and conditions, only the
+    split "All" is computed.
+    Returns a frame indexed by ("Height", "Sensor", "Split", "Group") with the COMPARISON_COLUMNS:
+        "Number"          number of pairs
+        "Slope", "Offset", "R2"
+                          least squares regression lidar = slope * mast + offset
+        "Bias", "RMSE", "MAE"
+                          mean, root mean square and mean absolute lidar - mast difference
+        "Lidar mean", "Mast mean"
+    """
+    array_x = df_pairs["Mast"].to_numpy(dtype=np.float64)
+    array_y = df_pairs["Lidar"].to_numpy(dtype=np.float64)
+    array_pair, index_pairs = pd.MultiIndex.from_arrays([df_pairs.index.get_level_values("Height"),
+                                                         df_pairs.index.get_level_values("Sensor")]).factorize()
+
+    # Group of each pair in each split (-1 when the pair is in no group of the split)
+    list_splits = [("All", np.zeros(len(df_pairs), dtype=np.int64), ["All"])]
+    if ice_column in df_pairs:
+        array_ice = df_pairs[ice_column].to_numpy(dtype=np.float64)
+        list_splits.append(("Icing", np.where(np.isnan(array_ice), -1, array_ice == 1).astype(np.int64),
+                            list(ICING_GROUPS)))
+    if df_conditions is not None:
+        array_position = df_conditions.index.get_indexer(df_pairs.index.get_level_values(TIME_KEY))
+        array_found = array_position >= 0
+
+        def condition(str_column):
+            array_values = np.full(len(df_pairs), np.nan)
+            array_values[array_found] = df_conditions[str_column].to_numpy(dtype=np.float64)[array_position[array_found]]
+            return array_values
+
+        if ice_column in df_conditions and ice_column not in df_pairs:
+            array_ice = condition(ice_column)
+            list_splits.append(("Icing", np.where(np.isnan(array_ice), -1, array_ice == 1).astype(np.int64),
+                                list(ICING_GROUPS)))
+        for str_measurement, edges in dict_bins.items():
+            if str_measurement not in df_conditions:
+                continue
+            array_edges = np.asarray(edges, dtype=np.float64)
+            array_values = condition(str_measurement)
+            array_bin = np.searchsorted(array_edges, array_values, side="left") - 1
+            array_bin[np.isnan(array_values) | (array_bin < 0) | (array_bin >= len(array_edges) - 1)] = -1
+            list_splits.append((str_measurement, array_bin.astype(np.int64),
+                                ["(%g, %g]" % (array_edges[i], array_edges[i + 1]) for i in range(len(array_edges) - 1)]))
+
+    # Flat position of (pair, split, group) of every pair in every split, all the splits stacked
+    int_groups = sum(len(list_groups) for _, _, list_groups in list_splits)
+    list_flat, list_rows, int_offset = [], [], 0
+    for _, array_group, list_groups in list_splits:
+        array_used = np.flatnonzero(array_group >= 0)
+        list_flat.append(array_pair[array_used] * int_groups + int_offset + array_group[array_used])
+        list_rows.append(array_used)
+        int_offset += len(list_groups)
+    array_flat = np.concatenate(list_flat)
+    array_rows = np.concatenate(list_rows)
+    array_x, array_y = array_x[array_rows], array_y[array_rows]
+    array_difference = array_y - array_x
+
+    int_size = len(index_pairs) * int_groups
+    array_n = np.bincount(array_flat, minlength=int_size).astype(np.float64)
+    array_used = np.flatnonzero(array_n)
+    array_n = array_n[array_used]
+
+    def group_sum(array_weights):
+        return np.bincount(array_flat, weights=array_weights, minlength=int_size)[array_used]
+
+    array_sx, array_sy = group_sum(array_x), group_sum(array_y)
+    array_sxx = group_sum(array_x * array_x) - array_sx ** 2 / array_n
+    array_syy = group_sum(array_y * array_y) - array_sy ** 2 / array_n
+    array_sxy = group_sum(array_x * array_y) - array_sx * array_sy / array_n
+    with np.errstate(invalid="ignore", divide="ignore"):
+        array_defined = (array_n > 1) & (array_sxx > 0)
+        array_slope = np.where(array_defined, array_sxy / array_sxx, np.nan)
+        array_r2 = np.where(array_defined & (array_syy > 0), array_sxy ** 2 / (array_sxx * array_syy), np.nan)
+    dict_result = {"Number": array_n.astype(np.int64), "Slope": array_slope,
+                   "Offset": (array_sy - array_slope * array_sx) / array_n, "R2": array_r2,
+                   "Bias": group_sum(array_difference) / array_n,
+                   "RMSE": np.sqrt(group_sum(array_difference ** 2) / array_n),
+                   "MAE": group_sum(np.abs(array_difference)) / array_n,
+                   "Lidar mean": array_sy / array_n, "Mast mean": array_sx / array_n}
+
+    list_split_names = [str_split for str_split, _, list_groups in list_splits for _ in list_groups]
+    list_group_names = [str_group for _, _, list_groups in list_splits for str_group in list_groups]
+    array_pair_used, array_group_used = np.divmod(array_used, int_groups)
+    index_result = pd.MultiIndex.from_arrays(
+        [index_pairs.get_level_values(0)[array_pair_used], index_pairs.get_level_values(1)[array_pair_used],
+         np.asarray(list_split_names, dtype=object)[array_group_used],
+         np.asarray(list_group_names, dtype=object)[array_group_used]],
+        names=["Height", "Sensor", "Split", "Group"])
+    return pd.DataFrame(dict_result, index=index_result)[COMPARISON_COLUMNS]
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Meteorological channels derived from the pressure, temperature and relative humidity of the met mast,
+computed on the time grid of task32.icing.align_conditions with vectorized numpy only.
+
+The barometer is not at the height of the other sensors (ex.: "BarohPaHt10m0d" and "TempUnHt80m0d"),
+so its pressure is first brought to the height of the temperature sensor (hypsometric equation).
+The channels added to the conditions (see DERIVED_CHANNELS) are:
+    "Pressure at height"   pressure at the height of the temperature sensor (hPa)
+    "Vapour pressure"      partial pressure of the water vapour (hPa), the humidity being relative to water
+    "Dew point"            temperature of saturation over water (°C)
+    "Frost point"          temperature of saturation over ice (°C)
+    "Wet bulb"             psychrometric temperature over water (°C)
+    "Ice bulb"             psychrometric temperature over ice below 0 °C, the wet bulb above (°C)
+    "Air density"          density of the moist air (kg/m3)
+They can be used in the icing rules like the measurements (ex.: ("Ice bulb", "<", 0.0)) and as bins
+of the availability or comparison tables. load_conditions saves the conditions with their derived
+channels in the cache of the cleaned frames (see task32.cache), so that they are computed once.
+"""
+
+import numpy as np
+import pandas as pd
+
+from task32.cache import CACHE_DIRECTORY, cached_frame
+from task32.icing import MEASUREMENT_PATTERNS, captor_conditions, measurement_heights
+from task32.ingest import load_cleaned_cq
+from task32.qc import QC_CODES
+from task32.store import store_sensor_name
+
+# Channels added by derived_channels, in this order
+DERIVED_CHANNELS = ("Pressure at height", "Vapour pressure", "Dew point", "Frost point", "Wet bulb", "Ice bulb",
+                    "Air density")
+# Gravity (m/s2), gas constants of the dry air and of the water vapour (J/kg/K), 0 °C (K)
+GRAVITY = 9.80665
+GAS_CONSTANT_DRY = 287.05
+GAS_CONSTANT_VAPOUR = 461.5
+ZERO_CELSIUS = 273.15
+# Magnus coefficients (a hPa, b, c °C) of the saturation vapour pressure over water and ice (Alduchov and Eskridge, 1996)
+MAGNUS_COEFFICIENTS = {"water": (6.1094, 17.625, 243.04), "ice": (6.1121, 22.587, 273.86)}
+# Psychrometer coefficients (1/K) of a ventilated psychrometer over water and ice (WMO guide, 2018)
+PSYCHROMETER_COEFFICIENTS = {"water": 6.53e-4, "ice": 5.75e-4}
+# Number of bisections of the psychrometric temperatures (precision better than 1e-6 °C)
+_PSYCHROMETRIC_STEPS = 40
+
+
+def saturation_vapour_pressure(array_temperature, str_phase="water"):
+    """Return the saturation vapour pressure (hPa) at the temperatures (°C) over water or ice."""
+    float_a, float_b, float_c = MAGNUS_COEFFICIENTS[str_phase]
+    array_temperature = np.asarray(array_temperature, dtype=np.float64)
+    return float_a * np.exp(float_b * array_temperature / (float_c + array_temperature))
+
+
+def vapour_pressure(array_temperature, array_humidity):
+    """Return the vapour pressure (hPa) from the temperature (°C) and the relative humidity (%, relative to water)."""
+    return np.asarray(array_humidity, dtype=np.float64) / 100 * saturation_vapour_pressure(array_temperature)
+
+
+def saturation_temperature(array_vapour_pressure, str_phase="water"):
+    """Return the temperature (°C) where array_vapour_pressure (hPa) is saturating over water (dew point) or ice (frost point)."""
+    float_a, float_b, float_c = MAGNUS_COEFFICIENTS[str_phase]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        array_log = np.log(np.asarray(array_vapour_pressure, dtype=np.float64) / float_a)
+        return float_c * array_log / (float_b - array_log)
+
+
+def dew_point(array_temperature, array_humidity):
+    """Return the dew point (°C) from the temperature (°C) and the relative humidity (%), NaN for a dry air."""
+    return saturation_temperature(vapour_pressure(array_temperature, array_humidity), "water")
+
+
+def frost_point(array_temperature, array_humidity):
+    """Return the frost point (°C) from the temperature (°C) and the relative humidity (%, relative to water)."""
+    return saturation_temperature(vapour_pressure(array_temperature, array_humidity), "ice")
+
+
+def pressure_at_height(array_pressure, array_temperature, float_rise, array_vapour_pressure=None):
+    """
+    Return the pressure (hPa) float_rise metres above (below if negative) the barometer, the layer between
+    them being at the temperature (°C) given, and at its virtual temperature if array_vapour_pressure (hPa) is given.
+    """
+    array_pressure = np.asarray(array_pressure, dtype=np.float64)
+    array_kelvin = np.asarray(array_temperature, dtype=np.float64) + ZERO_CELSIUS
+    if array_vapour_pressure is not None:
+        array_kelvin = array_kelvin / (1 - np.asarray(array_vapour_pressure) / array_pressure
+                                       * (1 - GAS_CONSTANT_DRY / GAS_CONSTANT_VAPOUR))
+    return array_pressure * np.exp(-GRAVITY * float_rise / (GAS_CONSTANT_DRY * array_kelvin))
+
+
+def psychrometric_temperature(array_temperature, array_humidity, array_pressure, str_phase="water"):
+    """
+    Return the wet bulb (str_phase "water") or ice bulb ("ice") temperature (°C): the temperature Tw where
+        e = es(Tw) - A p (T - Tw)
+    e being the vapour pressure, es the saturation vapour pressure over the phase and A its psychrometer coefficient.
+    Tw is found by bisection between the saturation temperature and T, for all the steps at once.
+    """
+    array_temperature = np.asarray(array_temperature, dtype=np.float64)
+    array_pressure = np.asarray(array_pressure, dtype=np.float64)
+    array_vapour = vapour_pressure(array_temperature, array_humidity)
+    float_coefficient = PSYCHROMETER_COEFFICIENTS[str_phase]
+    # The saturation temperature is -inf for a dry air, the search is kept within 100 °C of T
+    array_low = np.fmax(np.fmin(saturation_temperature(array_vapour, str_phase), array_temperature), array_temperature - 100) - 1
+    array_high = array_temperature.copy()
+    for _ in range(_PSYCHROMETRIC_STEPS):
+        array_middle = (array_low + array_high) / 2
+        array_balance = (saturation_vapour_pressure(array_middle, str_phase)
+                         - float_coefficient * array_pressure * (array_temperature - array_middle) - array_vapour)
+        array_above = array_balance > 0
+        array_high = np.where(array_above, array_middle, array_high)
+        array_low = np.where(array_above, array_low, array_middle)
+    return np.where(np.isnan(array_vapour) | np.isnan(array_pressure), np.nan, (array_low + array_high) / 2)
+
+
+def air_density(array_pressure, array_temperature, array_humidity):
+    """Return the density (kg/m3) of the moist air from the pressure (hPa), temperature (°C) and relative humidity (%)."""
+    array_kelvin = np.asarray(array_temperature, dtype=np.float64) + ZERO_CELSIUS
+    array_vapour = vapour_pressure(array_temperature, array_humidity)
+    return 100 * ((np.asarray(array_pressure, dtype=np.float64) - array_vapour) / (GAS_CONSTANT_DRY * array_kelvin)
+                  + array_vapour / (GAS_CONSTANT_VAPOUR * array_kelvin))
+
+
+def derived_channels(df_conditions, dict_heights=None):
+    """
+    Return the DERIVED_CHANNELS of the "Pressure", "Temperature" and "Humidity" of df_conditions
+    (see task32.icing.align_conditions), on the same index. dict_heights gives the height (m) of the
+    captor of each measurement (see task32.icing.measurement_heights): the pressure is used as it is
+    when the height of the barometer or of the temperature sensor is unknown.
+    A channel is NaN where a measurement it needs is missing, or for all the steps when df_conditions
+    has no column of the measurement.
+    """
+    dict_heights = dict_heights or {}
+    array_temperature, array_humidity, array_pressure = (
+        df_conditions[str_measurement].to_numpy(dtype=np.float64) if str_measurement in df_conditions.columns
+        else np.full(len(df_conditions), np.nan) for str_measurement in ("Temperature", "Humidity", "Pressure"))
+    array_vapour = vapour_pressure(array_temperature, array_humidity)
+    if "Pressure" in dict_heights and "Temperature" in dict_heights:
+        array_pressure = pressure_at_height(array_pressure, array_temperature,
+                                            dict_heights["Temperature"] - dict_heights["Pressure"], array_vapour)
+
+    array_wet_bulb = psychrometric_temperature(array_temperature, array_humidity, array_pressure, "water")
+    array_ice_bulb = psychrometric_temperature(array_temperature, array_humidity, array_pressure, "ice")
+    dict_channels = {"Pressure at height": array_pressure,
+                     "Vapour pressure": array_vapour,
+                     "Dew point": saturation_temperature(array_vapour, "water"),
+                     "Frost point": saturation_temperature(array_vapour, "ice"),
+                     "Wet bulb": array_wet_bulb,
+                     "Ice bulb": np.where(array_wet_bulb > 0, array_wet_bulb, np.minimum(array_ice_bulb, 0)),
+                     "Air density": air_density(array_pressure, array_temperature, array_humidity)}
+    return pd.DataFrame(dict_channels, index=df_conditions.index)[list(DERIVED_CHANNELS)]
+
+
+def add_derived_channels(df_conditions, dict_heights=None):
+    """Return df_conditions with the columns of derived_channels added (replaced if they exist)."""
+    df_derived = derived_channels(df_conditions, dict_heights)
+    return pd.concat([df_conditions.drop(columns=list(df_derived.columns), errors="ignore"), df_derived], axis=1)
+
+
+def load_conditions(list_paths, list_codes=QC_CODES, dict_patterns=MEASUREMENT_PATTERNS, cache_directory=CACHE_DIRECTORY):
+    """
+    Return the conditions of the CQ files list_paths (files of one mast, the files of several years of a sensor
+    being concatenated, see task32.icing.captor_conditions: the ice is read in all the files) with their derived
+    channels (see add_derived_channels).
+    The frame is read from the cache when the files, the codes and the patterns did not change (a change of the
+    code building it needs a new task32.cache.CACHE_VERSION).
+    """
+    list_paths = sorted(list_paths)
+
+    def function_build():
+        dict_frames = {}
+        for str_path in list_paths:
+            df_cleaned, _ = load_cleaned_cq(str_path, list_codes, None, cache_directory, bool_pack_flags=True)
+            dict_frames.setdefault(store_sensor_name(str_path), []).append(df_cleaned)
+        dict_frames = {str_sensor: list_frames[0] if len(list_frames) == 1 else
+                       pd.concat(list_frames, ignore_index=True).sort_values("Timestamp", kind="stable", ignore_index=True)
+                       for str_sensor, list_frames in dict_frames.items()}
+        dict_heights = measurement_heights(dict_frames, dict_patterns)
+        df_conditions = add_derived_channels(captor_conditions(dict_frames, dict_patterns), dict_heights)
+        return df_conditions, {"heights": dict_heights}
+
+    df_conditions, _ = cached_frame(list_paths, {"frame": "conditions", "codes": sorted(list_codes),
+                                                 "patterns": dict_patterns, "channels": list(DERIVED_CHANNELS)},
+                                    function_build, None, cache_directory)
+    return df_conditions
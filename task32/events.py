@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Events of consecutive 10-minute steps: icing episodes (ice detected by the double anemometry, INFO01)
+and lidar outages (no wind speed), and the overlap of two tables of events.
+
+A flag over a continuous grid of time keys (see task32.align) is run-length encoded: each run of
+consecutive flagged steps is an event. Flags of several heights are encoded together, as the rows of
+one 2-D array, so that the events of all the heights and years come from one vectorized pass.
+An event table has one row per event with:
+    "Start", "End"            timestamps (tz-aware, UTC) of the start of the first step and of the end of the last one
+    "Steps", "Duration"       number of 10-minute steps, and as a timedelta
+    "Start key", "Stop key"   time keys of the first step and after the last step
+and the columns of the rows of the flags (ex.: "Height") and the conditions during the event (see event_conditions).
+
+The overlap queries (see overlap_statistics) use an interval index: the union of the events of a table,
+padded and merged into sorted disjoint intervals, searched with np.searchsorted for every event at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+from task32.align import TIME_STEP, key_by_time, key_timestamps
+from task32.icing import ICE_COLUMN
+
+# Statistics of each condition during an event (see event_conditions)
+EVENT_STATISTICS = ("min", "max", "mean")
+
+
+def run_lengths(mask):
+    """
+    Return the (rows, starts, stops) of the runs of True of a 1-D or 2-D boolean array, stops being exclusive
+    positions along the last axis and rows the row of each run (0 for a 1-D array), in row then time order.
+    """
+    array_mask = np.atleast_2d(np.asarray(mask, dtype=bool))
+    int_rows, int_length = array_mask.shape
+    # A False step before and after each row, so that runs never cross two rows
+    array_padded = np.zeros((int_rows, int_length + 2), dtype=np.int8)
+    array_padded[:, 1:-1] = array_mask
+    array_change = np.diff(array_padded.ravel())
+    array_start = np.flatnonzero(array_change == 1)
+    array_stop = np.flatnonzero(array_change == -1)
+    array_row = array_start // (int_length + 2)
+    return array_row, array_start % (int_length + 2), array_stop % (int_length + 2)
+
+
+def flag_events(array_keys, mask, dict_rows=None, int_max_gap=0, int_min_steps=1):
+    """
+    Return the table of the events of mask, a boolean array (or 2-D array, one row per series) over the
+    continuous grid of time keys array_keys.
+
+    dict_rows gives columns describing each row of a 2-D mask (ex.: {"Height": [80, 100]}).
+    Events separated by int_max_gap steps or less are merged, events shorter than int_min_steps are dropped.
+    """
+    array_keys = np.asarray(array_keys, dtype=np.int64)
+    if len(array_keys) > 1 and np.any(np.diff(array_keys) != 1):
+        raise ValueError("array_keys must be a continuous grid of time keys")
+    array_row, array_start, array_stop = run_lengths(mask)
+    if int_max_gap > 0 and len(array_start) > 1:
+        # A run starts a new event when it is on another row or after a gap longer than int_max_gap
+        array_new = np.concatenate([[True], (array_row[1:] != array_row[:-1]) | (array_start[1:] - array_stop[:-1] > int_max_gap)])
+        array_first = np.flatnonzero(array_new)
+        array_last = np.append(array_first[1:], len(array_start)) - 1
+        array_row, array_start, array_stop = array_row[array_first], array_start[array_first], array_stop[array_last]
+    array_kept = array_stop - array_start >= int_min_steps
+    array_row, array_start, array_stop = array_row[array_kept], array_start[array_kept], array_stop[array_kept]
+
+    int_first = int(array_keys[0]) if len(array_keys) else 0
+    array_start_key = int_first + array_start
+    array_stop_key = int_first + array_stop
+    df_events = pd.DataFrame({str_column: np.asarray(values)[array_row] for str_column, values in (dict_rows or {}).items()})
+    df_events["Start"] = key_timestamps(array_start_key)
+    df_events["End"] = key_timestamps(array_stop_key)
+    df_events["Steps"] = array_stop - array_start
+    df_events["Duration"] = df_events["Steps"] * TIME_STEP
+    df_events["Start key"] = array_start_key
+    df_events["Stop key"] = array_stop_key
+    return df_events
+
+
+def event_conditions(df_events, df_conditions, columns=None, statistics=EVENT_STATISTICS):
+    """
+    Add to df_events the statistics ("min", "max" and/or "mean", NaN ignored) of the columns of df_conditions
+    during each event: "[column] min", ... df_conditions is indexed by a continuous grid of time keys
+    (see task32.icing.align_conditions), the steps of the events outside the grid being ignored.
+    """
+    list_columns = [c for c in df_conditions.columns if c != ICE_COLUMN] if columns is None else list(columns)
+    df_events = df_events.copy()
+    int_first, int_length = int(df_conditions.index[0]), len(df_conditions)
+    array_start = np.clip(df_events["Start key"].to_numpy() - int_first, 0, int_length)
+    array_stop = np.clip(df_events["Stop key"].to_numpy() - int_first, 0, int_length)
+    array_empty = array_stop <= array_start
+    # reduceat over the pairs (start, stop): the reductions of the even positions are the events
+    array_bounds = np.minimum(np.column_stack([array_start, np.maximum(array_stop, array_start + 1)]).ravel(), int_length)
+    for str_column in list_columns:
+        array_values = np.append(df_conditions[str_column].to_numpy(dtype=np.float64), np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for str_statistic in statistics:
+                if str_statistic == "mean":
+                    array_known = ~np.isnan(array_values)
+                    array_sum = np.add.reduceat(np.where(array_known, array_values, 0), array_bounds)[::2]
+                    array_result = array_sum / np.add.reduceat(array_known.astype(np.int64), array_bounds)[::2]
+                else:
+                    array_result = {"min": np.fmin, "max": np.fmax}[str_statistic].reduceat(array_values, array_bounds)[::2]
+                df_events["%s %s" % (str_column, str_statistic)] = np.where(array_empty, np.nan, array_result)
+    return df_events
+
+
+def icing_events(df_conditions, int_max_gap=0, int_min_steps=1, columns=None, ice_column=ICE_COLUMN):
+    """
+    Return the icing events of a frame of task32.icing.align_conditions (ice detected, ice_column == 1),
+    with the statistics of the measurements during each event (see event_conditions).
+    """
+    df_events = flag_events(df_conditions.index.to_numpy(), df_conditions[ice_column].to_numpy() == 1,
+                            int_max_gap=int_max_gap, int_min_steps=int_min_steps)
+    return event_conditions(df_events, df_conditions, columns)
+
+
+def outage_events(df_lidar, measurement="Wind Speed (m/s)", time_column="TimeObjectData", int_max_gap=0, int_min_steps=1):
+    """
+    Return the lidar outages of every height: the runs of steps without measurement (NaN, or no record),
+    from the first to the last record of df_lidar, with a "Height" column (int, m).
+
+    df_lidar is either a tidy lidar frame indexed by ("Time", "Height") (see task32.lidar.load_lidar), or a lidar
+    frame as read from a file, with its timestamps in time_column and the measurement of each height in the
+    columns "[height]m [measurement]".
+    """
+    if isinstance(df_lidar.index, pd.MultiIndex) and "Height" in df_lidar.index.names:
+        df_wide = df_lidar[measurement].unstack("Height")
+        list_heights = [int(h) for h in df_wide.columns]
+        df_keyed = key_by_time(df_wide, df_wide.index)
+    else:
+        str_suffix = "m " + measurement
+        list_columns = [c for c in df_lidar.columns if str(c).endswith(str_suffix) and str(c)[:-len(str_suffix)].isdigit()]
+        if not list_columns:
+            raise ValueError("No column '[height]m %s' in df_lidar" % measurement)
+        list_heights = [int(str(c)[:-len(str_suffix)]) for c in list_columns]
+        df_keyed = key_by_time(df_lidar[list_columns], df_lidar[time_column])
+    df_keyed = df_keyed[~df_keyed.index.duplicated(keep="first")]
+    array_keys = np.arange(df_keyed.index.min(), df_keyed.index.max() + 1, dtype=np.int64)
+    # (heights x grid) mask: True where the measurement is missing
+    array_missing = np.ones((len(list_heights), len(array_keys)), dtype=bool)
+    array_missing[:, df_keyed.index.to_numpy() - array_keys[0]] = np.isnan(df_keyed.to_numpy(dtype=np.float64)).T
+    return flag_events(array_keys, array_missing, {"Height": list_heights}, int_max_gap, int_min_steps)
+
+
+def interval_index(df_events, padding="0min"):
+    """
+    Return the interval index of df_events: the union of its events, each one extended by padding
+    (timedelta, rounded up to whole steps) on both sides, as sorted disjoint intervals of time keys
+    {"starts", "stops" (exclusive), "covered" (steps covered before each interval)}.
+    """
+    int_padding = int(np.ceil(pd.Timedelta(padding) / TIME_STEP))
+    array_start = df_events["Start key"].to_numpy(dtype=np.int64) - int_padding
+    array_stop = df_events["Stop key"].to_numpy(dtype=np.int64) + int_padding
+    array_order = np.argsort(array_start, kind="stable")
+    array_start, array_stop = array_start[array_order], array_stop[array_order]
+    # An interval starts a new disjoint interval when it starts after the end of all the previous ones
+    array_reach = np.maximum.accumulate(array_stop) if len(array_stop) else array_stop
+    array_first = np.flatnonzero(np.concatenate([[True], array_start[1:] > array_reach[:-1]])[:len(array_start)])
+    array_starts = array_start[array_first]
+    array_stops = array_reach[np.append(array_first[1:], len(array_start))[:len(array_first)] - 1]
+    array_lengths = array_stops - array_starts
+    return {"starts": array_starts, "stops": array_stops, "covered": np.cumsum(array_lengths) - array_lengths}
+
+
+def covered_steps(dict_index, array_keys):
+    """Return the number of steps of the interval index before each time key of array_keys."""
+    array_keys = np.asarray(array_keys, dtype=np.int64)
+    if len(dict_index["starts"]) == 0:
+        return np.zeros(len(array_keys), dtype=np.int64)
+    array_position = np.searchsorted(dict_index["starts"], array_keys, side="right") - 1
+    array_inside = np.where(array_position >= 0,
+                            np.minimum(array_keys, dict_index["stops"][np.maximum(array_position, 0)])
+                            - dict_index["starts"][np.maximum(array_position, 0)], 0)
+    return np.where(array_position >= 0, dict_index["covered"][np.maximum(array_position, 0)] + array_inside, 0)
+
+
+def overlap_steps(df_events, dict_index):
+    """Return the number of steps of each event of df_events inside the intervals of dict_index (see interval_index)."""
+    return (covered_steps(dict_index, df_events["Stop key"].to_numpy())
+            - covered_steps(dict_index, df_events["Start key"].to_numpy()))
+
+
+def overlap_statistics(df_events, df_other, padding="0min", by=None):
+    """
+    Overlap of the events of df_events (ex.: lidar outages) with the events of df_other (ex.: icing events)
+    extended by padding on both sides (ex.: "2h"), for all the events or for each group of the columns by
+    (ex.: "Height"). Returns a frame with:
+        "Events", "Overlapping"       number of events, and of events overlapping an event of df_other
+        "Events (%)"                  percentage of the events overlapping
+        "Steps", "Steps overlapping"  steps of the events, and steps inside the (padded) events of df_other
+        "Steps (%)"                   percentage of the steps overlapping
+    """
+    dict_index = interval_index(df_other, padding)
+    array_overlap = overlap_steps(df_events, dict_index)
+    df_overlap = pd.DataFrame({"Events": 1, "Overlapping": (array_overlap > 0).astype(np.int64),
+                               "Steps": df_events["Steps"].to_numpy(), "Steps overlapping": array_overlap},
+                              index=df_events.index)
+    if by is None:
+        df_table = df_overlap.sum().to_frame("All").T
+    else:
+        df_table = df_overlap.groupby([df_events[c] for c in ([by] if isinstance(by, str) else by)]).sum()
+    df_table.insert(2, "Events (%)", 100 * df_table["Overlapping"] / df_table["Events"])
+    df_table["Steps (%)"] = 100 * df_table["Steps overlapping"] / df_table["Steps"]
+    return df_table
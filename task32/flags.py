@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Flags of the CQ files packed in one integer per row.
+
+A CQ file has 32 columns of flags set to 0 or 1: "Tous", the codes of the Quality Control
+(R101, ..., R403, R701) and the INFO codes (INFO01, ... INFO26). Read as they are, they take
+256 bytes per row (int64). Packed, each flag is a bit of a single uint32 column FLAG_COLUMN
+(bit i for FLAG_CODES[i]), 4 bytes per row, and any test on a set of codes is done with one
+bitwise operation on the column, whatever the number of codes:
+    any_of     at least one of the codes is set        (flags & mask) != 0
+    all_of     all the codes are set                   (flags & mask) == mask
+    none_of    none of the codes is set                (flags & mask) == 0
+A query combines the three (ex.: {"all_of": ["INFO01"], "none_of": ["R104"]}), or is written as a
+string of terms joined by "and": "INFO01 and not R104", "any(R101, R103, R104) and not INFO01".
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Flags of the CQ files, in the order of their columns: bit i of the packed column is FLAG_CODES[i]
+FLAG_CODES = (("Tous", "R101", "R103", "R104", "R105", "R201", "R202", "R203", "R204", "R205", "R206",
+               "R301", "R303", "R304", "R401", "R403")
+              + tuple("INFO%02d" % i for i in (1, 2, 3, 4, 5, 6, 7, 8, 9, 20, 21, 22, 23, 25, 26))
+              + ("R701",))
+# Type and name of the packed column
+FLAG_DTYPE = np.uint32
+FLAG_COLUMN = "Flags"
+# Bit of each flag
+FLAG_BITS = {str_code: FLAG_DTYPE(1 << int_bit) for int_bit, str_code in enumerate(FLAG_CODES)}
+# Terms of a query written as a string
+_PATTERN_ANY = re.compile(r"^any\s*\((.*)\)$")
+_PATTERN_NOT = re.compile(r"^not\s+(\w+)$")
+
+
+def flag_mask(codes):
+    """Return the mask (uint32) of the bits of codes, a ValueError being raised for an unknown code."""
+    int_mask = 0
+    for str_code in [codes] if isinstance(codes, str) else codes:
+        if str_code not in FLAG_BITS:
+            raise ValueError("Unknown flag %r, expected one of %s" % (str_code, ", ".join(FLAG_CODES)))
+        int_mask |= int(FLAG_BITS[str_code])
+    return FLAG_DTYPE(int_mask)
+
+
+def pack_flags(df_captor, codes=FLAG_CODES):
+    """Return the flags of the columns of df_captor named in codes (the others are 0) packed in a uint32 array."""
+    array_flags = np.zeros(len(df_captor), dtype=FLAG_DTYPE)
+    for str_code in codes:
+        if str_code in df_captor.columns:
+            array_flags |= np.where(df_captor[str_code].to_numpy() == 1, FLAG_BITS[str_code], FLAG_DTYPE(0))
+    return array_flags
+
+
+def pack_frame(df_captor):
+    """Return df_captor with its flag columns replaced by their packed column FLAG_COLUMN."""
+    list_flags = [str_column for str_column in df_captor.columns if str_column in FLAG_BITS]
+    df_packed = df_captor.drop(columns=list_flags)
+    df_packed[FLAG_COLUMN] = pack_flags(df_captor, list_flags)
+    return df_packed
+
+
+def unpack_flags(array_flags, codes=FLAG_CODES):
+    """Return a frame with a uint8 column (0 or 1) per code of codes from the packed flags array_flags."""
+    array_flags = np.asarray(array_flags, dtype=FLAG_DTYPE)
+    return pd.DataFrame({str_code: ((array_flags & flag_mask(str_code)) != 0).astype(np.uint8) for str_code in codes})
+
+
+def parse_flag_query(str_query):
+    """
+    Return the query (see query_flags) written in str_query: terms joined by "and", each term being
+    a code ("INFO01"), a code not set ("not R104") or a set of codes of which one at least is set
+    ("any(R101, R103)", a single "any" term per query).
+    """
+    dict_query = {"any_of": [], "all_of": [], "none_of": []}
+    for str_term in re.split(r"\s+and\s+", str_query.strip()):
+        match_any = _PATTERN_ANY.match(str_term)
+        match_not = _PATTERN_NOT.match(str_term)
+        if match_any:
+            if dict_query["any_of"]:
+                raise ValueError("Only one any(...) term is allowed in %r" % str_query)
+            dict_query["any_of"] = [s.strip() for s in match_any.group(1).split(",") if s.strip()]
+        elif match_not:
+            dict_query["none_of"].append(match_not.group(1))
+        elif re.match(r"^\w+$", str_term):
+            dict_query["all_of"].append(str_term)
+        else:
+            raise ValueError("Cannot parse the term %r of %r" % (str_term, str_query))
+    return dict_query
+
+
+def query_flags(array_flags, query):
+    """
+    Return the boolean array of the packed flags array_flags matching query, a string (see parse_flag_query)
+    or a dictionary with the lists of codes "any_of", "all_of" and "none_of" (each one optional).
+    All the codes of "all_of" and "none_of" are tested with one comparison, those of "any_of" with another one.
+    """
+    dict_query = parse_flag_query(query) if isinstance(query, str) else query
+    array_flags = np.asarray(array_flags, dtype=FLAG_DTYPE)
+    int_all = flag_mask(dict_query.get("all_of", ()))
+    int_tested = int_all | flag_mask(dict_query.get("none_of", ()))
+    array_match = (array_flags & int_tested) == int_all
+    if dict_query.get("any_of"):
+        array_match &= (array_flags & flag_mask(dict_query["any_of"])) != 0
+    return array_match
+
+
+def flag_values(df_captor, str_code):
+    """
+    Return the boolean array of the rows of df_captor where the flag str_code is set, read from its
+    column, or from the packed column FLAG_COLUMN (see pack_frame) when df_captor has no such column.
+    """
+    if str_code in df_captor.columns:
+        return df_captor[str_code].to_numpy() == 1
+    if FLAG_COLUMN in df_captor.columns:
+        return (df_captor[FLAG_COLUMN].to_numpy() & flag_mask(str_code)) != 0
+    raise KeyError("%r is neither a column of the frame nor packed in %r" % (str_code, FLAG_COLUMN))
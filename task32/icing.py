@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Detection of icing conditions from the met mast measurements, scored against the ice detected
+by the double anemometry of the Quality Control (INFO01).
+
+The measurements (ex.: temperature, relative humidity, pressure) are aligned on a continuous
+10-minute time grid with the ice detected on any captor of the mast (see captor_conditions: the double
+anemometry flags the wind speed captors, not the captors of the measurements). A rule is a dictionary:
+    "name"         name of the rule
+    "conditions"   list of (measurement, operator, threshold), operator in "<", "<=", ">", ">="
+                   (ex.: ("Humidity", ">", 90)), all the conditions must be true
+    "persistence"  optional, number of consecutive 10-minute steps the conditions must hold (1 by default)
+A rule gives a boolean mask over the time grid, computed with vectorized operations only,
+so that hundreds of rules can be scored in a few seconds (see score_rules).
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from task32.align import TIME_KEY, TIME_STEP, key_by_time, key_timestamps, time_keys
+from task32.flags import flag_values
+
+# Rule of the correlation test of the script: humidity over 90 %, temperature between -5 and 5 °C,
+# pressure under 980 hPa
+ICING_RULES = [{"name": "RH>90, -5<T<5, P<980",
+                "conditions": [("Humidity", ">", 90.0), ("Temperature", ">", -5.0), ("Temperature", "<", 5.0),
+                               ("Pressure", "<", 980.0)],
+                "persistence": 1}]
+# Name of the column of the ice detected in the frame of align_conditions
+ICE_COLUMN = "Ice"
+# Part of the name of the CQ captors of each measurement (ex.: "TempUnHt80m0d_2")
+MEASUREMENT_PATTERNS = {"Pressure": "Baroh", "Temperature": "Temp", "Humidity": "RHH"}
+# Height of a captor in its name (ex.: "TempUnHt80m0d")
+_PATTERN_HEIGHT = re.compile(r"Ht(\d+)m")
+# Comparison of each operator of the conditions
+_DICT_OPERATORS = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}
+
+
+def align_conditions(dict_frames, column="Moyenne", info="INFO01", dict_ice_frames=None):
+    """
+    Align the measurements of several cleaned CQ frames on a continuous grid of time keys.
+
+    dict_frames maps the name of each measurement (ex.: "Temperature") to its cleaned CQ frame
+    (with a tz-aware "Timestamp" column, see task32.ingest.load_cleaned_cq), its flags in columns or packed.
+    The ice is read in the frames of dict_ice_frames (ex.: all the captors of the mast, see captor_conditions),
+    those of dict_frames by default.
+    Returns a frame indexed by every time key from the first to the last record of the frames, with
+    a column per measurement (values of column, NaN where the record is missing or was rejected) and the
+    column ICE_COLUMN: 1.0 when info is set in any frame of the ice for the time key, 0.0 when it is set
+    in none, NaN when no frame of the ice has a record.
+    """
+    dict_ice_frames = dict_frames if dict_ice_frames is None else dict_ice_frames
+    dict_keyed = {}
+    for str_name, df_captor in dict_frames.items():
+        df_keyed = key_by_time(pd.DataFrame({column: df_captor[column].to_numpy()}, index=df_captor.index),
+                               df_captor["Timestamp"])
+        dict_keyed[str_name] = df_keyed[~df_keyed.index.duplicated(keep="first")]
+    list_ice = [(time_keys(df_captor["Timestamp"]), flag_values(df_captor, info))
+                for df_captor in dict_ice_frames.values() if len(df_captor)]
+    list_keys = [df.index.to_numpy() for df in dict_keyed.values() if len(df)] + [array_keys for array_keys, _ in list_ice]
+    if not list_keys:
+        raise ValueError("dict_frames has no record")
+    int_first = min(int(array_keys.min()) for array_keys in list_keys)
+    int_last = max(int(array_keys.max()) for array_keys in list_keys)
+    index_grid = pd.Index(np.arange(int_first, int_last + 1, dtype=np.int64), name=TIME_KEY)
+
+    df_conditions = pd.DataFrame(index=index_grid)
+    for str_name, df_keyed in dict_keyed.items():
+        array_values = np.full(len(index_grid), np.nan)
+        array_values[(df_keyed.index.to_numpy() - int_first).astype(np.int64)] = df_keyed[column].to_numpy(dtype=np.float64)
+        df_conditions[str_name] = array_values
+    # Every record of the ice counts, a time key recorded twice being iced if one of its records is
+    array_ice = np.full(len(index_grid), np.nan)
+    for array_keys, array_flag in list_ice:
+        np.fmax.at(array_ice, (array_keys - int_first).astype(np.int64), array_flag.astype(np.float64))
+    df_conditions[ICE_COLUMN] = array_ice
+    return df_conditions
+
+
+def captor_conditions(dict_captors, dict_patterns=MEASUREMENT_PATTERNS, column="Moyenne", info="INFO01",
+                      dict_chosen=None):
+    """
+    Return the frame of align_conditions of the measurements of dict_captors (cleaned CQ frames of a mast keyed
+    by captor name) chosen by measurement_frames, with the ice read in all the captors of dict_captors.
+    """
+    return align_conditions(measurement_frames(dict_captors, dict_patterns, dict_chosen), column, info, dict_captors)
+
+
+def ice_steps(dict_captors, info="INFO01"):
+    """Return the number of time keys where info is set in at least one of the cleaned CQ frames of dict_captors."""
+    list_keys = [time_keys(df_captor["Timestamp"])[flag_values(df_captor, info)]
+                 for df_captor in dict_captors.values() if len(df_captor)]
+    return len(np.unique(np.concatenate(list_keys))) if list_keys else 0
+
+
+def condition_timestamps(df_conditions):
+    """Return the timestamps (tz-aware, UTC) of the rows of a frame of align_conditions."""
+    return key_timestamps(df_conditions.index.to_numpy())
+
+
+def measurement_captors(dict_frames, dict_patterns=MEASUREMENT_PATTERNS, dict_chosen=None):
+    """
+    Return {measurement: captor name} of the frames of dict_frames (keyed by captor name) used for each
+    measurement of dict_patterns: the captor given in dict_chosen ({measurement: captor name}), otherwise
+    the last captor, in the order of their names, whose name contains the pattern of the measurement
+    (the first pattern matched by a captor). Empty frames (ex.: every record rejected by the Quality
+    Control) are skipped.
+    """
+    dict_chosen = dict_chosen or {}
+    for str_measurement, str_captor in dict_chosen.items():
+        if str_captor not in dict_frames:
+            raise ValueError("No captor %r for the measurement %r" % (str_captor, str_measurement))
+    dict_captors = {}
+    for str_captor in sorted(dict_frames, key=str):
+        if len(dict_frames[str_captor]) == 0:
+            continue
+        for str_measurement, str_pattern in dict_patterns.items():
+            if str_pattern in str_captor:
+                dict_captors[str_measurement] = str_captor
+                break
+    return {**dict_captors, **dict_chosen}
+
+
+def measurement_frames(dict_frames, dict_patterns=MEASUREMENT_PATTERNS, dict_chosen=None):
+    """Return {measurement: frame} of the captors of dict_frames chosen by measurement_captors."""
+    return {str_measurement: dict_frames[str_captor]
+            for str_measurement, str_captor in measurement_captors(dict_frames, dict_patterns, dict_chosen).items()}
+
+
+def measurement_heights(dict_frames, dict_patterns=MEASUREMENT_PATTERNS, dict_chosen=None):
+    """
+    Return {measurement: height (int, m)} of the captors chosen by measurement_captors, the height being read
+    in the name of the captor (ex.: "BarohPaHt10m0d" -> 10). Captors without a height in their name are skipped.
+    """
+    dict_heights = {}
+    for str_measurement, str_captor in measurement_captors(dict_frames, dict_patterns, dict_chosen).items():
+        match_height = _PATTERN_HEIGHT.search(str_captor)
+        if match_height is not None:
+            dict_heights[str_measurement] = int(match_height.group(1))
+    return dict_heights
+
+
+def rule_mask(conditions, dict_rule):
+    """
+    Return the boolean array of the time keys of conditions where dict_rule is true.
+    conditions is a frame of align_conditions, or a dictionary of its columns as arrays.
+    A condition on a missing measurement (NaN) is false.
+    """
+    array_mask = np.ones(len(conditions[ICE_COLUMN]), dtype=bool)
+    for str_measurement, str_operator, float_threshold in dict_rule["conditions"]:
+        if str_operator not in _DICT_OPERATORS:
+            raise ValueError("Operator must be one of %s, not %r" % (", ".join(_DICT_OPERATORS), str_operator))
+        array_values = np.asarray(conditions[str_measurement], dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            array_mask &= _DICT_OPERATORS[str_operator](array_values, float_threshold)
+    return persistent(array_mask, dict_rule.get("persistence", 1))
+
+
+def persistent(array_mask, int_steps):
+    """Return True where array_mask is True for int_steps consecutive steps (ending at the step)."""
+    int_steps = int(int_steps)
+    if int_steps <= 1:
+        return np.asarray(array_mask, dtype=bool)
+    array_count = np.concatenate([[0], np.cumsum(array_mask, dtype=np.int64)])
+    array_window = array_count[int_steps:] - array_count[:-int_steps]
+    return np.concatenate([np.zeros(int_steps - 1, dtype=bool), array_window == int_steps])
+
+
+def score_mask(array_mask, array_ice, int_max_lag=36):
+    """
+    Score a mask of icing conditions against the ice detected (1.0, 0.0 or NaN when unknown).
+    Only the steps where the ice detected is known are scored.
+
+    Returns a dictionary with:
+        "flagged", "ice"      number of steps flagged by the mask, with ice detected
+        "hits", "misses", "false_alarms"
+        "hit_rate"            hits / ice (probability of detection)
+        "false_alarm_ratio"   false alarms / flagged
+        "csi"                 critical success index: hits / (hits + misses + false alarms)
+        "lag_min"             shift of the mask (minutes, within int_max_lag steps) giving the most hits:
+                              positive when the conditions are met before the ice is detected
+        "hits_at_lag"         hits with the mask shifted by lag_min
+    """
+    array_known = ~np.isnan(array_ice)
+    array_ice_known = array_ice[array_known] == 1
+    array_mask_known = np.asarray(array_mask, dtype=bool)[array_known]
+    int_hits = int(np.count_nonzero(array_mask_known & array_ice_known))
+    int_flagged = int(np.count_nonzero(array_mask_known))
+    int_ice = int(np.count_nonzero(array_ice_known))
+
+    # Hits for every shift of the mask, the unknown steps of the ice detected being 0
+    array_mask_full = np.asarray(array_mask, dtype=np.int64)
+    array_ice_full = np.where(array_known, array_ice == 1, False).astype(np.int64)
+    int_best_lag, int_best_hits = 0, -1
+    # Shifts longer than the series would leave nothing to compare
+    int_max_lag = min(int_max_lag, max(len(array_mask_full) - 1, 0))
+    for int_lag in range(-int_max_lag, int_max_lag + 1):
+        if int_lag >= 0:
+            int_lag_hits = int(array_mask_full[:len(array_mask_full) - int_lag] @ array_ice_full[int_lag:])
+        else:
+            int_lag_hits = int(array_mask_full[-int_lag:] @ array_ice_full[:int_lag])
+        if int_lag_hits > int_best_hits or (int_lag_hits == int_best_hits and abs(int_lag) < abs(int_best_lag)):
+            int_best_lag, int_best_hits = int_lag, int_lag_hits
+
+    return {"flagged": int_flagged, "ice": int_ice, "hits": int_hits, "misses": int_ice - int_hits,
+            "false_alarms": int_flagged - int_hits,
+            "hit_rate": int_hits / int_ice if int_ice else np.nan,
+            "false_alarm_ratio": (int_flagged - int_hits) / int_flagged if int_flagged else np.nan,
+            "csi": int_hits / (int_ice + int_flagged - int_hits) if int_ice + int_flagged else np.nan,
+            "lag_min": int_best_lag * TIME_STEP / pd.Timedelta("1min"), "hits_at_lag": int_best_hits}
+
+
+def score_rules(df_conditions, list_rules, int_max_lag=36):
+    """
+    Score every rule of list_rules against the ice detected of df_conditions (see align_conditions).
+    Returns a dataframe indexed by the name of the rules, with the columns of score_mask.
+    """
+    array_ice = np.asarray(df_conditions[ICE_COLUMN], dtype=np.float64)
+    list_scores = [score_mask(rule_mask(df_conditions, dict_rule), array_ice, int_max_lag) for dict_rule in list_rules]
+    return pd.DataFrame(list_scores, index=pd.Index([dict_rule["name"] for dict_rule in list_rules], name="Rule"))
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental update of the lidar availability tables when new 10-minute records arrive.
+
+The state of the analysis keeps, for each table, the sufficient statistics of the rows already
+merged (see task32.availability.binned_statistics and monthly_statistics) and the last time key
+merged (watermark). An update only computes the statistics of the rows after the watermark and
+adds them to the stored ones, so its cost depends on the new data, not on the whole history.
+
+Rows are merged up to a time key given by the caller, usually the last timestamp present in all
+the sources: a mast record whose lidar record has not arrived yet is merged at a later update.
+Records arriving with a timestamp before the watermark (late corrections) are ignored; delete
+the state file to recompute the tables from scratch.
+
+The records before the earliest watermark of the state (see update_start) need not be read at all:
+the sources are then read and joined from that time key only, and the tables can only be updated.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from task32.align import key_timestamps
+from task32.availability import availability_from_statistics, binned_statistics
+
+# Version of the format of the state, a state saved with another version is not used
+STATE_VERSION = 1
+# Key of the state holding the time key after which the records were read (see update_start), not saved
+READ_AFTER_KEY = "read_after"
+
+
+def empty_state():
+    """Return a state without any table."""
+    return {"version": STATE_VERSION, "tables": {}}
+
+
+def load_state(str_path):
+    """Return the state saved in str_path, or an empty state if the file does not exist."""
+    if not os.path.exists(str_path):
+        return empty_state()
+    with open(str_path) as file:
+        dict_state = json.load(file)
+    if dict_state.get("version") != STATE_VERSION:
+        raise ValueError("State %s has version %r, expected %r: delete it to recompute the tables"
+                         % (str_path, dict_state.get("version"), STATE_VERSION))
+    return dict_state
+
+
+def save_state(dict_state, str_path):
+    """Save the state in str_path (written to a temporary file first, then moved)."""
+    str_directory = os.path.dirname(str_path)
+    if str_directory:
+        os.makedirs(str_directory, exist_ok=True)
+    str_temporary = "%s.%d.tmp" % (str_path, os.getpid())
+    with open(str_temporary, "w") as file:
+        json.dump({key: value for key, value in dict_state.items() if key != READ_AFTER_KEY}, file, indent=1)
+    os.replace(str_temporary, str_path)
+
+
+def update_start(dict_state):
+    """
+    Return the time key after which the records must be read to update all the tables of dict_state:
+    the earliest watermark, or None (all the records) when the state is empty or a table has no watermark.
+    The time key is kept in dict_state, whose tables can then be updated but not recomputed (see update_statistics).
+    """
+    list_watermarks = [dict_table["watermark"] for dict_table in dict_state["tables"].values()]
+    int_after = None if not list_watermarks or None in list_watermarks else min(list_watermarks)
+    dict_state[READ_AFTER_KEY] = int_after
+    return int_after
+
+
+def last_key(df_keyed):
+    """Return the last time key of df_keyed (indexed by time keys), None if it has no row."""
+    return None if df_keyed.empty else int(df_keyed.index.max())
+
+
+def update_statistics(dict_state, str_name, df_keyed, function_statistics, dict_params, int_until):
+    """
+    Merge in the table str_name of dict_state the statistics of the rows of df_keyed (indexed by time keys)
+    after the watermark of the table and up to the time key int_until, and return the merged statistics.
+    int_until None (a source without new record) merges nothing and keeps the watermark.
+
+    function_statistics(df) returns the statistics of a frame, as a dataframe whose rows add up.
+    dict_params describes how the statistics are computed (JSON serializable, ex.: bin edges):
+    when it differs from the stored one, the table is recomputed from all the rows of df_keyed. A ValueError
+    is raised when the table must be recomputed but only the records after update_start were read.
+    """
+    dict_table = dict_state["tables"].get(str_name)
+    if dict_table is not None and dict_table["params"] != _json_params(dict_params):
+        dict_table = None
+    if dict_table is None and dict_state.get(READ_AFTER_KEY) is not None:
+        raise ValueError("Table %r is not in the state or its parameters changed, but only the records after %s were "
+                         "read: delete the state file to recompute the tables"
+                         % (str_name, key_timestamps([dict_state[READ_AFTER_KEY]])[0]))
+    int_watermark = None if dict_table is None else dict_table["watermark"]
+
+    array_keys = df_keyed.index.to_numpy()
+    array_new = np.zeros(len(array_keys), dtype=bool) if int_until is None else array_keys <= int_until
+    if int_watermark is not None:
+        array_new &= array_keys > int_watermark
+    df_statistics = None if dict_table is None else _frame_from_json(dict_table["statistics"])
+    if array_new.any():
+        df_new = function_statistics(df_keyed[array_new])
+        df_statistics = df_new if df_statistics is None else df_statistics.add(df_new, fill_value=0)
+    if df_statistics is None:
+        df_statistics = function_statistics(df_keyed.iloc[:0])
+
+    if int_until is not None:
+        int_watermark = int(int_until) if int_watermark is None else max(int_watermark, int(int_until))
+    dict_state["tables"][str_name] = {"params": _json_params(dict_params), "watermark": int_watermark,
+                                      "rows_merged": int(array_new.sum()) + (0 if dict_table is None else dict_table["rows_merged"]),
+                                      "statistics": _frame_to_json(df_statistics)}
+    return df_statistics
+
+
+def watermark_timestamp(dict_state, str_name):
+    """Return the timestamp (UTC) of the last time key merged in the table str_name, or None."""
+    dict_table = dict_state["tables"].get(str_name)
+    return None if dict_table is None or dict_table["watermark"] is None else key_timestamps([dict_table["watermark"]])[0]
+
+
+def update_binned_availability(dict_state, str_name, df_keyed, columns, edges, lidar_column, labels, int_until):
+    """
+    Update the statistics of the lidar availability by bin str_name with the new rows of df_keyed
+    (see update_statistics) and return the table of binned_availability.
+    """
+    list_columns = [columns] if isinstance(columns, str) else list(columns)
+    list_edges = [edges] if isinstance(columns, str) else list(edges)
+    list_labels = list_columns if labels is None else ([labels] if isinstance(labels, str) else list(labels))
+    dict_params = {"columns": list_columns, "edges": [np.asarray(e, dtype=np.float64).tolist() for e in list_edges],
+                   "lidar": lidar_column, "labels": list_labels}
+    df_statistics = update_statistics(
+        dict_state, str_name, df_keyed,
+        lambda df: binned_statistics(df, list_columns, list_edges, lidar_column, list_labels),
+        dict_params, int_until)
+    return availability_from_statistics(df_statistics, list_edges, list_labels)
+
+
+def monthly_statistics(df_keyed, lidar_column):
+    """
+    Return the number of rows ("Number") and of rows with lidar data ("Available") of each month
+    ("2015-09", ...) of df_keyed (indexed by time keys). The statistics of several frames add up.
+    """
+    index_months = pd.Index(key_timestamps(df_keyed.index.to_numpy()).strftime("%Y-%m"), name="Month")
+    df_flags = pd.DataFrame({"Number": np.ones(len(df_keyed), dtype=np.int64),
+                             "Available": df_keyed[lidar_column].notna().to_numpy().astype(np.int64)},
+                            index=index_months)
+    return df_flags.groupby(level=0).sum()
+
+
+def availability_by_month(df_statistics, int_min_records=1):
+    """
+    Return the lidar availability (%) by month (1 to 12) and year ("2015", ...) from monthly_statistics,
+    for the months with at least int_min_records records.
+    """
+    df_statistics = df_statistics[df_statistics["Number"] >= int_min_records]
+    series_availability = 100 * df_statistics["Available"] / df_statistics["Number"]
+    index_month = pd.Index(series_availability.index.str[5:7].astype(int), name="Month")
+    index_year = pd.Index(series_availability.index.str[:4], name="Year")
+    return series_availability.set_axis(pd.MultiIndex.from_arrays([index_month, index_year])).unstack("Year")
+
+
+def update_monthly_availability(dict_state, str_name, df_keyed, lidar_column, int_until, int_min_records=1):
+    """
+    Update the monthly statistics str_name with the new rows of df_keyed (see update_statistics)
+    and return the lidar availability by month and year (see availability_by_month).
+    """
+    df_statistics = update_statistics(dict_state, str_name, df_keyed,
+                                      lambda df: monthly_statistics(df, lidar_column),
+                                      {"lidar": lidar_column}, int_until)
+    return availability_by_month(df_statistics, int_min_records)
+
+
+def _json_params(dict_params):
+    # Parameters as they are read back from the JSON file
+    return json.loads(json.dumps(dict_params))
+
+
+def _frame_to_json(df):
+    return {"index_name": df.index.name, "index": df.index.tolist(), "columns": list(df.columns),
+            "data": df.to_numpy(dtype=np.float64).tolist()}
+
+
+def _frame_from_json(dict_frame):
+    return pd.DataFrame(dict_frame["data"], columns=dict_frame["columns"],
+                        index=pd.Index(dict_frame["index"], name=dict_frame["index_name"]), dtype=np.float64)
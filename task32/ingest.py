@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Reading and cleaning of the met mast data files (CQ files) from Nergica's site.
+
+A CQ file is a ";" separated file with one row per 10-minute timestamp:
+    Timestamp;Max;Min;StDev;Moyenne;NbDonnees;Tous;R101;...;INFO01;...;R701
+The cleaned frame has the rows flagged by the Quality Control removed and
+its "Timestamp" column parsed to tz-aware datetimes (UTC). Its flag columns ("Tous", R101, ...,
+INFO01, ...) can be packed in a single column (see task32.flags).
+"""
+
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from task32.align import time_keys
+from task32.cache import CACHE_DIRECTORY, cached_frame
+from task32.flags import FLAG_BITS, pack_frame
+from task32.parallel import map_parallel
+from task32.qc import QC_CODES, apply_quality_control
+from task32.timestamps import parse_cq_timestamps
+
+# Separator of the columns in the CQ files
+CQ_DELIMITER = ";"
+# Columns of measured values in the CQ files, the other columns (except "Timestamp") are flags
+CQ_VALUE_COLUMNS = ["Max", "Min", "StDev", "Moyenne"]
+# Columns kept by default when a CQ file is read by chunks
+CQ_CHUNK_COLUMNS = ["Moyenne", "INFO01"]
+# First and last days of the records of a CQ file at the end of its name (ex.: "_20150901_20151231")
+_PATTERN_CQ_DATES = re.compile(r"_(\d{8})_(\d{8})$")
+# Margin after the last day of a CQ file, its name being in local time and the cleaned timestamps in UTC
+_CQ_END_MARGIN = pd.Timedelta("2D")
+
+
+def cq_sensor_name(str_path):
+    """Return the name of the sensor of a CQ file (ex.: "mmv1_TempUnHt80m0d_20150901_20151231")."""
+    return os.path.splitext(os.path.basename(str_path))[0]
+
+
+def cq_file_end(str_path):
+    """
+    Return the time (UTC) after which a CQ file has no record, from the last day of its name
+    (ex.: "mmv1_TempUnHt80m0d_20150901_20151231.csv"), or None if its name has no dates.
+    """
+    match_dates = _PATTERN_CQ_DATES.search(cq_sensor_name(str_path))
+    if match_dates is None:
+        return None
+    return pd.Timestamp(match_dates.group(2), tz="UTC") + pd.Timedelta("1D") + _CQ_END_MARGIN
+
+
+def read_cq(str_path, bool_pack_flags=False):
+    """
+    Read a CQ file as it is, or with bool_pack_flags its flags read as uint8 and packed
+    in a single column (see task32.flags.pack_frame), the measured values being read as they are.
+    """
+    if not bool_pack_flags:
+        return pd.read_csv(str_path, delimiter=CQ_DELIMITER)
+    list_columns = list(pd.read_csv(str_path, delimiter=CQ_DELIMITER, nrows=0).columns)
+    dict_dtypes = {str_column: np.uint8 for str_column in list_columns if str_column in FLAG_BITS}
+    return pack_frame(pd.read_csv(str_path, delimiter=CQ_DELIMITER, dtype=dict_dtypes))
+
+
+def cq_dtypes(list_columns):
+    """
+    Return the compact dtypes of the columns of a CQ file: float32 for the measured values,
+    uint8 for the flags (Quality Control codes, INFO codes, "Tous").
+    """
+    dict_dtypes = {}
+    for str_column in list_columns:
+        # "NbDonnees" is empty when the sensor gave no data
+        if str_column in CQ_VALUE_COLUMNS or str_column == "NbDonnees":
+            dict_dtypes[str_column] = np.float32
+        elif str_column != "Timestamp":
+            dict_dtypes[str_column] = np.uint8
+    return dict_dtypes
+
+
+def iter_cleaned_cq(str_path, list_codes=QC_CODES, columns=CQ_CHUNK_COLUMNS, int_chunksize=100000,
+                    bool_pack_flags=False):
+    """
+    Read a CQ file by chunks of int_chunksize rows and yield each cleaned chunk with the number
+    of rows flagged by each code in the chunk (see clean_cq).
+
+    Only "Timestamp", columns and the codes of list_codes are read, with compact dtypes
+    (see cq_dtypes), so that the memory used does not depend on the length of the file.
+    The chunks yielded hold "Timestamp" (tz-aware, UTC) and columns, the flags of columns
+    being packed in a single column with bool_pack_flags (see task32.flags.pack_frame).
+    """
+    list_codes = list(list_codes)
+    list_columns = ["Timestamp"] + [c for c in columns if c != "Timestamp"]
+    list_read = list_columns + [c for c in list_codes if c not in list_columns]
+    with pd.read_csv(str_path, delimiter=CQ_DELIMITER, usecols=list_read, dtype=cq_dtypes(list_read),
+                     chunksize=int_chunksize) as reader:
+        for df_chunk in reader:
+            df_cleaned, series_rejected = clean_cq(df_chunk, list_codes)
+            df_cleaned = df_cleaned[list_columns]
+            yield (pack_frame(df_cleaned) if bool_pack_flags else df_cleaned), series_rejected
+
+
+def clean_cq(df_captor, list_codes=QC_CODES):
+    """
+    Apply the Quality Control to a CQ frame and parse its timestamps.
+    Returns the cleaned frame and the number of rows flagged by each code.
+    """
+    df_cleaned, series_rejected = apply_quality_control(df_captor, list_codes)
+    df_cleaned["Timestamp"] = parse_cq_timestamps(df_cleaned["Timestamp"])
+    return df_cleaned, series_rejected
+
+
+def load_cleaned_cq(str_path, list_codes=QC_CODES, columns=None, cache_directory=CACHE_DIRECTORY,
+                    bool_pack_flags=False):
+    """
+    Return the cleaned frame of a CQ file (only columns if given) and the number of
+    rows flagged by each code. The frame is read from the cache when the file and the
+    codes did not change since it was saved (a change of the parsing needs a new
+    task32.cache.CACHE_VERSION).
+    With bool_pack_flags, the flags of the frame are packed in a single column (see read_cq).
+    """
+    list_codes = list(list_codes)
+
+    def function_build():
+        df_cleaned, series_rejected = clean_cq(read_cq(str_path, bool_pack_flags), list_codes)
+        return df_cleaned, {"rows": len(df_cleaned),
+                            "rejected": {str_code: int(n) for str_code, n in series_rejected.items()}}
+
+    dict_params = {"frame": "cq", "codes": sorted(list_codes)}
+    if bool_pack_flags:
+        dict_params["flags"] = "packed"
+    df_cleaned, dict_info = cached_frame([str_path], dict_params, function_build, columns, cache_directory)
+    return df_cleaned, pd.Series(dict_info["rejected"], dtype=np.int64)
+
+
+def find_mast_files(dict_patterns):
+    """
+    Return the list of (mast, path) of the CQ files of each mast, sorted by path.
+    dict_patterns maps each mast to a glob pattern, or a list of patterns, of its CQ files
+    (ex.: {"mmv1": "./metMastData/mmv1_*.csv"}). A file matched by several patterns is listed once.
+    """
+    list_files = []
+    for str_mast, patterns in dict_patterns.items():
+        list_patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+        set_paths = {str_path for str_pattern in list_patterns for str_path in glob.glob(str_pattern)}
+        list_files += [(str_mast, str_path) for str_path in sorted(set_paths)]
+    return list_files
+
+
+def ingest_masts(dict_patterns, list_codes=QC_CODES, int_jobs=None, bool_processes=True, columns=None,
+                 cache_directory=CACHE_DIRECTORY, bool_pack_flags=False, int_after=None):
+    """
+    Read and clean the CQ files of any number of masts, one file per task of a pool of
+    int_jobs processes (threads if not bool_processes, see task32.parallel.map_parallel).
+    dict_patterns gives the CQ files of each mast (see find_mast_files).
+    With int_after (a time key, see task32.align.time_keys), only the records after it are kept,
+    and the files whose name ends before it (see cq_file_end) are not read.
+
+    Returns two dictionaries keyed by (mast, sensor name): the cleaned frames (only columns
+    if given, flags packed with bool_pack_flags) and the number of rows flagged by each Quality Control code.
+    """
+    list_files = find_mast_files(dict_patterns)
+    if int_after is not None:
+        list_files = [(str_mast, str_path) for str_mast, str_path in list_files
+                      if cq_file_end(str_path) is None or time_keys([cq_file_end(str_path)])[0] > int_after]
+    list_results = map_parallel(load_cleaned_cq, [(str_path, list(list_codes), columns, cache_directory, bool_pack_flags)
+                                                  for _, str_path in list_files], int_jobs, bool_processes)
+    dict_cleaned = {}
+    dict_rejected = {}
+    for (str_mast, str_path), (df_cleaned, series_rejected) in zip(list_files, list_results):
+        if int_after is not None:
+            df_cleaned = df_cleaned[time_keys(df_cleaned["Timestamp"]) > int_after].reset_index(drop=True)
+        dict_cleaned[(str_mast, cq_sensor_name(str_path))] = df_cleaned
+        dict_rejected[(str_mast, cq_sensor_name(str_path))] = series_rejected
+    return dict_cleaned, dict_rejected
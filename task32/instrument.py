@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the stages of a run (lidar load, CQ read, Quality Control, join, binning, plot, ...).
+
+Each stage of a run report records its wall time, the peak resident memory (RSS) of the process
+during the stage, and the rows in and out and the rows rejected by each Quality Control code given
+by the caller (see count_rows). The report is saved as JSON (see write_report), and the whole run
+can be profiled with cProfile, or pyinstrument when it is installed (see start_profile).
+
+Example:
+    dict_report = new_report("availability")
+    with stage(dict_report, "CQ read") as dict_stage:
+        df_cleaned, series_rejected = load_cleaned_cq(str_path)
+        count_rows(dict_stage, rows_out=len(df_cleaned), rejected=series_rejected)
+    write_report(dict_report, "./savedFiles/run_report.json")
+"""
+
+import contextlib
+import cProfile
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+import warnings
+
+# Version of the format of the report
+REPORT_VERSION = 1
+# Interval between two measures of the memory of the process during a stage (s)
+SAMPLING_INTERVAL = 0.01
+# Profilers of start_profile
+PROFILERS = ("cprofile", "pyinstrument")
+# Number of functions of the cProfile dump listed in the report, by cumulative time
+PROFILE_TOP_FUNCTIONS = 20
+
+
+def rss_bytes():
+    """Return the resident memory of the process (bytes), or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes():
+    """Return the peak resident memory of the process since it started (bytes), or None."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    int_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int_peak if sys.platform == "darwin" else int_peak * 1024
+
+
+def new_report(str_name, dict_parameters=None):
+    """Return an empty run report, its wall time starting now (dict_parameters must be JSON serializable)."""
+    return {"version": REPORT_VERSION, "name": str_name,
+            "started": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "parameters": dict_parameters or {}, "stages": [],
+            "_start": time.perf_counter()}
+
+
+@contextlib.contextmanager
+def stage(dict_report, str_name, bool_print=True):
+    """
+    Context manager measuring a stage of dict_report. It gives the record of the stage, where
+    count_rows adds the rows of the stage. The stage is recorded (with "failed": True) even when it
+    raises. The RSS is sampled by a thread every SAMPLING_INTERVAL seconds; where it cannot be
+    read, the peak RSS of the process since it started is reported instead.
+    """
+    dict_stage = {"stage": str_name, "wall_s": None, "rows_in": None, "rows_out": None, "rejected": {},
+                  "peak_rss_mb": None, "start_rss_mb": None, "failed": False}
+    int_start_rss = rss_bytes()
+    list_peak = [int_start_rss or 0]
+    event_stop = threading.Event()
+    thread_sampler = threading.Thread(target=_sample_rss, args=(event_stop, list_peak), daemon=True)
+    thread_sampler.start()
+    float_start = time.perf_counter()
+    try:
+        yield dict_stage
+    except BaseException:
+        dict_stage["failed"] = True
+        raise
+    finally:
+        dict_stage["wall_s"] = time.perf_counter() - float_start
+        event_stop.set()
+        thread_sampler.join()
+        int_end_rss = rss_bytes()
+        if int_end_rss is None:
+            dict_stage["peak_rss_mb"] = _mb(peak_rss_bytes())
+        else:
+            dict_stage["peak_rss_mb"], dict_stage["start_rss_mb"] = _mb(max(list_peak[0], int_end_rss)), _mb(int_start_rss)
+        dict_report["stages"].append(dict_stage)
+        if bool_print:
+            print("--- %s: %.2f s ---" % (str_name, dict_stage["wall_s"]))
+
+
+def count_rows(dict_stage, rows_in=None, rows_out=None, rejected=None):
+    """
+    Add rows to the record of a stage: rows_in and rows_out (int), rejected the number of rows
+    rejected by each Quality Control code (dictionary or pd.Series). Counts of several calls add up.
+    """
+    for str_key, int_rows in (("rows_in", rows_in), ("rows_out", rows_out)):
+        if int_rows is not None:
+            dict_stage[str_key] = (dict_stage[str_key] or 0) + int(int_rows)
+    for str_code, int_rows in ({} if rejected is None else dict(rejected)).items():
+        dict_stage["rejected"][str_code] = dict_stage["rejected"].get(str_code, 0) + int(int_rows)
+
+
+def finish_report(dict_report):
+    """Set the total wall time and the peak RSS of the process in dict_report, and return it."""
+    dict_report["wall_s"] = time.perf_counter() - dict_report["_start"]
+    dict_report["peak_rss_mb"] = _mb(peak_rss_bytes())
+    return dict_report
+
+
+def write_report(dict_report, str_path):
+    """Finish dict_report (see finish_report) and save it as JSON in str_path (temporary file first, then moved)."""
+    finish_report(dict_report)
+    str_directory = os.path.dirname(str_path)
+    if str_directory:
+        os.makedirs(str_directory, exist_ok=True)
+    str_temporary = "%s.%d.tmp" % (str_path, os.getpid())
+    with open(str_temporary, "w") as file:
+        json.dump({str_key: value for str_key, value in dict_report.items() if not str_key.startswith("_")},
+                  file, indent=1, default=str)
+    os.replace(str_temporary, str_path)
+
+
+def print_report(dict_report):
+    """Print the wall time, the rows and the peak RSS of each stage of dict_report."""
+    print("%-24s %10s %12s %12s %14s" % ("stage", "wall (s)", "rows in", "rows out", "peak RSS (MB)"))
+    for dict_stage in dict_report["stages"]:
+        print("%-24s %10.3f %12s %12s %14s" % (dict_stage["stage"], dict_stage["wall_s"], _text(dict_stage["rows_in"]),
+                                               _text(dict_stage["rows_out"]), _text(dict_stage["peak_rss_mb"])))
+
+
+def start_profile(str_profiler="cprofile"):
+    """
+    Start profiling the process with str_profiler (see PROFILERS) and return the profile to give to stop_profile.
+    pyinstrument is an optional dependency: without it, cProfile is used.
+    """
+    if str_profiler not in PROFILERS:
+        raise ValueError("Profiler must be one of %s, not %r" % (", ".join(PROFILERS), str_profiler))
+    if str_profiler == "pyinstrument" and importlib.util.find_spec("pyinstrument") is None:
+        warnings.warn("pyinstrument is not installed, cProfile is used")
+        str_profiler = "cprofile"
+    if str_profiler == "pyinstrument":
+        import pyinstrument
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return str_profiler, profiler
+
+
+def stop_profile(tuple_profile, str_path, dict_report=None):
+    """
+    Stop a profile of start_profile and save it in str_path: a cProfile dump (read it with pstats or snakeviz)
+    or the HTML page of pyinstrument. With dict_report, the profile and, for cProfile, the functions with the
+    longest cumulative time are added to the report.
+    """
+    str_profiler, profiler = tuple_profile
+    str_directory = os.path.dirname(str_path)
+    if str_directory:
+        os.makedirs(str_directory, exist_ok=True)
+    dict_profile = {"profiler": str_profiler, "path": str_path}
+    if str_profiler == "pyinstrument":
+        profiler.stop()
+        with open(str_path, "w", encoding="utf-8") as file:
+            file.write(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(str_path)
+        dict_profile["top_functions"] = _top_functions(pstats.Stats(profiler), PROFILE_TOP_FUNCTIONS)
+    if dict_report is not None:
+        dict_report["profile"] = dict_profile
+    return dict_profile
+
+
+def _top_functions(stats, int_count):
+    # Functions with the longest cumulative time of a cProfile
+    list_functions = []
+    for (str_file, int_line, str_function), (_, int_calls, float_total, float_cumulative, _) in stats.stats.items():
+        list_functions.append({"function": "%s:%d(%s)" % (os.path.basename(str_file), int_line, str_function),
+                               "calls": int_calls, "total_s": round(float_total, 4), "cumulative_s": round(float_cumulative, 4)})
+    return sorted(list_functions, key=lambda dict_function: -dict_function["cumulative_s"])[:int_count]
+
+
+def _sample_rss(event_stop, list_peak):
+    # Peak RSS sampled until event_stop is set
+    while not event_stop.wait(SAMPLING_INTERVAL):
+        int_rss = rss_bytes()
+        if int_rss is not None:
+            list_peak[0] = max(list_peak[0], int_rss)
+
+
+def _mb(int_bytes):
+    return None if int_bytes is None else round(int_bytes / 2 ** 20, 1)
+
+
+def _text(value):
+    return "" if value is None else str(value)
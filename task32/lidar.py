@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Loading of the lidar data (Windcube V2) from Nergica's site.
+
+Each file "[height]m_[year]_dataWindCube.pkl" holds a dataframe with one row per
+10-minute timestamp ("TimeStamp" column) and the measurements of the lidar, saved as
+strings ("NaN" for missing values). Measurements at a height are named "[height]m [measurement]"
+(ex.: "80m Wind Speed (m/s)"), the others apply to the whole lidar (ex.: "Int Temp (°C)").
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from task32.cache import CACHE_DIRECTORY, cached_frame
+from task32.parallel import map_parallel
+from task32.timestamps import parse_lidar_timestamps
+
+
+def lidar_file_path(str_directory, str_height, str_year):
+    """Return the path of the lidar file for a height and a year."""
+    return "%s/%sm_%s_dataWindCube.pkl" % (str_directory.rstrip("/"), str_height, str_year)
+
+
+def read_lidar(str_path):
+    """Read a lidar file as it is."""
+    return pd.read_pickle(str_path)
+
+
+# Columns of the lidar files that are not measurements
+LIDAR_TIME_COLUMNS = ["TimeStamp", "TimeObjectData"]
+# Type of the measurements once loaded
+LIDAR_DTYPE = np.float32
+# Name of the measurements at a height: "[height]m [measurement]"
+_PATTERN_HEIGHT_COLUMN = re.compile(r"^(\d+)m (.+)$")
+
+
+def split_height_column(str_column):
+    """Return (height, measurement) of a measurement at a height (ex.: (80, "Wind Speed (m/s)")), None for the others."""
+    match_column = _PATTERN_HEIGHT_COLUMN.match(str(str_column))
+    return None if match_column is None else (int(match_column.group(1)), match_column.group(2))
+
+
+def type_lidar(df_lidar):
+    """
+    Return the lidar frame with every measurement converted to float32, "NaN" strings
+    (or any value that is not a number) becoming real NaN.
+    """
+    dict_typed = {str_column: _to_float(df_lidar[str_column])
+                  for str_column in df_lidar.columns if str_column not in LIDAR_TIME_COLUMNS}
+    return df_lidar.assign(**dict_typed)
+
+
+def _to_float(series_values):
+    # astype parses "12.3" and "NaN" strings much faster than pd.to_numeric,
+    # which is only needed when some values are not numbers
+    try:
+        return series_values.astype(LIDAR_DTYPE)
+    except (TypeError, ValueError):
+        return pd.to_numeric(series_values, errors="coerce").astype(LIDAR_DTYPE)
+
+
+def lidar_schema(df_lidar):
+    """
+    Return the measurements available at each height of a lidar frame: a boolean
+    dataframe indexed by height (int, m) with a column per measurement
+    (ex.: "Wind Speed (m/s)", "CNR (dB)").
+    """
+    list_found = []
+    for str_column in df_lidar.columns:
+        match_column = _PATTERN_HEIGHT_COLUMN.match(str(str_column))
+        if match_column:
+            list_found.append((int(match_column.group(1)), match_column.group(2)))
+    df_found = pd.DataFrame(list_found, columns=["Height", "Measurement"])
+    return pd.crosstab(df_found["Height"], df_found["Measurement"]).astype(bool)
+
+
+def general_columns(df_lidar):
+    """Return the measurements of a lidar frame that do not depend on the height (ex.: "Int Temp (°C)")."""
+    return [str_column for str_column in df_lidar.columns
+            if str_column not in LIDAR_TIME_COLUMNS and not _PATTERN_HEIGHT_COLUMN.match(str(str_column))]
+
+
+def clean_lidar(df_lidar):
+    """
+    Return the lidar frame with typed measurements (float32, NaN when missing) and
+    its "TimeObjectData" column parsed from "TimeStamp" (tz-aware, UTC).
+    """
+    return type_lidar(df_lidar).assign(TimeObjectData=parse_lidar_timestamps(df_lidar["TimeStamp"]))
+
+
+def load_cleaned_lidar(str_path, columns=None, cache_directory=CACHE_DIRECTORY):
+    """
+    Return the cleaned frame of a lidar file (only columns if given).
+    The frame is read from the cache when the file did not change (a change of the parsing
+    needs a new task32.cache.CACHE_VERSION).
+    """
+    df_cleaned, _ = cached_frame([str_path], {"frame": "lidar"},
+                                 lambda: (clean_lidar(read_lidar(str_path)), {}),
+                                 columns, cache_directory)
+    return df_cleaned
+
+
+def load_cleaned_lidar_files(list_paths, int_jobs=None, bool_processes=False, cache_directory=CACHE_DIRECTORY):
+    """
+    Return the cleaned frames of the lidar files list_paths (same order), read concurrently
+    by int_jobs threads (or processes if bool_processes, for parsing bound by the CPU).
+    """
+    return map_parallel(load_cleaned_lidar, [(str_path, None, cache_directory) for str_path in list_paths],
+                        int_jobs, bool_processes)
+
+
+def lidar_height_frame(df_lidar, height):
+    """
+    Return the measurements of df_lidar at a height, without the "[height]m " prefix,
+    with the measurements that do not depend on the height.
+    """
+    str_prefix = "%sm " % height
+    dict_names = {str_column: str_column[len(str_prefix):] for str_column in df_lidar.columns
+                  if str(str_column).startswith(str_prefix)}
+    list_columns = general_columns(df_lidar) + list(dict_names)
+    return df_lidar[list_columns].rename(columns=dict_names)
+
+
+def load_lidar(str_directory, list_heights, list_years, int_jobs=None, bool_processes=False,
+               cache_directory=CACHE_DIRECTORY):
+    """
+    Load the lidar files of all list_heights and list_years concurrently (see load_cleaned_lidar_files).
+
+    Returns one tidy frame indexed by ("Time", "Height"), time being tz-aware (UTC) and
+    height an int (m), with the typed measurements as columns (ex.: "Wind Speed (m/s)", "CNR (dB)").
+    """
+    list_keys = [(int(height), str(year)) for year in list_years for height in list_heights]
+    list_frames = load_cleaned_lidar_files([lidar_file_path(str_directory, height, year) for height, year in list_keys],
+                                           int_jobs, bool_processes, cache_directory)
+    list_tidy = []
+    for (int_height, _), df_lidar in zip(list_keys, list_frames):
+        df_height = lidar_height_frame(df_lidar, int_height)
+        df_height.index = pd.MultiIndex.from_arrays(
+            [pd.DatetimeIndex(df_lidar["TimeObjectData"]), np.full(len(df_height), int_height)], names=["Time", "Height"])
+        list_tidy.append(df_height)
+    return pd.concat(list_tidy).sort_index()
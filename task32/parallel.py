@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Execution of independent tasks (one per file, figure, ...) in a pool of processes or threads.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def map_parallel(function, list_args, int_jobs=None, bool_processes=True):
+    """
+    Return [function(*args) for args in list_args], computed by a pool of int_jobs
+    processes (threads if not bool_processes). int_jobs=None uses one worker per core,
+    int_jobs=1 runs in the current process without any pool.
+
+    With processes, function and its arguments must be picklable (defined at module level),
+    and a script starting the pool must do it under if __name__ == "__main__"
+    on Windows and macOS.
+    """
+    list_args = [tuple(args) for args in list_args]
+    if int_jobs == 1 or len(list_args) <= 1:
+        return [function(*args) for args in list_args]
+    class_executor = ProcessPoolExecutor if bool_processes else ThreadPoolExecutor
+    with class_executor(max_workers=int_jobs) as executor:
+        return list(executor.map(function, *zip(*list_args)))
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Figures comparing the lidar measurements with the ice detected on the met mast (double anemometry, INFO01).
+
+Each variable that can be plotted is described once in ICE_LIDAR_VARIABLES:
+    "column"     lidar column, "{height}" being replaced by the height for measurements at a height
+    "label"      label of the y axis
+    "limits"     limits of the y axis
+    "step"       step of the y ticks (None: no ticks)
+    "ice_scale"  y value of the markers of the ice detected
+    "below"      optional, only the values below this threshold are plotted (at y = 1)
+
+The frames are split by month once (see monthly_series), then each figure draws every
+series once: the lidar series of each height and the ice detected by any captor.
+"""
+
+import json
+import os
+import re
+
+import matplotlib.dates as mdates
+import matplotlib.patches as mpatches
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps, rc_context
+from matplotlib.figure import Figure
+
+from task32.cache import file_hash
+from task32.flags import flag_values
+from task32.parallel import map_parallel
+
+ICE_LIDAR_VARIABLES = {
+    "Temp_int": {"column": "Int Temp (°C)", "label": "Internal temperature (°C) ",
+                 "limits": (-5, 30), "step": 5, "ice_scale": 10},
+    "Temp_ext": {"column": "Ext Temp (°C)", "label": "External temperature (°C)",
+                 "limits": (-20, 20), "step": 5, "ice_scale": 5},
+    "Pressure": {"column": "Pressure (hPa)", "label": "Pressure (hPa)",
+                 "limits": (900, 1010), "step": 10, "ice_scale": 5},
+    "Rel_hum": {"column": "Rel Humidity (%)", "label": "Relative humidity (%)",
+                "limits": (0, 100), "step": 5, "ice_scale": 5},
+    "WiperCounts": {"column": "Wiper count", "label": "Wiper counts",
+                    "limits": (0, 50), "step": 5, "ice_scale": 25},
+    "Vbatt": {"column": "Vbatt (V)", "label": "Voltage batterie (V)",
+              "limits": (0, 30), "step": 5, "ice_scale": 5},
+    "Wdspd": {"column": "{height}m Wind Speed (m/s)", "label": "Windspeed (m/s)",
+              "limits": (0, 30), "step": 5, "ice_scale": 5},
+    "Data_availability": {"column": "{height}m Data Availability (%)", "label": "Data availability (%)",
+                          "limits": (0, 125), "step": 5, "ice_scale": 70},
+    "Data_availability_2": {"column": "{height}m Data Availability (%)", "label": "Data availability below 20%",
+                            "limits": (-45, 20), "step": None, "ice_scale": 5, "below": 20},
+    "wdspd_dis": {"column": "{height}m Wind Speed Dispersion (m/s)", "label": "Windspeed dispersion (m/s)",
+                  "limits": (0, 15), "step": 5, "ice_scale": 5},
+    "CNR": {"column": "{height}m CNR (dB)", "label": "CNR (dB)",
+            "limits": (-45, 25), "step": 5, "ice_scale": 5},
+    "Z-wind": {"column": "{height}m Z-wind (m/s)", "label": "Vertical wind (m/s)",
+               "limits": (-8, 16), "step": 2, "ice_scale": 5},
+}
+
+# Margins of the figures saved in batch (room for the labels of the axes and the rotated dates)
+FIGURE_MARGINS = {"left": 0.14, "right": 0.97, "bottom": 0.24, "top": 0.96}
+# Name of each month number, as in the "Month" columns of the scripts
+_MONTH_NAMES = np.array(["%02d" % int_month for int_month in range(13)])
+
+
+def variable_column(str_variable, height=None):
+    """Return the lidar column of a variable of ICE_LIDAR_VARIABLES (at height for measurements at a height)."""
+    if str_variable not in ICE_LIDAR_VARIABLES:
+        raise ValueError("Variable must be a string in: %s" % ", ".join(ICE_LIDAR_VARIABLES))
+    return ICE_LIDAR_VARIABLES[str_variable]["column"].format(height=height)
+
+
+def month_positions(df, month_column="Month", time_column="TimeObjectData"):
+    """
+    Return a dictionary {month ("01" to "12"): positions of the rows of df in the month}.
+    The "Month" column is used when df has one, else the months are computed from time_column.
+    """
+    if month_column in df.columns:
+        array_months = df[month_column].to_numpy()
+    else:
+        array_months = _MONTH_NAMES[pd.DatetimeIndex(df[time_column]).month.to_numpy()]
+    array_unique, array_inverse = np.unique(array_months.astype(str), return_inverse=True)
+    array_order = np.argsort(array_inverse, kind="stable")
+    array_splits = np.cumsum(np.bincount(array_inverse, minlength=len(array_unique)))[:-1]
+    return dict(zip(array_unique, np.split(array_order, array_splits)))
+
+
+def monthly_series(df, list_columns, time_column="TimeObjectData", dict_positions=None):
+    """
+    Return {month: (dates, {column: values})} for the columns of df, dates being matplotlib
+    date numbers. The dates and values are converted once for all the months.
+    """
+    if dict_positions is None:
+        dict_positions = month_positions(df, time_column=time_column)
+    array_dates = _date_numbers(df[time_column])
+    dict_values = {str_column: df[str_column].to_numpy(dtype=np.float64) for str_column in list_columns}
+    return {str_month: (array_dates[array_position], {c: v[array_position] for c, v in dict_values.items()})
+            for str_month, array_position in dict_positions.items()}
+
+
+def ice_dates_by_month(dictionary_CQ, info="INFO01", time_column="TimeObjectData"):
+    """
+    Return {month: dates (matplotlib numbers)} of the timestamps where info is set in any frame of dictionary_CQ.
+    A timestamp flagged in several frames (captors) is kept once.
+    """
+    list_dates = []
+    for df_captor in dictionary_CQ.values():
+        array_flagged = flag_values(df_captor, info)
+        list_dates.append(pd.DatetimeIndex(df_captor[time_column])[array_flagged])
+    if not list_dates:
+        return {}
+    index_dates = list_dates[0].append(list_dates[1:]).unique().sort_values()
+    array_dates = _date_numbers(index_dates)
+    array_months = _MONTH_NAMES[index_dates.month.to_numpy()]
+    return {str_month: array_dates[array_months == str_month] for str_month in np.unique(array_months)}
+
+
+def ice_lidar_values(str_variable, array_values):
+    """Return the values of a lidar column as plotted for str_variable (see "below" in ICE_LIDAR_VARIABLES)."""
+    float_below = ICE_LIDAR_VARIABLES[str_variable].get("below")
+    if float_below is None:
+        return array_values
+    return np.where(array_values < float_below, 1.0, np.nan)
+
+
+def draw_ice_lidar(ax, str_variable, list_series, array_ice):
+    """
+    Draw on ax the lidar series of list_series [(dates, values), ...] and the ice detected
+    at the dates array_ice, with the axes of str_variable (see ICE_LIDAR_VARIABLES).
+    """
+    dict_variable = ICE_LIDAR_VARIABLES[str_variable]
+    for array_dates, array_values in list_series:
+        ax.plot(array_dates, ice_lidar_values(str_variable, array_values), ".k", markersize=1, label="_nolegend_")
+    ax.plot(array_ice, np.full(len(array_ice), float(dict_variable["ice_scale"])), "sb", label="ice detected")
+    _format_axes(ax, dict_variable)
+
+
+def render_ice_lidar_figures(list_variables, list_months, dictionary_CQ, dict_lidar_heights, str_directory,
+                             info="INFO01", bool_by_height=True, int_dpi=100, list_formats=("png",), int_jobs=1,
+                             bool_processes=True, str_manifest=None):
+    """
+    Save, without any display (Agg), the figures of every variable of list_variables and month of list_months.
+
+    dict_lidar_heights maps each height (ex.: "80") to its lidar frame. Variables measured at a height get one
+    figure per height when bool_by_height (else all the heights are drawn on the same figure).
+    Each frame is split by month once, and a single figure per variable is reused for all its figures.
+    The variables are rendered by a pool of int_jobs processes (threads if not bool_processes,
+    see task32.parallel.map_parallel), int_jobs=1 renders them in the current process.
+    Files are named "[variable]_[month][_[height]m].[format]" in str_directory, for each format of list_formats.
+    Months without lidar data nor ice detected are skipped.
+    When str_manifest is given, the manifest of the files saved is written to str_directory/str_manifest
+    (see write_manifest).
+
+    Returns the list of the paths of the figures saved.
+    """
+    os.makedirs(str_directory, exist_ok=True)
+    dict_ice = ice_dates_by_month(dictionary_CQ, info)
+    dict_monthly = {}
+    for height, df_lidar in dict_lidar_heights.items():
+        list_columns = sorted({variable_column(v, height) for v in list_variables} & set(df_lidar.columns))
+        dict_monthly[height] = monthly_series(df_lidar, list_columns)
+
+    list_tasks = []
+    for str_variable in list_variables:
+        bool_height = "{height}" in ICE_LIDAR_VARIABLES[str_variable]["column"]
+        if bool_height and bool_by_height:
+            list_groups = [([height], "_%sm" % height) for height in dict_lidar_heights]
+        else:
+            list_groups = [(list(dict_lidar_heights), "")]
+        # Only the series of the variable are sent to the worker
+        dict_series = {}
+        for list_heights, str_suffix in list_groups:
+            for str_month in list_months:
+                list_series = []
+                for height in list_heights:
+                    array_dates, dict_values = dict_monthly[height].get(str_month, (np.array([]), {}))
+                    array_values = dict_values.get(variable_column(str_variable, height))
+                    if array_values is not None and len(array_values):
+                        list_series.append((array_dates, ice_lidar_values(str_variable, array_values)))
+                dict_series[(str_month, str_suffix)] = list_series
+        list_tasks.append((str_variable, list(list_months), [s for _, s in list_groups], dict_series,
+                           {m: dict_ice[m] for m in list_months if m in dict_ice},
+                           str_directory, tuple(list_formats), int_dpi))
+
+    list_records = [dict_record for list_variable_records in map_parallel(_render_ice_variable, list_tasks,
+                                                                         int_jobs, bool_processes)
+                    for dict_record in list_variable_records]
+    if str_manifest is not None:
+        write_manifest(list_records, os.path.join(str_directory, str_manifest))
+    return [dict_record["path"] for dict_record in list_records]
+
+
+def _render_ice_variable(str_variable, list_months, list_suffixes, dict_series, dict_ice, str_directory,
+                         tuple_formats, int_dpi):
+    # Save the figures of a variable (see render_ice_lidar_figures), reusing one figure for all of them
+    dict_variable = ICE_LIDAR_VARIABLES[str_variable]
+    fig = Figure()
+    ax = fig.subplots()
+    list_lines = []
+    line_ice, = ax.plot([], [], "sb", label="ice detected")
+    _format_axes(ax, dict_variable)
+    # Fixed margins instead of tight_layout, which would make every savefig draw the figure twice
+    fig.subplots_adjust(**FIGURE_MARGINS)
+
+    list_records = []
+    for str_month in list_months:
+        array_ice = dict_ice.get(str_month, np.array([]))
+        line_ice.set_data(array_ice, np.full(len(array_ice), float(dict_variable["ice_scale"])))
+        for str_suffix in list_suffixes:
+            list_series = dict_series[(str_month, str_suffix)]
+            if not list_series and not len(array_ice):
+                continue
+            _set_series(ax, list_lines, list_series)
+            list_records += save_figure(fig, str_directory, "%s_%s%s" % (str_variable, str_month, str_suffix),
+                                        tuple_formats, int_dpi)
+    return list_records
+
+
+####################################################
+############## Export of figures ###################
+####################################################
+# Figures are drawn on their own matplotlib.figure.Figure (no pyplot global state), so that
+# they can be rendered in worker processes or threads, with the Agg backend for the raster formats.
+
+# Formats of the files that can be saved
+FIGURE_FORMATS = ("png", "svg", "pdf")
+# Metadata without creation date, so that the same figure always gives the same file
+_DICT_METADATA = {"png": {}, "svg": {"Date": None}, "pdf": {"CreationDate": None}}
+
+
+def figure_file_name(str_name, str_format):
+    """Return the file name of the figure str_name in str_format (characters not allowed in file names replaced by "_")."""
+    if str_format not in FIGURE_FORMATS:
+        raise ValueError("str_format must be one of %s" % ", ".join(FIGURE_FORMATS))
+    return "%s.%s" % (re.sub(r'[<>:"/\\|?*]', "_", str_name), str_format)
+
+
+def save_figure(fig, str_directory, str_name, list_formats=("png",), int_dpi=100):
+    """
+    Save fig in str_directory in every format of list_formats.
+    Returns a record per file: {"name", "format", "path", "bytes", "sha256"}.
+    """
+    list_records = []
+    for str_format in list_formats:
+        str_path = os.path.join(str_directory, figure_file_name(str_name, str_format))
+        # Fixed salt of the ids of the svg elements, random by default
+        with rc_context({"svg.hashsalt": str_name}):
+            fig.savefig(str_path, dpi=int_dpi, format=str_format, metadata=_DICT_METADATA[str_format])
+        list_records.append({"name": str_name, "format": str_format, "path": str_path,
+                             "bytes": os.path.getsize(str_path), "sha256": file_hash(str_path)})
+    return list_records
+
+
+def export_figures(list_figures, str_directory="./savedFiles/", list_formats=("png",), int_jobs=None,
+                   bool_processes=True, str_manifest="manifest.json", int_dpi=100):
+    """
+    Render and save the figures of list_figures, one figure per task of a pool of int_jobs processes
+    (threads if not bool_processes, see task32.parallel.map_parallel).
+
+    Each item of list_figures is (name, function_draw, args): function_draw(fig, *args) draws on a new
+    matplotlib.figure.Figure, and the figure is saved as "[name].[format]" for each format of list_formats.
+    With processes, function_draw and args must be picklable (function defined at module level).
+    The manifest of the files saved is written to str_directory/str_manifest (None: no manifest).
+
+    Returns the records of the files saved (see save_figure).
+    """
+    os.makedirs(str_directory, exist_ok=True)
+    list_args = [(str_name, function_draw, tuple(args), str_directory, tuple(list_formats), int_dpi)
+                 for str_name, function_draw, args in list_figures]
+    list_records = [dict_record for list_figure_records in map_parallel(_export_figure, list_args, int_jobs, bool_processes)
+                    for dict_record in list_figure_records]
+    if str_manifest is not None:
+        write_manifest(list_records, os.path.join(str_directory, str_manifest))
+    return list_records
+
+
+def _export_figure(str_name, function_draw, tuple_args, str_directory, tuple_formats, int_dpi):
+    # Draw and save one figure of export_figures
+    fig = Figure()
+    function_draw(fig, *tuple_args)
+    return save_figure(fig, str_directory, str_name, tuple_formats, int_dpi)
+
+
+def write_manifest(list_records, str_path):
+    """
+    Write the manifest (JSON) of the figures saved: one entry per file, sorted by path, with its
+    figure name, format, size (bytes) and sha256. Paths are relative to the directory of the manifest.
+    """
+    str_directory = os.path.dirname(os.path.abspath(str_path))
+    list_files = [dict(dict_record, path=os.path.relpath(os.path.abspath(dict_record["path"]), str_directory).replace(os.sep, "/"))
+                  for dict_record in list_records]
+    with open(str_path, "w") as file:
+        json.dump({"files": sorted(list_files, key=lambda d: d["path"])}, file, indent=1)
+
+
+####################################################
+######### Figures of the lidar availability ########
+####################################################
+
+def draw_monthly_availability(fig, df_availability):
+    """Draw on fig the bar plot of the lidar data availability by month (one column per year)."""
+    ax = fig.subplots()
+    df_availability.plot.bar(rot=0, ax=ax)
+    ax.set_xlabel("Months", fontsize=16)
+    ax.set_ylabel("Availability (%)", fontsize=16)
+    ax.set_title("Lidar data availability by month")
+
+
+def draw_availability_by_bin(fig, list_tables, str_label, str_title, str_xlabel, str_availability="Availability (%)"):
+    """
+    Draw on fig the lidar availability against the mean of the mast variable in each bin.
+    list_tables holds (table of binned_availability, legend, marker size or None) for each mast,
+    str_label is the label of the variable in the tables (ex.: "temp").
+    """
+    ax = fig.subplots()
+    for df_table, str_legend, int_size in list_tables:
+        if str_label + " mean" in df_table.columns:
+            ax.scatter(df_table[str_label + " mean"], df_table[str_availability], s=int_size, label=str_legend)
+    fig.suptitle(str_title, fontsize=18)
+    ax.set_xlabel(str_xlabel, fontsize=16)
+    ax.set_ylabel("Availability (%)", fontsize=16)
+    ax.legend(loc="lower right")
+
+
+def draw_bin_counts(fig, list_tables, str_label, str_title, str_xlabel):
+    """
+    Draw on fig the number of data points in each bin of the mast variable.
+    list_tables holds (table of binned_availability, legend, bar width) for each mast.
+    """
+    ax = fig.subplots()
+    cmap = colormaps["tab10"]
+    list_handles = []
+    for int_table, (df_table, str_legend, float_width) in enumerate(list_tables):
+        if "Number" in df_table.columns:
+            ax.bar(df_table[str_label], df_table["Number"], width=float_width, label=str_legend)
+        list_handles.append(mpatches.Patch(color=cmap(int_table), label=str_legend))
+    ax.legend(handles=list_handles)
+    fig.suptitle(str_title, fontsize=18)
+    ax.set_xlabel(str_xlabel, fontsize=16)
+    ax.set_ylabel("Number of data points", fontsize=16)
+
+
+def _set_series(ax, list_lines, list_series):
+    # Update the lidar lines list_lines of ax with list_series, adding lines when needed
+    while len(list_lines) < len(list_series):
+        list_lines.append(ax.plot([], [], ".k", markersize=1, label="_nolegend_")[0])
+    for int_line, line in enumerate(list_lines):
+        array_dates, array_values = list_series[int_line] if int_line < len(list_series) else ([], [])
+        line.set_data(array_dates, array_values)
+    ax.relim()
+    ax.autoscale_view(scalex=True, scaley=False)
+
+
+def _format_axes(ax, dict_variable):
+    # Axes of the figures of a variable of ICE_LIDAR_VARIABLES
+    float_low, float_high = dict_variable["limits"]
+    ax.xaxis_date()
+    ax.set_xlabel("Time", fontsize=13)
+    ax.set_ylabel(dict_variable["label"], fontsize=13)
+    if dict_variable["step"] is None:
+        ax.set_yticks([])
+    else:
+        ax.set_yticks(np.arange(float_low, float_high, dict_variable["step"]))
+    ax.set_ylim(float_low, float_high)
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.legend()
+    ax.grid(True)
+
+
+def _date_numbers(dates):
+    # Matplotlib date numbers of naive (or UTC) dates
+    index_dates = pd.DatetimeIndex(dates)
+    if index_dates.tz is not None:
+        index_dates = index_dates.tz_convert("UTC").tz_localize(None)
+    return mdates.date2num(index_dates.to_numpy())
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Quality Control filtering of the met mast data (CQ files) from Nergica's site.
+
+Each row of a CQ file has one column per code of the Quality Control (R101, R103, ...).
+A code is set to 1 when its condition is true for the timestamp
+(ex.: R101 -> No Data, R104 -> instruments under maintenance).
+The rows flagged by any selected code are discarded before any comparison with the lidar.
+The frames can also hold the codes packed in a single column (see task32.flags.pack_frame).
+"""
+
+import numpy as np
+import pandas as pd
+
+from task32.flags import FLAG_COLUMN, flag_mask
+
+# Data that we want to discard after the Quality Control
+QC_CODES = ["R101","R103","R104","R105","R201","R202","R203","R204","R205","R206"]#,"R301","R303","R401","R403"]
+
+
+def quality_control_mask(df_captor, list_codes=QC_CODES):
+    """
+    Return a boolean array, True for the rows flagged by at least one code of list_codes.
+    All the code columns are compared in a single pass, or the packed column with a single bitwise operation.
+    """
+    if _is_packed(df_captor, list(list_codes)):
+        return (df_captor[FLAG_COLUMN].to_numpy() & flag_mask(list_codes)) != 0
+    return _flag_matrix(df_captor, list_codes).any(axis=1)
+
+
+def apply_quality_control(df_captor, list_codes=QC_CODES):
+    """
+    Remove from df_captor the rows flagged by any code of list_codes.
+
+    Returns the cleaned dataframe (original index is kept) and a pd.Series with,
+    for each code, the number of rows it flagged. A row flagged by several codes
+    is counted for each one of them.
+    """
+    list_codes = list(list_codes)
+    if _is_packed(df_captor, list_codes):
+        array_packed = df_captor[FLAG_COLUMN].to_numpy()
+        array_drop = (array_packed & flag_mask(list_codes)) != 0
+        series_rejected = pd.Series([np.count_nonzero(array_packed & flag_mask(str_code)) for str_code in list_codes],
+                                    index=list_codes, dtype=np.int64)
+    else:
+        array_flags = _flag_matrix(df_captor, list_codes)
+        array_drop = array_flags.any(axis=1)
+        series_rejected = pd.Series(array_flags.sum(axis=0), index=list_codes, dtype=np.int64)
+    return df_captor.take(np.flatnonzero(~array_drop)), series_rejected
+
+
+def _is_packed(df_captor, list_codes):
+    # True when the codes are read from the packed column, a frame with all the code columns being read as it is
+    return FLAG_COLUMN in df_captor.columns and not all(str_code in df_captor.columns for str_code in list_codes)
+
+
+def _flag_matrix(df_captor, list_codes):
+    # (rows x codes) boolean matrix of the selected Quality Control codes
+    return df_captor[list(list_codes)].to_numpy() == 1
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped store of the met mast (CQ) and lidar time series aligned on one 10-minute grid.
+
+The store is a directory with one .npy file per channel, every channel having one value per
+time key from the first to the last record of the sources, and a "store.json" file describing them:
+    "[mast]/[sensor]/Moyenne", ".../StDev"   float32, NaN where there is no record
+    "[mast]/[sensor]/INFO01"                 uint8, 0 where there is no record
+    "[mast]/[sensor]/present"                bitmap: a record exists
+    "[mast]/[sensor]/valid"                  bitmap: a record exists and is flagged by no Quality Control code
+    "lidar/[height]m/[measurement]"          float32, NaN where missing
+    "lidar/[height]m/present"                bitmap: a lidar record exists
+The sensor is the name of the CQ file without the mast and the dates (ex.: "TempUnHt80m0d"), so that
+the files of several years fill the same channels. Bitmaps are saved packed (8 time keys per byte).
+
+The files are opened with np.load(mmap_mode="r"): opening a multi-year store reads nothing, and
+reading a period (see store_channel, store_frame) only touches the pages of that period.
+store_mast_frame and store_lidar_frame give the records of a sensor or a lidar height in the layout of
+the cleaned files, so that the analyses read the store instead of the files (see task32.analysis.load_masts).
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from task32.align import TIME_KEY, key_timestamps, time_keys
+from task32.ingest import find_mast_files, read_cq
+from task32.lidar import general_columns, lidar_file_path, lidar_height_frame, load_cleaned_lidar_files
+from task32.qc import QC_CODES, quality_control_mask
+from task32.timestamps import parse_cq_timestamps
+
+# Version of the format of the store, a store saved with another version is not opened
+STORE_VERSION = 2
+# Name of the file describing the channels of a store
+STORE_FILE = "store.json"
+# Channels of each mast sensor, with their type
+STORE_MAST_CHANNELS = {"Moyenne": np.float32, "StDev": np.float32, "INFO01": np.uint8}
+# Bitmaps of each mast sensor ("present" and "valid") and lidar height ("present")
+STORE_BITMAPS = ("present", "valid")
+# Name of a CQ file: "[mast]_[sensor]_[first day]_[last day]"
+_PATTERN_CQ_FILE = re.compile(r"^[^_]+_(.+?)(?:_\d{8}_\d{8})?$")
+
+
+def store_sensor_name(str_path):
+    """Return the sensor of a CQ file, without the mast and the dates (ex.: "TempUnHt80m0d")."""
+    str_name = os.path.splitext(os.path.basename(str_path))[0]
+    match_name = _PATTERN_CQ_FILE.match(str_name)
+    return match_name.group(1) if match_name else str_name
+
+
+def build_store(str_directory, dict_patterns, str_lidar_directory=None, list_heights=(), list_years=(),
+                list_codes=QC_CODES, list_measurements=None):
+    """
+    Build the store of str_directory from the CQ files of the masts of dict_patterns (see
+    task32.ingest.find_mast_files) and the lidar files of list_heights and list_years in str_lidar_directory
+    (see task32.lidar.lidar_height_frame, only list_measurements if given, ex.: ["Wind Speed (m/s)"]).
+    The "valid" bitmap of each sensor is computed with the Quality Control codes list_codes.
+    Returns the opened store (see open_store).
+    """
+    # Records of each source as (time keys, {channel: values}), keys unique and in the grid order
+    dict_sources = {}
+    for str_mast, str_path in find_mast_files(dict_patterns):
+        df_captor = read_cq(str_path)
+        array_keys = time_keys(parse_cq_timestamps(df_captor["Timestamp"]))
+        dict_values = {str_channel: df_captor[str_channel].to_numpy() for str_channel in STORE_MAST_CHANNELS}
+        dict_values["present"] = np.ones(len(df_captor), dtype=bool)
+        dict_values["valid"] = ~quality_control_mask(df_captor, list_codes)
+        _add_records(dict_sources, "%s/%s" % (str_mast, store_sensor_name(str_path)), array_keys, dict_values)
+    # Measurements of the whole lidar (ex.: "Int Temp (°C)"), saved with each height
+    set_general = set()
+    if str_lidar_directory is not None and len(list_heights) and len(list_years):
+        list_keys = [(int(height), str(year)) for height in sorted(int(h) for h in list_heights) for year in list_years]
+        list_frames = load_cleaned_lidar_files([lidar_file_path(str_lidar_directory, str(int_height), str_year)
+                                                for int_height, str_year in list_keys])
+        for (int_height, _), df_file in zip(list_keys, list_frames):
+            set_general.update(general_columns(df_file))
+            df_height = lidar_height_frame(df_file, int_height)
+            if list_measurements is not None:
+                df_height = df_height[list(list_measurements)]
+            dict_values = {str_measurement: df_height[str_measurement].to_numpy() for str_measurement in df_height.columns}
+            dict_values["present"] = np.ones(len(df_height), dtype=bool)
+            _add_records(dict_sources, "lidar/%dm" % int_height, time_keys(df_file["TimeObjectData"]), dict_values)
+    if not dict_sources:
+        raise ValueError("No CQ or lidar file found")
+
+    int_first = min(int(array_keys[0]) for array_keys, _ in dict_sources.values() if len(array_keys))
+    int_last = max(int(array_keys[-1]) for array_keys, _ in dict_sources.values() if len(array_keys))
+    int_length = int_last - int_first + 1
+    os.makedirs(str_directory, exist_ok=True)
+    dict_channels = {}
+    for str_source, (array_keys, dict_values) in dict_sources.items():
+        array_position = array_keys - int_first
+        for str_column, array_values in dict_values.items():
+            str_channel = "%s/%s" % (str_source, str_column)
+            str_file = "channel_%04d.npy" % len(dict_channels)
+            if str_column in STORE_BITMAPS:
+                array_bits = np.zeros(int_length, dtype=bool)
+                array_bits[array_position] = array_values
+                np.save(os.path.join(str_directory, str_file), np.packbits(array_bits))
+                dict_channels[str_channel] = {"file": str_file, "kind": "bitmap", "source": str_source}
+                continue
+            dtype = np.dtype(STORE_MAST_CHANNELS.get(str_column, np.float32))
+            array_channel = np.lib.format.open_memmap(os.path.join(str_directory, str_file), mode="w+",
+                                                      dtype=dtype, shape=(int_length,))
+            array_channel[:] = np.nan if dtype.kind == "f" else 0
+            array_channel[array_position] = np.nan_to_num(array_values, nan=0) if dtype.kind != "f" else array_values
+            array_channel.flush()
+            del array_channel
+            dict_channels[str_channel] = {"file": str_file, "kind": "values", "dtype": dtype.name, "source": str_source}
+            if str_source.startswith("lidar/") and str_column in set_general:
+                dict_channels[str_channel]["general"] = True
+
+    # Description saved last: a store interrupted while it is built is not opened
+    str_temporary = os.path.join(str_directory, "%s.%d.tmp" % (STORE_FILE, os.getpid()))
+    with open(str_temporary, "w") as file:
+        json.dump({"version": STORE_VERSION, "first_key": int_first, "length": int_length,
+                   "codes": list(list_codes), "channels": dict_channels}, file, indent=1)
+    os.replace(str_temporary, os.path.join(str_directory, STORE_FILE))
+    return open_store(str_directory)
+
+
+def open_store(str_directory):
+    """
+    Open the store of str_directory without reading its channels. Returns a dictionary with
+    "first_key", "length", "codes" (of the "valid" bitmaps), "channels" ({name: memory-mapped array},
+    bitmaps being packed: read them with store_channel), "sources" ({name: mast sensor or lidar height}),
+    "bitmaps" (names of the bitmaps) and "general" (names of the lidar channels of the whole lidar).
+    """
+    with open(os.path.join(str_directory, STORE_FILE)) as file:
+        dict_description = json.load(file)
+    if dict_description.get("version") != STORE_VERSION:
+        raise ValueError("Store %s has version %r, expected %r: build it again"
+                         % (str_directory, dict_description.get("version"), STORE_VERSION))
+    dict_channels = {str_channel: np.load(os.path.join(str_directory, dict_channel["file"]), mmap_mode="r")
+                     for str_channel, dict_channel in dict_description["channels"].items()}
+    return {"directory": str_directory, "first_key": dict_description["first_key"],
+            "length": dict_description["length"], "codes": dict_description["codes"], "channels": dict_channels,
+            "sources": {str_channel: dict_channel["source"] for str_channel, dict_channel in dict_description["channels"].items()},
+            "bitmaps": {str_channel for str_channel, dict_channel in dict_description["channels"].items()
+                        if dict_channel["kind"] == "bitmap"},
+            "general": {str_channel for str_channel, dict_channel in dict_description["channels"].items()
+                        if dict_channel.get("general")}}
+
+
+def store_positions(dict_store, start=None, end=None):
+    """
+    Return the (first, last + 1) positions in the store of the period from start to end
+    (timestamps, tz-aware or naive UTC, both included; None for the first or last record).
+    """
+    int_start = 0 if start is None else int(time_keys([pd.Timestamp(start)])[0]) - dict_store["first_key"]
+    int_stop = dict_store["length"] if end is None else int(time_keys([pd.Timestamp(end)])[0]) - dict_store["first_key"] + 1
+    return max(0, int_start), min(dict_store["length"], max(0, int_stop))
+
+
+def store_keys(dict_store, start=None, end=None):
+    """Return the time keys of the period from start to end (see store_positions)."""
+    int_start, int_stop = store_positions(dict_store, start, end)
+    return np.arange(dict_store["first_key"] + int_start, dict_store["first_key"] + int_stop, dtype=np.int64)
+
+
+def store_channel(dict_store, str_channel, start=None, end=None):
+    """
+    Return the values of a channel in the period from start to end (see store_positions):
+    a read-only view of the memory-mapped file, or the unpacked booleans of a bitmap
+    (only the bytes of the period are read).
+    """
+    int_start, int_stop = store_positions(dict_store, start, end)
+    array_channel = dict_store["channels"][str_channel]
+    if str_channel not in dict_store["bitmaps"]:
+        return array_channel[int_start:int_stop]
+    int_byte = int_start // 8
+    array_bits = np.unpackbits(array_channel[int_byte:-(-int_stop // 8)])
+    return array_bits[int_start - 8 * int_byte:int_stop - 8 * int_byte].astype(bool)
+
+
+def store_frame(dict_store, channels, start=None, end=None, valid=None):
+    """
+    Return a frame indexed by the time keys of the period from start to end (see store_positions)
+    with the channels as columns (channels is a list, or a dictionary {channel: column name}).
+
+    valid is the name of a bitmap (ex.: "mmv1/TempUnHt80m0d/valid"), or a list of bitmaps: only the
+    time keys where all of them are set are kept. Frames with a CQ "Moyenne" and a lidar channel can be
+    given as they are to task32.availability.binned_availability.
+    """
+    dict_columns = dict(channels) if isinstance(channels, dict) else {c: c for c in channels}
+    array_keys = store_keys(dict_store, start, end)
+    array_keep = np.ones(len(array_keys), dtype=bool)
+    for str_bitmap in [] if valid is None else ([valid] if isinstance(valid, str) else list(valid)):
+        array_keep &= store_channel(dict_store, str_bitmap, start, end)
+    array_rows = np.flatnonzero(array_keep)
+    return pd.DataFrame({str_name: store_channel(dict_store, str_channel, start, end)[array_rows]
+                         for str_channel, str_name in dict_columns.items()},
+                        index=pd.Index(array_keys[array_rows], name=TIME_KEY))
+
+
+def store_mast_frame(dict_store, str_sensor, columns=("Moyenne", "INFO01"), start=None, end=None):
+    """
+    Return the records of a mast sensor ("[mast]/[sensor]") that pass the Quality Control, as a cleaned CQ frame
+    (see task32.ingest.load_cleaned_cq) with a tz-aware "Timestamp" column: it can be given as it is to
+    task32.icing.align_conditions or to the plot functions. The values are the float32 of the store.
+    """
+    df_sensor = store_frame(dict_store, {"%s/%s" % (str_sensor, str_column): str_column for str_column in columns},
+                            start, end, "%s/valid" % str_sensor)
+    df_sensor.insert(0, "Timestamp", key_timestamps(df_sensor.index.to_numpy()))
+    return df_sensor.reset_index(drop=True)
+
+
+def store_lidar_frame(dict_store, height, start=None, end=None):
+    """
+    Return the records of the lidar at a height, in the layout of a cleaned lidar file of that height
+    (see task32.lidar.clean_lidar): the measurements of the whole lidar (ex.: "Int Temp (°C)"), those of the
+    height ("[height]m [measurement]") and "TimeObjectData" (tz-aware, UTC, start of the 10-minute step).
+    """
+    str_source = "lidar/%dm" % int(height)
+    dict_columns = {}
+    for str_channel, str_channel_source in dict_store["sources"].items():
+        if str_channel_source == str_source and str_channel not in dict_store["bitmaps"]:
+            str_measurement = str_channel[len(str_source) + 1:]
+            dict_columns[str_channel] = (str_measurement if str_channel in dict_store["general"]
+                                         else "%dm %s" % (int(height), str_measurement))
+    if not dict_columns:
+        raise ValueError("No lidar channel at %sm in the store %s" % (height, dict_store["directory"]))
+    df_lidar = store_frame(dict_store, dict_columns, start, end, "%s/present" % str_source)
+    df_lidar["TimeObjectData"] = key_timestamps(df_lidar.index.to_numpy())
+    return df_lidar.reset_index(drop=True)
+
+
+def store_sensors(dict_store):
+    """Return the mast sensors ("[mast]/[sensor]") and the lidar heights ("lidar/[height]m") of a store."""
+    return sorted(set(dict_store["sources"].values()))
+
+
+def _add_records(dict_sources, str_source, array_keys, dict_values):
+    # Add records to a source, the first record of a time key being kept (sources of several files)
+    if str_source in dict_sources:
+        array_old_keys, dict_old_values = dict_sources[str_source]
+        array_keys = np.concatenate([array_old_keys, array_keys])
+        dict_values = {str_column: np.concatenate([dict_old_values[str_column], dict_values[str_column]])
+                       for str_column in dict_values}
+    array_keys, array_first = np.unique(array_keys, return_index=True)
+    dict_sources[str_source] = (array_keys, {str_column: np.asarray(array_values)[array_first]
+                                             for str_column, array_values in dict_values.items()})
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Sweep of the thresholds of the icing rules (see task32.icing) over a grid of values.
+
+The measurements are loaded and aligned once (align_conditions), then copied in a block of shared
+memory (multiprocessing.shared_memory) that every worker process maps without copying or pickling it:
+the workers only receive the rules to score, by chunks. A grid of 10 000 rules over a year of
+10-minute data is scored in a few minutes on a workstation.
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from task32.icing import ICE_COLUMN, rule_mask, score_mask
+
+# Grid of the thresholds swept by default: (measurement, operator) -> thresholds
+SWEEP_GRID = {("Humidity", ">"): np.arange(80.0, 100.0, 1.0),
+              ("Temperature", ">"): np.arange(-10.0, 0.0, 1.0),
+              ("Temperature", "<"): np.arange(0.0, 6.0, 1.0),
+              ("Pressure", "<"): np.arange(960.0, 1010.0, 5.0)}
+# Number of chunks of rules sent to each worker (more chunks balance the load better)
+CHUNKS_PER_WORKER = 8
+
+# Columns of the conditions mapped from the shared memory, in each worker process
+_DICT_WORKER = {}
+
+
+def rule_grid(dict_grid=SWEEP_GRID, list_persistence=(1,)):
+    """
+    Return the rules (see task32.icing) of every combination of the thresholds of dict_grid
+    ((measurement, operator) -> thresholds) and of the persistences of list_persistence.
+    The combinations where a measurement has an empty band (ex.: Temperature > 2 and Temperature < 0)
+    are skipped. Each rule also has its thresholds in "parameters" ("Humidity >": 90.0, ..., "persistence": 1).
+    """
+    list_keys = list(dict_grid)
+    list_rules = []
+    for tuple_thresholds in itertools.product(*[np.asarray(dict_grid[key], dtype=np.float64) for key in list_keys]):
+        list_conditions = [(str_measurement, str_operator, float(float_threshold))
+                           for (str_measurement, str_operator), float_threshold in zip(list_keys, tuple_thresholds)]
+        if _empty_band(list_conditions):
+            continue
+        for int_persistence in list_persistence:
+            dict_parameters = {"%s %s" % (str_measurement, str_operator): float_threshold
+                               for str_measurement, str_operator, float_threshold in list_conditions}
+            dict_parameters["persistence"] = int(int_persistence)
+            str_name = ", ".join("%s%s%g" % condition for condition in list_conditions)
+            list_rules.append({"name": "%s (x%d)" % (str_name, int_persistence), "conditions": list_conditions,
+                               "persistence": int(int_persistence), "parameters": dict_parameters})
+    return list_rules
+
+
+def sweep_icing_rules(df_conditions, list_rules, int_jobs=None, int_max_lag=36, str_rank="csi"):
+    """
+    Score every rule of list_rules against the ice detected of df_conditions (see task32.icing.align_conditions
+    and score_rules) in a pool of int_jobs processes sharing the conditions (int_jobs=None uses one process
+    per core, int_jobs=1 runs in the current process).
+
+    Returns a dataframe indexed by the name of the rules, ranked by str_rank (highest first, then lowest
+    false alarm ratio), with a column "Rank", the "parameters" of the rules and the columns of score_mask.
+    A ValueError is raised when no step of df_conditions is iced: every rule would have a null score.
+    A script calling it must do it under if __name__ == "__main__" on Windows and macOS.
+    """
+    if not (df_conditions[ICE_COLUMN].to_numpy(dtype=np.float64) == 1).any():
+        raise ValueError("No step of the conditions is iced (%r), the rules cannot be ranked: is the ice read in the "
+                         "captors of the double anemometry (see task32.icing.captor_conditions)?" % ICE_COLUMN)
+    list_columns = [str_column for str_column in df_conditions.columns if str_column != ICE_COLUMN] + [ICE_COLUMN]
+    array_conditions = np.ascontiguousarray(df_conditions[list_columns].to_numpy(dtype=np.float64).T)
+    int_jobs = os.cpu_count() or 1 if int_jobs is None else int_jobs
+
+    if int_jobs == 1 or len(list_rules) <= 1:
+        list_scores = _score_rules(dict(zip(list_columns, array_conditions)), list_rules, int_max_lag)
+    else:
+        int_size = max(1, -(-len(list_rules) // (int_jobs * CHUNKS_PER_WORKER)))
+        list_chunks = [list_rules[i:i + int_size] for i in range(0, len(list_rules), int_size)]
+        memory = shared_memory.SharedMemory(create=True, size=max(1, array_conditions.nbytes))
+        try:
+            np.ndarray(array_conditions.shape, dtype=np.float64, buffer=memory.buf)[:] = array_conditions
+            with ProcessPoolExecutor(max_workers=int_jobs, initializer=_attach_conditions,
+                                     initargs=(memory.name, array_conditions.shape, list_columns)) as executor:
+                list_scores = [dict_score for list_chunk_scores in
+                               executor.map(_score_chunk, list_chunks, itertools.repeat(int_max_lag))
+                               for dict_score in list_chunk_scores]
+        finally:
+            memory.close()
+            memory.unlink()
+
+    df_scores = pd.DataFrame(list_scores, index=pd.Index([dict_rule["name"] for dict_rule in list_rules], name="Rule"))
+    df_parameters = pd.DataFrame([dict_rule.get("parameters", {}) for dict_rule in list_rules], index=df_scores.index)
+    df_sweep = pd.concat([df_parameters, df_scores], axis=1)
+    df_sweep = df_sweep.sort_values([str_rank, "false_alarm_ratio"], ascending=[False, True], na_position="last",
+                                    kind="stable")
+    df_sweep.insert(0, "Rank", np.arange(1, len(df_sweep) + 1))
+    return df_sweep
+
+
+def _empty_band(list_conditions):
+    # True when a measurement must be both over a threshold and under a lower (or equal) one
+    for str_measurement, str_operator, float_low in list_conditions:
+        if str_operator in (">", ">="):
+            for str_other, str_other_operator, float_high in list_conditions:
+                if str_other == str_measurement and str_other_operator in ("<", "<=") and float_high <= float_low:
+                    return True
+    return False
+
+
+def _score_rules(dict_conditions, list_rules, int_max_lag):
+    array_ice = dict_conditions[ICE_COLUMN]
+    return [score_mask(rule_mask(dict_conditions, dict_rule), array_ice, int_max_lag) for dict_rule in list_rules]
+
+
+def _attach_conditions(str_name, tuple_shape, list_columns):
+    # Initializer of the worker processes: map the conditions of the shared memory (kept open by the worker).
+    # The workers share the resource tracker of the parent, which unlinks the block if the parent fails to.
+    memory = shared_memory.SharedMemory(name=str_name)
+    array_conditions = np.ndarray(tuple_shape, dtype=np.float64, buffer=memory.buf)
+    _DICT_WORKER["memory"] = memory
+    _DICT_WORKER["conditions"] = dict(zip(list_columns, array_conditions))
+
+
+def _score_chunk(list_rules, int_max_lag):
+    return _score_rules(_DICT_WORKER["conditions"], list_rules, int_max_lag)
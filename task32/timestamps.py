@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Normalization of the timestamps of the met mast (CQ files) and lidar (WindCube) data.
+
+CQ files give timestamps as "31-Aug-2015 05:00:00+00:00".
+The WindCube "TimeStamp" column gives them as "2015/09/01 00:10", with some rows
+written as "2015-09-22 00:10", and without timezone (the raw exports, see task32.windcube,
+add the seconds: "2015/09/01 00:10:00").
+
+Each file is parsed once, with explicit formats, into a tz-aware (UTC) DatetimeIndex.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Format of the "Timestamp" column of the CQ files
+CQ_TIMESTAMP_FORMATS = ("%d-%b-%Y %H:%M:%S%z",)
+# Formats found in the "TimeStamp" column of the WindCube files, the raw exports (.sta) adding the seconds
+LIDAR_TIMESTAMP_FORMATS = ("%Y/%m/%d %H:%M", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+# Last format that matched the first row for a given tuple of formats,
+# tried first on the next file since the files of a source share their format
+_dict_format_cache = {}
+
+
+def parse_timestamps(values, formats, tz="UTC"):
+    """
+    Parse values (strings) into a tz-aware DatetimeIndex in UTC.
+
+    Each format of formats is applied, in a vectorized way, to the values that no
+    previous format could parse. Naive timestamps are considered to be in tz.
+    A ValueError is raised if a value matches none of the formats.
+    """
+    formats = tuple(formats)
+    array_values = np.asarray(values, dtype=object)
+    array_parsed = np.full(len(array_values), np.datetime64("NaT", "ns"))
+    array_missing = pd.notna(array_values)
+
+    str_cached = _dict_format_cache.get(formats, formats[0])
+    list_formats = [str_cached] + [f for f in formats if f != str_cached]
+    for str_format in list_formats:
+        if not array_missing.any():
+            break
+        array_position = np.flatnonzero(array_missing)
+        index_parsed = pd.to_datetime(array_values[array_position], format=str_format, errors="coerce",
+                                      utc="%z" in str_format)
+        if index_parsed.tz is None:
+            index_parsed = index_parsed.tz_localize(tz)
+        index_parsed = index_parsed.tz_convert("UTC").tz_localize(None)
+        array_ok = np.asarray(index_parsed.notna())
+        if array_ok[0] and array_position[0] == 0:
+            _dict_format_cache[formats] = str_format
+        array_parsed[array_position[array_ok]] = index_parsed[array_ok].to_numpy().astype("datetime64[ns]")
+        array_missing[array_position[array_ok]] = False
+
+    if array_missing.any():
+        raise ValueError("time data %r doesn't match any of the formats %s" % (array_values[array_missing][0], formats))
+    return pd.DatetimeIndex(array_parsed).tz_localize("UTC")
+
+
+def parse_cq_timestamps(values):
+    """Parse the "Timestamp" column of a CQ file into a tz-aware DatetimeIndex (UTC)."""
+    array_parsed = _parse_fixed_width(values, _CQ_LAYOUT)
+    if array_parsed is None:
+        return parse_timestamps(values, CQ_TIMESTAMP_FORMATS)
+    return pd.DatetimeIndex(array_parsed).tz_localize("UTC")
+
+
+def parse_lidar_timestamps(values, tz="UTC"):
+    """Parse the "TimeStamp" column of a WindCube file, given in timezone tz, into a DatetimeIndex (UTC)."""
+    array_parsed = _parse_fixed_width(values, _LIDAR_LAYOUT)
+    if array_parsed is None:
+        return parse_timestamps(values, LIDAR_TIMESTAMP_FORMATS, tz=tz)
+    return pd.DatetimeIndex(array_parsed).tz_localize(tz).tz_convert("UTC")
+
+
+####################################################
+######### Fixed width parsing (fast path) ##########
+####################################################
+# Both sources write every timestamp with the same width, so the fields can be
+# read directly from the bytes of all rows at once. Any row that does not fit
+# the layout sends the whole file to the format based parser above.
+#   "31-Aug-2015 05:00:00+00:00" and "2015/09/01 00:10" (or "2015-09-01 00:10")
+_CQ_LAYOUT = {"width": 26,
+              "fields": {"day": (0, 2), "year": (7, 11), "hour": (12, 14), "minute": (15, 17),
+                         "second": (18, 20), "offset_hour": (21, 23), "offset_minute": (24, 26)},
+              "month_name": 3,
+              "offset_sign": 20,
+              "separators": {2: b"-", 6: b"-", 11: b" ", 14: b":", 17: b":", 20: b"+-", 23: b":"}}
+_LIDAR_LAYOUT = {"width": 16,
+                 "fields": {"year": (0, 4), "month": (5, 7), "day": (8, 10), "hour": (11, 13), "minute": (14, 16)},
+                 "month_name": None,
+                 "offset_sign": None,
+                 "separators": {4: b"/-", 7: b"/-", 10: b" ", 13: b":"}}
+_MONTH_CODES = np.array([int.from_bytes(b, "big") for b in
+                         (b"Jan", b"Feb", b"Mar", b"Apr", b"May", b"Jun", b"Jul", b"Aug", b"Sep", b"Oct", b"Nov", b"Dec")])
+
+
+def _parse_fixed_width(values, dict_layout):
+    # Return a datetime64[ns] array (UTC for layouts with an offset), or None
+    # when the values do not all follow dict_layout
+    int_width = dict_layout["width"]
+    array_values = np.asarray(values, dtype=object)
+    if len(array_values) == 0:
+        return None
+    try:
+        # One extra byte to detect values longer than the layout
+        array_bytes = array_values.astype("S%d" % (int_width + 1))
+    except (UnicodeEncodeError, TypeError, ValueError):
+        return None
+    array_chars = array_bytes.view(np.uint8).reshape(-1, int_width + 1)
+    if array_chars[:, int_width].any() or not array_chars[:, int_width - 1].all():
+        return None
+    for int_position, bytes_allowed in dict_layout["separators"].items():
+        if not np.isin(array_chars[:, int_position], np.frombuffer(bytes_allowed, dtype=np.uint8)).all():
+            return None
+
+    dict_values = {}
+    for str_field, (int_start, int_stop) in dict_layout["fields"].items():
+        array_digits = array_chars[:, int_start:int_stop].astype(np.int64) - 48
+        if ((array_digits < 0) | (array_digits > 9)).any():
+            return None
+        dict_values[str_field] = array_digits @ (10 ** np.arange(int_stop - int_start - 1, -1, -1))
+
+    int_month = dict_layout["month_name"]
+    if int_month is not None:
+        array_codes = array_chars[:, int_month:int_month + 3].astype(np.int64) @ np.array([65536, 256, 1])
+        array_match = array_codes[:, None] == _MONTH_CODES[None, :]
+        if not array_match.any(axis=1).all():
+            return None
+        dict_values["month"] = array_match.argmax(axis=1) + 1
+
+    array_month = dict_values["month"]
+    if ((array_month < 1) | (array_month > 12)).any():
+        return None
+    array_days = ((dict_values["year"] - 1970) * 12 + array_month - 1).astype("datetime64[M]").astype("datetime64[D]")
+    if ((dict_values["day"] < 1) | (dict_values["day"] > _days_in_month(array_days))).any():
+        return None
+    array_second = dict_values.get("second", np.zeros(len(array_values), dtype=np.int64))
+    if (dict_values["hour"] > 23).any() or (dict_values["minute"] > 59).any() or (array_second > 59).any():
+        return None
+    array_seconds = dict_values["hour"] * 3600 + dict_values["minute"] * 60 + array_second
+    if dict_layout["offset_sign"] is not None:
+        array_sign = np.where(array_chars[:, dict_layout["offset_sign"]] == ord("-"), -1, 1)
+        array_seconds = array_seconds - array_sign * (dict_values["offset_hour"] * 3600 + dict_values["offset_minute"] * 60)
+    return (array_days + (dict_values["day"] - 1)).astype("datetime64[ns]") + array_seconds.astype("timedelta64[s]")
+
+
+def _days_in_month(array_first_days):
+    # Number of days in the month starting at each date of array_first_days
+    array_months = array_first_days.astype("datetime64[M]")
+    return ((array_months + 1).astype("datetime64[D]") - array_months.astype("datetime64[D]")).astype(np.int64)
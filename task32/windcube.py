@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming parser of the raw 10-minute exports of the WindCube V2 (".sta" files), so that new
+files are loaded as they arrive, without the pickles of task32.lidar.
+
+A .sta file starts with a header of "key=value" lines, the first one giving the number of lines
+that follow ("HeaderSize=41"), among which the altitudes measured ("Altitudes (m)=\t40\t60\t80...")
+and the timezone of the timestamps ("Timezone=UTC+01:00"). The header is followed by a tab separated
+table with one row per 10-minute timestamp:
+    Timestamp (end of interval)	Int Temp (°C)	...	Vbatt (V)	40m Wind Speed (m/s)	...
+the measurements of the whole lidar coming first, then the measurements at each height.
+
+The table is read by chunks and only the columns of the heights and measurements requested are
+parsed. Each chunk is typed as it is read into the layout of task32.lidar.clean_lidar: measurements
+in float32 (NaN when missing), "TimeStamp" as written in the file and "TimeObjectData" (tz-aware, UTC).
+"""
+
+import datetime
+import glob
+import os
+import re
+
+import pandas as pd
+
+from task32.cache import CACHE_DIRECTORY, cached_frame
+from task32.lidar import LIDAR_TIME_COLUMNS, split_height_column, type_lidar
+from task32.parallel import map_parallel
+from task32.timestamps import parse_lidar_timestamps
+
+# Extension of the raw 10-minute exports
+STA_EXTENSION = ".sta"
+# Separator of the columns of the table
+STA_DELIMITER = "\t"
+# Encodings tried, in order, to read the header ("°" is written in latin-1 by older firmwares)
+STA_ENCODINGS = ("utf-8", "latin-1")
+# Number of rows of the table parsed at once
+STA_CHUNKSIZE = 50000
+# Key of the header giving the number of lines after the first one
+_HEADER_SIZE_KEY = "HeaderSize"
+# Offset of the "Timezone" key (ex.: "UTC+01:00", "UTC-05:00", "UTC")
+_PATTERN_TIMEZONE = re.compile(r"^(?:UTC|GMT)\s*(?:([+-])(\d{1,2})(?::?(\d{2}))?)?$")
+
+
+def find_sta_files(list_locations):
+    """Return the .sta files of list_locations (files, directories or glob patterns), sorted and without duplicates."""
+    set_paths = set()
+    for str_location in [list_locations] if isinstance(list_locations, str) else list_locations:
+        if os.path.isdir(str_location):
+            set_paths.update(glob.glob(os.path.join(str_location, "*" + STA_EXTENSION)))
+        else:
+            set_paths.update(glob.glob(str_location))
+    return sorted(set_paths)
+
+
+def read_sta_header(str_path):
+    """
+    Read the header of a .sta file without reading its table.
+
+    Returns a dictionary with:
+        "metadata"     {key: value} of the header lines, as strings
+        "altitudes"    heights measured (int, m) from "Altitudes (m)", empty if the key is missing
+        "timezone"     timezone of the timestamps (datetime.timezone), UTC if the key is missing
+        "columns"      names of the columns of the table
+        "time_column"  name of the column of the timestamps (ex.: "Timestamp (end of interval)")
+        "skiprows"     number of lines before the line of the names of the columns
+        "encoding"     encoding of the file
+    A ValueError is raised if the file does not start with a header of the WindCube.
+    """
+    for str_encoding in STA_ENCODINGS:
+        try:
+            with open(str_path, encoding=str_encoding, newline="") as file:
+                return _parse_header(file, str_path, str_encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("%s is not encoded in any of %s" % (str_path, ", ".join(STA_ENCODINGS)))
+
+
+def _parse_header(file, str_path, str_encoding):
+    # Metadata lines up to the line of the names of the columns, which is the first line
+    # after the HeaderSize lines without "=" (some firmwares add an empty line before it)
+    str_first = file.readline().rstrip("\r\n")
+    str_key, _, str_size = str_first.partition("=")
+    if str_key.strip() != _HEADER_SIZE_KEY or not str_size.strip().isdigit():
+        raise ValueError("%s does not start with %s=, it is not a WindCube export" % (str_path, _HEADER_SIZE_KEY))
+    dict_metadata = {_HEADER_SIZE_KEY: str_size.strip()}
+    int_line = 1
+    for _ in range(int(str_size)):
+        str_line = file.readline()
+        if not str_line:
+            break
+        int_line += 1
+        str_key, str_sep, str_value = str_line.rstrip("\r\n").partition("=")
+        if str_sep:
+            dict_metadata[str_key.strip()] = str_value.strip()
+
+    for str_line in file:
+        str_line = str_line.rstrip("\r\n")
+        if str_line.strip() and "=" not in str_line:
+            list_columns = [str_column.strip() for str_column in str_line.split(STA_DELIMITER)]
+            break
+        int_line += 1
+    else:
+        raise ValueError("%s has no table after its header" % str_path)
+    list_time = [str_column for str_column in list_columns if str_column.lower().startswith("timestamp")]
+    if not list_time:
+        raise ValueError("%s has no timestamp column" % str_path)
+
+    str_altitudes = next((v for k, v in dict_metadata.items() if k.lower().startswith("altitudes")), "")
+    return {"metadata": dict_metadata,
+            "altitudes": [int(float(s)) for s in re.split(r"[\s;,]+", str_altitudes) if s],
+            "timezone": sta_timezone(dict_metadata.get("Timezone", "UTC")),
+            "columns": list_columns, "time_column": list_time[0], "skiprows": int_line, "encoding": str_encoding}
+
+
+def sta_timezone(str_timezone):
+    """Return the datetime.timezone of the "Timezone" value of a header (ex.: "UTC+01:00")."""
+    match_timezone = _PATTERN_TIMEZONE.match(str_timezone.strip())
+    if match_timezone is None:
+        raise ValueError("Unknown timezone %r, expected UTC+hh:mm" % str_timezone)
+    str_sign, str_hours, str_minutes = match_timezone.groups()
+    if str_sign is None:
+        return datetime.timezone.utc
+    int_minutes = int(str_hours) * 60 + int(str_minutes or 0)
+    return datetime.timezone(datetime.timedelta(minutes=-int_minutes if str_sign == "-" else int_minutes))
+
+
+def sta_columns(dict_header, heights=None, measurements=None, general=None):
+    """
+    Return the measurements of the table of a .sta file (see read_sta_header) to read, in the order of the file:
+    the measurements of general (all the measurements of the whole lidar by default, none if empty), and the
+    measurements at heights (int, m, all by default) named in measurements (all by default, ex.: "Wind Speed (m/s)").
+    """
+    set_heights = None if heights is None else {int(height) for height in heights}
+    list_columns = []
+    for str_column in dict_header["columns"]:
+        if not str_column or str_column == dict_header["time_column"]:
+            continue
+        tuple_height = split_height_column(str_column)
+        if tuple_height is None:
+            bool_kept = general is None or str_column in general
+        else:
+            bool_kept = ((set_heights is None or tuple_height[0] in set_heights)
+                         and (measurements is None or tuple_height[1] in measurements))
+        if bool_kept:
+            list_columns.append(str_column)
+    return list_columns
+
+
+def iter_sta(str_path, heights=None, measurements=None, general=None, tz=None, int_chunksize=STA_CHUNKSIZE):
+    """
+    Read the table of a .sta file by chunks of int_chunksize rows and yield each chunk in the layout of
+    task32.lidar.clean_lidar, with the columns of sta_columns (same arguments). The timestamps are in the
+    timezone of the header unless tz is given. Only the chunk being parsed is held in memory.
+    """
+    dict_header = read_sta_header(str_path)
+    list_columns = sta_columns(dict_header, heights, measurements, general)
+    str_time = dict_header["time_column"]
+    tz = dict_header["timezone"] if tz is None else tz
+    with pd.read_csv(str_path, sep=STA_DELIMITER, skiprows=dict_header["skiprows"], encoding=dict_header["encoding"],
+                     usecols=lambda str_column: str_column.strip() in list_columns or str_column.strip() == str_time,
+                     dtype={str_time: str}, chunksize=int_chunksize) as reader:
+        for df_chunk in reader:
+            df_chunk.columns = [str_column.strip() for str_column in df_chunk.columns]
+            series_time = df_chunk[str_time].str.strip()
+            df_typed = type_lidar(df_chunk[list_columns])
+            df_typed["TimeStamp"] = series_time.to_numpy(dtype=object)
+            df_typed["TimeObjectData"] = parse_lidar_timestamps(series_time, tz=tz)
+            yield df_typed
+
+
+def read_sta(str_path, heights=None, measurements=None, general=None, tz=None, int_chunksize=STA_CHUNKSIZE):
+    """Return the frame of a .sta file, in the layout of task32.lidar.clean_lidar (see iter_sta)."""
+    list_chunks = list(iter_sta(str_path, heights, measurements, general, tz, int_chunksize))
+    if not list_chunks:
+        dict_header = read_sta_header(str_path)
+        list_columns = sta_columns(dict_header, heights, measurements, general)
+        return type_lidar(pd.DataFrame({str_column: pd.Series(dtype=object) for str_column in list_columns}
+                                       | {"TimeStamp": pd.Series(dtype=object),
+                                          "TimeObjectData": pd.Series(dtype="datetime64[ns, UTC]")}))
+    return list_chunks[0] if len(list_chunks) == 1 else pd.concat(list_chunks, ignore_index=True)
+
+
+def load_cleaned_sta(str_path, heights=None, measurements=None, general=None, tz=None, cache_directory=CACHE_DIRECTORY):
+    """
+    Return the frame of a .sta file (see read_sta), read from the cache when the file and
+    the columns requested did not change (a change of the parsing needs a new task32.cache.CACHE_VERSION).
+    """
+    dict_params = {"frame": "sta", "heights": None if heights is None else sorted(int(h) for h in heights),
+                   "measurements": None if measurements is None else sorted(measurements),
+                   "general": None if general is None else sorted(general), "tz": None if tz is None else str(tz)}
+    df_cleaned, _ = cached_frame([str_path], dict_params,
+                                 lambda: (read_sta(str_path, heights, measurements, general, tz), {}),
+                                 None, cache_directory)
+    return df_cleaned
+
+
+def load_sta(list_locations, heights=None, measurements=None, general=None, tz=None, int_jobs=None,
+             bool_processes=False, cache_directory=CACHE_DIRECTORY):
+    """
+    Return one frame with the records of all the .sta files of list_locations (see find_sta_files),
+    read concurrently by int_jobs threads (or processes if bool_processes) with load_cleaned_sta.
+    The records are sorted by time, a timestamp exported in several files being kept once.
+    """
+    list_paths = find_sta_files(list_locations)
+    if not list_paths:
+        raise ValueError("No %s file in %s" % (STA_EXTENSION, list_locations))
+    list_frames = map_parallel(load_cleaned_sta, [(str_path, heights, measurements, general, tz, cache_directory)
+                                                  for str_path in list_paths], int_jobs, bool_processes)
+    df_lidar = pd.concat(list_frames, ignore_index=True) if len(list_frames) > 1 else list_frames[0]
+    df_lidar = df_lidar.sort_values("TimeObjectData", kind="stable", ignore_index=True)
+    return df_lidar[~df_lidar["TimeObjectData"].duplicated(keep="first")].reset_index(drop=True)
+
+
+def sta_height_frame(df_sta, height):
+    """
+    Return the columns of a frame of read_sta in the layout of the lidar file of a height
+    (see task32.lidar.lidar_file_path): the measurements of the whole lidar, those at the height, and the time.
+    """
+    list_columns = []
+    for str_column in df_sta.columns:
+        tuple_height = split_height_column(str_column)
+        if str_column not in LIDAR_TIME_COLUMNS and (tuple_height is None or tuple_height[0] == int(height)):
+            list_columns.append(str_column)
+    return df_sta[list_columns + LIDAR_TIME_COLUMNS]
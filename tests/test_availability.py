@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Tests of the day-block bootstrap of the lidar availability in task32.availability."""
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from task32.align import TIME_KEY
+from task32.availability import binned_availability, block_counts, bootstrap_availability
+
+DAY = 144
+EDGES = [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def keyed_frame(list_rows):
+    """Frame indexed by time keys from the rows (day, step of the day, mast value, lidar value)."""
+    array_rows = np.asarray(list_rows, dtype=np.float64)
+    return pd.DataFrame({"Moyenne": array_rows[:, 2], "Lidar": array_rows[:, 3]},
+                        index=pd.Index((array_rows[:, 0] * DAY + array_rows[:, 1]).astype(np.int64), name=TIME_KEY))
+
+
+# Days 10, 11 and 13 in the bins (0, 1], (1, 2], (2, 3] and (3, 4]; the row of the day 12 is out of the bins.
+# In (2, 3] every day has an availability of 50 %, (3, 4] only has rows on the day 13.
+DF_KEYED = keyed_frame([(10, 0, 0.5, 1), (10, 1, 1.5, np.nan), (10, 2, 2.5, 1), (10, 3, 2.5, np.nan),
+                        (11, 5, 0.5, 1), (11, 6, 0.5, np.nan), (11, 7, 2.5, 1), (11, 8, 2.5, np.nan),
+                        (11, 9, 2.5, 1), (11, 10, 2.5, np.nan),
+                        (12, 0, 5.0, 1),
+                        (13, 0, 1.5, 2), (13, 1, 3.5, np.nan)])
+
+
+def test_block_counts():
+    array_used, array_number, array_hits = block_counts(DF_KEYED, "Moyenne", EDGES, "Lidar")
+    np.testing.assert_array_equal(array_used, [0, 1, 2, 3])
+    np.testing.assert_array_equal(array_number, [[1, 1, 2, 0], [2, 0, 4, 0], [0, 1, 0, 1]])
+    np.testing.assert_array_equal(array_hits, [[1, 0, 1, 0], [1, 0, 2, 0], [0, 1, 0, 0]])
+    # The weeks are counted from the epoch: the days 7 to 13 are one block
+    _, array_number, array_hits = block_counts(DF_KEYED, "Moyenne", EDGES, "Lidar", "week")
+    np.testing.assert_array_equal(array_number, [[3, 2, 6, 1]])
+    np.testing.assert_array_equal(array_hits, [[2, 1, 3, 0]])
+
+
+def test_bootstrap_availability():
+    df_interval = bootstrap_availability(DF_KEYED, "Moyenne", EDGES, "Lidar", int_replicates=1000)
+    assert list(df_interval.columns) == ["Availability low (%)", "Availability high (%)", "Blocks"]
+    assert list(df_interval["Blocks"]) == [2, 2, 2, 1]
+    # (0, 1]: 100 % on the day 10 and 50 % on the day 11, each day alone being drawn in 7 / 27 of the replicates
+    assert df_interval.loc[0, ["Availability low (%)", "Availability high (%)"]].tolist() == [50.0, 100.0]
+    assert df_interval.loc[1, ["Availability low (%)", "Availability high (%)"]].tolist() == [0.0, 100.0]
+    # The same availability every day: no variability
+    assert df_interval.loc[2, ["Availability low (%)", "Availability high (%)"]].tolist() == [50.0, 50.0]
+    # A single day cannot measure the variability
+    assert df_interval.loc[3, ["Availability low (%)", "Availability high (%)"]].isna().all()
+
+
+def test_bootstrap_availability_in_parallel():
+    # 3 batches of replicates, the last one being partial
+    df_interval = bootstrap_availability(DF_KEYED, "Moyenne", EDGES, "Lidar", int_replicates=600, float_confidence=0.5,
+                                         int_seed=3, int_jobs=1)
+    pdt.assert_frame_equal(bootstrap_availability(DF_KEYED, "Moyenne", EDGES, "Lidar", int_replicates=600,
+                                                  float_confidence=0.5, int_seed=3, int_jobs=2), df_interval)
+
+
+def test_binned_availability_with_replicates():
+    df_table = binned_availability(DF_KEYED, "Moyenne", EDGES, "Lidar", int_replicates=1000)
+    np.testing.assert_allclose(df_table["Availability (%)"], [200 / 3, 50.0, 50.0, 0.0])
+    pdt.assert_frame_equal(df_table[["Availability low (%)", "Availability high (%)", "Blocks"]],
+                           bootstrap_availability(DF_KEYED, "Moyenne", EDGES, "Lidar", int_replicates=1000))
+    assert "Blocks" not in binned_availability(DF_KEYED, "Moyenne", EDGES, "Lidar")
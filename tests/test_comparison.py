@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Tests of task32.comparison: pairs of the lidar and mast wind speeds and their regression statistics."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from task32.align import TIME_KEY, time_keys
+from task32.availability import bin_edges
+from task32.comparison import COMPARISON_COLUMNS, comparison_statistics, wind_speed_pairs
+from task32.icing import ICE_COLUMN
+
+
+def pairs_frame(str_sensor, list_mast, list_lidar, list_ice):
+    """Pairs of an anemometer at 80 m, on the time keys 0, 1, ..."""
+    int_pairs = len(list_mast)
+    return pd.DataFrame({"Lidar": list_lidar, "Mast": list_mast, ICE_COLUMN: list_ice},
+                        index=pd.MultiIndex.from_arrays([np.arange(int_pairs), ["80"] * int_pairs,
+                                                         [str_sensor] * int_pairs], names=[TIME_KEY, "Height", "Sensor"]))
+
+
+# Lidar = 2 x mast for A, lidar = 0.5 x mast + 1 fitted on 3 points for B
+DF_PAIRS = pd.concat([pairs_frame("A", [1.0, 2.0, 3.0, 4.0], [2.0, 4.0, 6.0, 8.0], [0.0, 0.0, 1.0, np.nan]),
+                      pairs_frame("B", [1.0, 2.0, 3.0], [1.0, 3.0, 2.0], [0.0, 0.0, 0.0])])
+
+
+def test_comparison_statistics():
+    df_statistics = comparison_statistics(DF_PAIRS)
+    assert list(df_statistics.columns) == COMPARISON_COLUMNS
+    assert list(df_statistics.index) == [("80", "A", "All", "All"), ("80", "A", "Icing", "No ice"),
+                                         ("80", "A", "Icing", "Ice"), ("80", "B", "All", "All"),
+                                         ("80", "B", "Icing", "No ice")]
+
+    series_a = df_statistics.loc[("80", "A", "All", "All")]
+    assert series_a["Number"] == 4
+    assert series_a[["Slope", "Offset", "R2"]].tolist() == pytest.approx([2.0, 0.0, 1.0], abs=1e-12)
+    assert series_a[["Bias", "RMSE", "MAE"]].tolist() == pytest.approx([2.5, np.sqrt(7.5), 2.5])
+    assert series_a[["Lidar mean", "Mast mean"]].tolist() == pytest.approx([5.0, 2.5])
+
+    series_b = df_statistics.loc[("80", "B", "All", "All")]
+    assert series_b["Number"] == 3
+    assert series_b[["Slope", "Offset", "R2"]].tolist() == pytest.approx([0.5, 1.0, 0.25])
+    assert series_b[["Bias", "RMSE", "MAE"]].tolist() == pytest.approx([0.0, np.sqrt(2 / 3), 2 / 3], abs=1e-12)
+
+
+def test_comparison_statistics_icing_split():
+    df_statistics = comparison_statistics(DF_PAIRS)
+    # The pair with an unknown icing state is in no group
+    series_no_ice = df_statistics.loc[("80", "A", "Icing", "No ice")]
+    assert (series_no_ice["Number"], series_no_ice["Slope"], series_no_ice["Bias"]) == (2, pytest.approx(2.0), 1.5)
+    series_ice = df_statistics.loc[("80", "A", "Icing", "Ice")]
+    assert (series_ice["Number"], series_ice["Bias"], series_ice["RMSE"]) == (1, 3.0, 3.0)
+    assert np.isnan(series_ice["Slope"]) and np.isnan(series_ice["Offset"]) and np.isnan(series_ice["R2"])
+
+
+def test_comparison_statistics_bins_of_the_conditions():
+    # 0 is in (-5, 0], 10 is out of the bins, the key 3 has no conditions
+    df_conditions = pd.DataFrame({"Temperature": [-1.0, 0.0, 3.0]}, index=pd.Index([0, 1, 2], name=TIME_KEY))
+    df_statistics = comparison_statistics(DF_PAIRS.drop(columns=ICE_COLUMN), df_conditions,
+                                          {"Temperature": bin_edges(-5, 5, 5), "Humidity": bin_edges(0, 100, 10)})
+    assert df_statistics.xs("Temperature", level="Split")["Number"].to_dict() == \
+        {("80", "A", "(-5, 0]"): 2, ("80", "A", "(0, 5]"): 1, ("80", "B", "(-5, 0]"): 2, ("80", "B", "(0, 5]"): 1}
+    assert df_statistics.loc[("80", "B", "Temperature", "(-5, 0]"), "Bias"] == pytest.approx(0.5)
+    assert set(df_statistics.index.get_level_values("Split")) == {"All", "Temperature"}
+
+
+def test_wind_speed_pairs():
+    index_time = pd.date_range("2015-11-01", periods=4, freq="10min", tz="UTC")
+    int_first = time_keys(index_time)[0]
+    dict_lidar = {"80": pd.DataFrame({"TimeObjectData": index_time, "80m Wind Speed (m/s)": [5.0, np.nan, 7.0, 8.0]})}
+    dict_mast = {"Anemo80": (80, pd.DataFrame({"Timestamp": index_time[:3], "Moyenne": [4.0, 5.0, 6.0],
+                                               "INFO01": [0, 1, 1]})),
+                 "Anemo80b": (80, pd.DataFrame({"Timestamp": index_time[2:], "Moyenne": [1.0, 2.0]})),
+                 "Anemo60": (60, pd.DataFrame({"Timestamp": index_time, "Moyenne": [1.0, 2.0, 3.0, 4.0]}))}
+    df_pairs = wind_speed_pairs(dict_lidar, dict_mast)
+    assert list(df_pairs.index) == [(int_first, "80", "Anemo80"), (int_first + 2, "80", "Anemo80"),
+                                    (int_first + 2, "80", "Anemo80b"), (int_first + 3, "80", "Anemo80b")]
+    np.testing.assert_array_equal(df_pairs["Lidar"], [5.0, 7.0, 7.0, 8.0])
+    np.testing.assert_array_equal(df_pairs["Mast"], [4.0, 6.0, 1.0, 2.0])
+    np.testing.assert_array_equal(df_pairs[ICE_COLUMN], [0.0, 1.0, np.nan, np.nan])
+    with pytest.raises(ValueError):
+        wind_speed_pairs(dict_lidar, {"Anemo60": dict_mast["Anemo60"]})
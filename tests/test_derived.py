@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Tests of task32.derived: Magnus, hypsometric and psychrometric channels of the conditions."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from task32.derived import (DERIVED_CHANNELS, PSYCHROMETER_COEFFICIENTS, add_derived_channels, air_density, dew_point,
+                            derived_channels, frost_point, pressure_at_height, psychrometric_temperature,
+                            saturation_vapour_pressure)
+
+
+def test_saturation_vapour_pressure():
+    # At 0 °C the Magnus formula gives its first coefficient
+    assert saturation_vapour_pressure(0.0) == pytest.approx(6.1094)
+    assert saturation_vapour_pressure(0.0, "ice") == pytest.approx(6.1121)
+    assert saturation_vapour_pressure(20.0) == pytest.approx(6.1094 * np.exp(17.625 * 20 / 263.04))
+
+
+def test_dew_and_frost_points():
+    np.testing.assert_allclose(dew_point([-10.0, 0.0, 25.0], [100.0, 100.0, 100.0]), [-10.0, 0.0, 25.0], atol=1e-12)
+    assert dew_point(20.0, 50.0) == pytest.approx(9.2611066, abs=1e-6)
+    # Saturated over water at -10 °C, the air is supersaturated over ice
+    assert frost_point(-10.0, 100.0) == pytest.approx(-8.8779007, abs=1e-6)
+    # No dew point for a dry air
+    assert np.isnan(dew_point(10.0, 0.0))
+
+
+def test_pressure_at_height():
+    assert pressure_at_height(1000.0, 0.0, 70.0) == pytest.approx(1000 * np.exp(-9.80665 * 70 / (287.05 * 273.15)))
+    assert pressure_at_height(1000.0, 0.0, 70.0) == pytest.approx(991.2831373, abs=1e-6)
+    assert pressure_at_height(pressure_at_height(1000.0, 0.0, 70.0), 0.0, -70.0) == pytest.approx(1000.0)
+    # The virtual temperature of the moist layer is 1.89 K above T
+    assert pressure_at_height(1000.0, 10.0, 100.0, 10.0) == pytest.approx(988.0520249, abs=1e-6)
+
+
+def test_psychrometric_temperature():
+    assert psychrometric_temperature(20.0, 50.0, 1013.25) == pytest.approx(13.8117439, abs=1e-6)
+    assert psychrometric_temperature(-5.0, 80.0, 900.0, "ice") == pytest.approx(-5.7524143, abs=1e-6)
+    # Saturated air: the wet bulb is the temperature
+    np.testing.assert_allclose(psychrometric_temperature([5.0, 20.0], [100.0, 100.0], [1000.0, 1000.0]), [5.0, 20.0],
+                               atol=1e-8)
+    # The psychrometric equation holds
+    array_temperature, array_humidity, array_pressure = np.array([-3.0, 8.0, 30.0]), np.array([60.0, 90.0, 20.0]), 950.0
+    array_wet_bulb = psychrometric_temperature(array_temperature, array_humidity, array_pressure)
+    np.testing.assert_allclose(saturation_vapour_pressure(array_wet_bulb)
+                               - PSYCHROMETER_COEFFICIENTS["water"] * array_pressure * (array_temperature - array_wet_bulb),
+                               array_humidity / 100 * saturation_vapour_pressure(array_temperature), atol=1e-8)
+    assert np.isnan(psychrometric_temperature([np.nan], [50.0], [1000.0])).all()
+    assert np.isnan(psychrometric_temperature([10.0], [50.0], [np.nan])).all()
+
+
+def test_air_density():
+    # Dry standard atmosphere at sea level
+    assert air_density(1013.25, 15.0, 0.0) == pytest.approx(101325 / (287.05 * 288.15))
+    assert air_density(1013.25, 15.0, 0.0) == pytest.approx(1.2250123, abs=1e-6)
+    # The water vapour is lighter than the dry air
+    assert air_density(1013.25, 15.0, 100.0) < air_density(1013.25, 15.0, 0.0)
+
+
+def test_derived_channels():
+    df_conditions = pd.DataFrame({"Temperature": [20.0, -5.0, np.nan, 10.0], "Humidity": [50.0, 80.0, 50.0, 0.0],
+                                  "Pressure": [1013.25, 900.0, 1000.0, 1000.0]}, index=[10, 11, 12, 13])
+    df_derived = derived_channels(df_conditions)
+    assert list(df_derived.columns) == list(DERIVED_CHANNELS)
+    assert list(df_derived.index) == [10, 11, 12, 13]
+    np.testing.assert_array_equal(df_derived["Pressure at height"], df_conditions["Pressure"])
+    assert df_derived.loc[10, "Dew point"] == pytest.approx(9.2611066, abs=1e-6)
+    assert df_derived.loc[10, "Wet bulb"] == pytest.approx(13.8117439, abs=1e-6)
+    assert df_derived.loc[10, "Ice bulb"] == df_derived.loc[10, "Wet bulb"]
+    # Below 0 °C the ice bulb is over ice
+    assert df_derived.loc[11, "Ice bulb"] == pytest.approx(-5.7524143, abs=1e-6)
+    # Without heights the pressure is used as it is
+    assert df_derived.loc[12, "Pressure at height"] == 1000.0 and df_derived.loc[12].iloc[1:].isna().all()
+    assert np.isnan(df_derived.loc[13, "Dew point"]) and df_derived.loc[13, "Vapour pressure"] == 0.0
+
+    # The barometer is 100 m under the thermometer
+    df_derived = derived_channels(df_conditions, {"Pressure": 0, "Temperature": 100})
+    assert df_derived.loc[13, "Pressure at height"] == pytest.approx(1000 * np.exp(-9.80665 * 100 / (287.05 * 283.15)))
+    assert df_derived.loc[13, "Air density"] == pytest.approx(100 * df_derived.loc[13, "Pressure at height"]
+                                                              / (287.05 * 283.15))
+
+
+def test_derived_channels_without_a_measurement():
+    df_derived = add_derived_channels(pd.DataFrame({"Temperature": [1.0, 2.0], "Dew point": [0.0, 0.0]}))
+    assert list(df_derived.columns) == ["Temperature"] + list(DERIVED_CHANNELS)
+    assert df_derived[list(DERIVED_CHANNELS)].isna().all().all()
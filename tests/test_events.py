@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Tests of task32.events: run lengths, events of a mask, conditions during the events and their overlaps."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from task32.align import TIME_KEY, key_timestamps
+from task32.events import event_conditions, flag_events, icing_events, interval_index, overlap_statistics, run_lengths
+from task32.icing import ICE_COLUMN
+
+ARRAY_KEYS = np.arange(100, 110)
+ARRAY_MASK = np.array([1, 1, 0, 1, 0, 0, 1, 1, 1, 0], dtype=bool)
+DF_CONDITIONS = pd.DataFrame({"Temperature": [1.0, np.nan, 3.0, 5.0, 7.0], ICE_COLUMN: [0.0, 1.0, 1.0, 0.0, 1.0]},
+                             index=pd.Index(np.arange(100, 105), name=TIME_KEY))
+
+
+def events_frame(list_bounds, **dict_columns):
+    """Events (start key, stop key) with the columns of dict_columns."""
+    array_bounds = np.asarray(list_bounds, dtype=np.int64).reshape(-1, 2)
+    return pd.DataFrame({**dict_columns, "Start key": array_bounds[:, 0], "Stop key": array_bounds[:, 1],
+                         "Steps": array_bounds[:, 1] - array_bounds[:, 0]})
+
+
+def test_run_lengths():
+    for array_result, list_expected in zip(run_lengths(np.array([0, 1, 1, 0, 1], dtype=bool)), [[0, 0], [1, 4], [3, 5]]):
+        np.testing.assert_array_equal(array_result, list_expected)
+    # The runs do not cross the rows
+    for array_result, list_expected in zip(run_lengths(np.array([[0, 1], [1, 1]], dtype=bool)), [[0, 1], [1, 0], [2, 2]]):
+        np.testing.assert_array_equal(array_result, list_expected)
+
+
+def test_flag_events():
+    df_events = flag_events(ARRAY_KEYS, ARRAY_MASK)
+    assert list(df_events.columns) == ["Start", "End", "Steps", "Duration", "Start key", "Stop key"]
+    assert list(df_events["Steps"]) == [2, 1, 3]
+    assert list(df_events["Start key"]) == [100, 103, 106]
+    assert list(df_events["Stop key"]) == [102, 104, 109]
+    assert list(df_events["Duration"]) == [pd.Timedelta("20min"), pd.Timedelta("10min"), pd.Timedelta("30min")]
+    assert list(df_events["Start"]) == list(key_timestamps(np.array([100, 103, 106])))
+
+
+def test_flag_events_gap_and_length():
+    # The gap of 1 step is merged in the first event, the gap of 2 steps is kept
+    df_events = flag_events(ARRAY_KEYS, ARRAY_MASK, int_max_gap=1)
+    assert list(zip(df_events["Start key"], df_events["Stop key"], df_events["Steps"])) == [(100, 104, 4), (106, 109, 3)]
+    df_events = flag_events(ARRAY_KEYS, ARRAY_MASK, int_max_gap=1, int_min_steps=4)
+    assert list(zip(df_events["Start key"], df_events["Stop key"])) == [(100, 104)]
+
+
+def test_flag_events_rows():
+    df_events = flag_events(np.arange(3), np.array([[1, 1, 0], [0, 1, 1]], dtype=bool), {"Height": [80, 100]},
+                            int_max_gap=2)
+    assert list(zip(df_events["Height"], df_events["Start key"], df_events["Stop key"])) == [(80, 0, 2), (100, 1, 3)]
+    with pytest.raises(ValueError):
+        flag_events(np.array([0, 1, 3]), np.ones(3, dtype=bool))
+
+
+def test_event_conditions():
+    # Second event partly after the grid, third event before the grid
+    df_events = event_conditions(events_frame([(100, 103), (104, 106), (98, 100)]), DF_CONDITIONS)
+    assert ICE_COLUMN + " mean" not in df_events
+    np.testing.assert_array_equal(df_events["Temperature min"], [1.0, 7.0, np.nan])
+    np.testing.assert_array_equal(df_events["Temperature max"], [3.0, 7.0, np.nan])
+    np.testing.assert_array_equal(df_events["Temperature mean"], [2.0, 7.0, np.nan])
+
+
+def test_icing_events():
+    df_events = icing_events(DF_CONDITIONS)
+    assert list(zip(df_events["Start key"], df_events["Stop key"])) == [(101, 103), (104, 105)]
+    np.testing.assert_array_equal(df_events["Temperature mean"], [3.0, 7.0])
+
+
+def test_interval_index():
+    df_events = events_frame([(0, 2), (5, 6), (1, 4)])
+    dict_index = interval_index(df_events)
+    np.testing.assert_array_equal(dict_index["starts"], [0, 5])
+    np.testing.assert_array_equal(dict_index["stops"], [4, 6])
+    np.testing.assert_array_equal(dict_index["covered"], [0, 4])
+    # Padded by 1 step, the intervals join
+    dict_index = interval_index(df_events, "10min")
+    np.testing.assert_array_equal(dict_index["starts"], [-1])
+    np.testing.assert_array_equal(dict_index["stops"], [7])
+
+
+def test_overlap_statistics():
+    df_outages = events_frame([(10, 12), (20, 21), (30, 33)], Height=[80, 80, 100])
+    df_icing = events_frame([(11, 13)])
+    df_table = overlap_statistics(df_outages, df_icing, by="Height")
+    assert list(df_table.columns) == ["Events", "Overlapping", "Events (%)", "Steps", "Steps overlapping", "Steps (%)"]
+    assert df_table.loc[80].tolist() == pytest.approx([2, 1, 50.0, 3, 1, 100 / 3])
+    assert df_table.loc[100].tolist() == pytest.approx([1, 0, 0.0, 3, 0, 0.0])
+    # Padded by 2 h (12 steps), the icing event covers the keys -1 to 24
+    df_table = overlap_statistics(df_outages, df_icing, "2h", by="Height")
+    assert df_table.loc[80].tolist() == pytest.approx([2, 2, 100.0, 3, 3, 100.0])
+    assert df_table.loc[100].tolist() == pytest.approx([1, 0, 0.0, 3, 0, 0.0])
+    df_table = overlap_statistics(df_outages, df_icing)
+    assert df_table.loc["All"].tolist() == pytest.approx([3, 1, 100 / 3, 6, 1, 100 / 6])
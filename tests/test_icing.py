@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Tests of task32.icing: rules, persistence, scores against the ice detected and alignment of the captors."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from task32.align import time_keys
+from task32.icing import ICE_COLUMN, captor_conditions, ice_steps, persistent, rule_mask, score_mask, score_rules
+
+
+def captor_frame(str_start, list_values, list_ice):
+    """Cleaned CQ frame of a captor: one record every 10 minutes from str_start (UTC)."""
+    return pd.DataFrame({"Timestamp": pd.date_range(str_start, periods=len(list_values), freq="10min", tz="UTC"),
+                         "Moyenne": list_values, "INFO01": list_ice})
+
+
+def test_persistent():
+    array_mask = np.array([1, 1, 0, 1, 1, 1], dtype=bool)
+    np.testing.assert_array_equal(persistent(array_mask, 1), array_mask)
+    np.testing.assert_array_equal(persistent(array_mask, 2), [False, True, False, False, True, True])
+    np.testing.assert_array_equal(persistent(array_mask, 3), [False, False, False, False, False, True])
+
+
+def test_rule_mask():
+    dict_conditions = {"Humidity": [95.0, 85.0, np.nan, 99.0, 91.0], "Temperature": [0.0, 0.0, 0.0, 10.0, 1.0],
+                       ICE_COLUMN: np.zeros(5)}
+    dict_rule = {"name": "rule", "conditions": [("Humidity", ">", 90.0), ("Temperature", "<", 5.0)]}
+    # The missing humidity is false
+    np.testing.assert_array_equal(rule_mask(dict_conditions, dict_rule), [True, False, False, False, True])
+    np.testing.assert_array_equal(rule_mask(dict_conditions, {**dict_rule, "persistence": 2}),
+                                  [False, False, False, False, False])
+    with pytest.raises(ValueError):
+        rule_mask(dict_conditions, {"name": "rule", "conditions": [("Humidity", "=>", 90.0)]})
+
+
+def test_score_mask():
+    array_mask = np.array([1, 1, 0, 0, 1, 0, 0, 0], dtype=bool)
+    array_ice = np.array([1, 0, 1, np.nan, 1, 0, 1, 0])
+    dict_score = score_mask(array_mask, array_ice, int_max_lag=2)
+    # Steps with the ice known: 7, flagged 0, 1 and 4, iced 0, 2, 4 and 6
+    assert (dict_score["flagged"], dict_score["ice"], dict_score["hits"]) == (3, 4, 2)
+    assert (dict_score["misses"], dict_score["false_alarms"]) == (2, 1)
+    assert dict_score["hit_rate"] == pytest.approx(2 / 4)
+    assert dict_score["false_alarm_ratio"] == pytest.approx(1 / 3)
+    assert dict_score["csi"] == pytest.approx(2 / (2 + 2 + 1))
+    # The shift of 20 minutes also gives 2 hits, the smallest shift is kept
+    assert (dict_score["lag_min"], dict_score["hits_at_lag"]) == (0.0, 2)
+
+
+def test_score_mask_lag():
+    # The conditions are met 20 minutes before the ice is detected
+    dict_score = score_mask(np.array([1, 1, 0, 0, 0, 0], dtype=bool), np.array([0, 0, 1, 1, 0, 0.0]), int_max_lag=3)
+    assert (dict_score["hits"], dict_score["csi"]) == (0, 0.0)
+    assert (dict_score["lag_min"], dict_score["hits_at_lag"]) == (20.0, 2)
+
+
+def test_score_mask_without_ice():
+    dict_score = score_mask(np.zeros(3, dtype=bool), np.full(3, np.nan))
+    assert (dict_score["flagged"], dict_score["ice"]) == (0, 0)
+    assert np.isnan(dict_score["hit_rate"]) and np.isnan(dict_score["false_alarm_ratio"]) and np.isnan(dict_score["csi"])
+
+
+def test_score_rules():
+    df_conditions = pd.DataFrame({"Temperature": [0.0, 1.0, 2.0, 3.0], ICE_COLUMN: [0.0, 1.0, 1.0, 0.0]})
+    list_rules = [{"name": "T<2.5", "conditions": [("Temperature", "<", 2.5)]},
+                  {"name": "T>0.5", "conditions": [("Temperature", ">", 0.5)]}]
+    df_scores = score_rules(df_conditions, list_rules, int_max_lag=1)
+    assert list(df_scores.index) == ["T<2.5", "T>0.5"]
+    assert list(df_scores["hits"]) == [2, 2]
+    assert list(df_scores["false_alarms"]) == [1, 1]
+    assert df_scores["csi"].tolist() == pytest.approx([2 / 3, 2 / 3])
+
+
+def test_captor_conditions_reads_the_ice_of_every_captor():
+    # The ice is only flagged by an anemometer, which is not a measurement of the conditions
+    dict_captors = {"TempUnHt80m0d": captor_frame("2015-11-01 00:00", [1.0, 2.0, 3.0], [0, 0, 0]),
+                    "RHHt80m0d": captor_frame("2015-11-01 00:00", [95.0, 96.0, 97.0], [0, 0, 0]).iloc[[0, 2]],
+                    "AnemoHt80m": captor_frame("2015-11-01 00:10", [5.0, 6.0, 7.0], [1, 0, 0])}
+    df_conditions = captor_conditions(dict_captors)
+    int_first = time_keys(pd.DatetimeIndex(["2015-11-01 00:00"], tz="UTC"))[0]
+    np.testing.assert_array_equal(df_conditions.index, int_first + np.arange(4))
+    np.testing.assert_array_equal(df_conditions["Temperature"], [1.0, 2.0, 3.0, np.nan])
+    np.testing.assert_array_equal(df_conditions["Humidity"], [95.0, np.nan, 97.0, np.nan])
+    np.testing.assert_array_equal(df_conditions[ICE_COLUMN], [0.0, 1.0, 0.0, 0.0])
+    assert "Pressure" not in df_conditions
+    assert ice_steps(dict_captors) == 1
+
+
+def test_captor_conditions_skips_the_empty_captors():
+    dict_captors = {"TempUnHt80m0d": captor_frame("2015-11-01 00:00", [1.0, 2.0], [0, 1]),
+                    "TempUnHt80m0d_2": captor_frame("2015-11-01 00:00", [], [])}
+    df_conditions = captor_conditions(dict_captors)
+    np.testing.assert_array_equal(df_conditions["Temperature"], [1.0, 2.0])
+    np.testing.assert_array_equal(df_conditions[ICE_COLUMN], [0.0, 1.0])
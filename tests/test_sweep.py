@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Tests of task32.sweep: grid of the icing rules and ranking of their scores."""
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from task32.icing import ICE_COLUMN
+from task32.sweep import rule_grid, sweep_icing_rules
+
+# Steps 1 and 2 are iced: only 0.5 < Temperature < 2.5 flags them without a false alarm
+DF_CONDITIONS = pd.DataFrame({"Temperature": [0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+                              ICE_COLUMN: [0.0, 1.0, 1.0, 0.0, 0.0, 0.0]})
+DICT_GRID = {("Temperature", ">"): [-1.0, 0.5, 2.5], ("Temperature", "<"): [2.5, 10.0]}
+
+
+def test_rule_grid():
+    list_rules = rule_grid({("Temperature", ">"): [-2, 0, 2], ("Temperature", "<"): [1, 3]}, [1, 2])
+    # 2 < Temperature < 1 is skipped
+    assert len(list_rules) == 10
+    assert [dict_rule["name"] for dict_rule in list_rules[:3]] == \
+        ["Temperature>-2, Temperature<1 (x1)", "Temperature>-2, Temperature<1 (x2)",
+         "Temperature>-2, Temperature<3 (x1)"]
+    assert list_rules[-1]["name"] == "Temperature>2, Temperature<3 (x2)"
+    assert list_rules[-1]["conditions"] == [("Temperature", ">", 2.0), ("Temperature", "<", 3.0)]
+    assert list_rules[-1]["persistence"] == 2
+    assert list_rules[-1]["parameters"] == {"Temperature >": 2.0, "Temperature <": 3.0, "persistence": 2}
+
+
+def test_sweep_icing_rules_ranking():
+    df_sweep = sweep_icing_rules(DF_CONDITIONS, rule_grid(DICT_GRID), int_jobs=1, int_max_lag=1)
+    assert list(df_sweep.index) == ["Temperature>0.5, Temperature<2.5 (x1)", "Temperature>-1, Temperature<2.5 (x1)",
+                                    "Temperature>0.5, Temperature<10 (x1)", "Temperature>-1, Temperature<10 (x1)",
+                                    "Temperature>2.5, Temperature<10 (x1)"]
+    assert list(df_sweep["Rank"]) == [1, 2, 3, 4, 5]
+    assert df_sweep["csi"].tolist() == pytest.approx([1, 2 / 3, 2 / 5, 2 / 6, 0])
+    assert df_sweep["false_alarm_ratio"].tolist() == pytest.approx([0, 1 / 3, 3 / 5, 4 / 6, 1])
+    assert list(df_sweep["hits"]) == [2, 2, 2, 2, 0]
+    assert list(df_sweep["Temperature >"]) == [0.5, -1.0, 0.5, -1.0, 2.5]
+
+
+def test_sweep_icing_rules_ties_rank_the_fewest_false_alarms_first():
+    df_sweep = sweep_icing_rules(DF_CONDITIONS, rule_grid(DICT_GRID), int_jobs=1, int_max_lag=1,
+                                 str_rank="hit_rate")
+    # Every rule but the last one finds the 2 iced steps
+    assert df_sweep["false_alarm_ratio"].tolist()[:4] == pytest.approx([0, 1 / 3, 3 / 5, 4 / 6])
+
+
+def test_sweep_icing_rules_in_parallel():
+    list_rules = rule_grid(DICT_GRID, [1, 2])
+    pdt.assert_frame_equal(sweep_icing_rules(DF_CONDITIONS, list_rules, int_jobs=2, int_max_lag=1),
+                           sweep_icing_rules(DF_CONDITIONS, list_rules, int_jobs=1, int_max_lag=1))
+
+
+def test_sweep_icing_rules_without_ice():
+    df_conditions = DF_CONDITIONS.assign(**{ICE_COLUMN: [0.0, 0.0, np.nan, 0.0, 0.0, 0.0]})
+    with pytest.raises(ValueError):
+        sweep_icing_rules(df_conditions, rule_grid(DICT_GRID), int_jobs=1)